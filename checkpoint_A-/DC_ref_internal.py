@@ -14,39 +14,28 @@ This module is measurement-only — no LCD or UI logic.
 Call measure_dc_ref() and display the result in Driver.py.
 """
 
-import time
 import pigpio
 
-from ohmmeter import MCP4131_MAX_STEPS, _SETTLE_S
 from voltmeter import STEP_TO_VOLT, step_to_voltage, step_to_tolerance
+from sar_engine import AVG_CONFIDENCE, get_engine
 
 COMPARATOR_PIN = 18   # LM339 pin 12 -> Pi GPIO 18
 
 
 def _write_dac(pi, spi_handle, step):
     """Scale 5-bit step (0..31) to MCP4131 7-bit register (0..127)."""
-    step = max(0, min(step, MCP4131_MAX_STEPS))
-    dac_code = round(step * 127 / MCP4131_MAX_STEPS)
-    pi.spi_write(spi_handle, [0x00, dac_code])
+    get_engine(pi, spi_handle).write_step(step)
 
 
 def _sar_measure(pi, spi_handle):
     """5-bit SAR binary search. Returns best step (0..31)."""
-    step = 0
-    for bit_pos in range(4, -1, -1):
-        trial = min(step | (1 << bit_pos), MCP4131_MAX_STEPS)
-        _write_dac(pi, spi_handle, trial)
-        time.sleep(_SETTLE_S)
-        if pi.read(COMPARATOR_PIN) == 0:
-            step = trial
-    _write_dac(pi, spi_handle, step)
-    return step
+    return get_engine(pi, spi_handle).convert(COMPARATOR_PIN)
 
 
-def _averaged_measure(pi, spi_handle, n=11):
-    """Return median step from n SAR conversions."""
-    readings = sorted(_sar_measure(pi, spi_handle) for _ in range(n))
-    return readings[n // 2]
+def _averaged_measure(pi, spi_handle, n=11, confidence=AVG_CONFIDENCE,
+                      with_count=False):
+    """Return median step from up to n SAR conversions (early exit)."""
+    return get_engine(pi, spi_handle).averaged(COMPARATOR_PIN, n, confidence, with_count)
 
 
 def measure_dc_ref(pi, spi_handle, n=11):
@@ -40,11 +40,13 @@ from voltmeter import (
 
 from ohmmeter import (
     COMPARATOR2_PIN,
-    averaged_measure as ohm_averaged_measure,
     step_to_resistance,
-    tolerance as ohm_tolerance,
+    fractional_tolerance as ohm_fractional_tolerance,
 )
 
+from acquisition import AcquisitionService
+from sar_engine import TRACK_INTERVAL_S, TrackingADC, close_engines
+
 from Sinewave import (
     SineWaveGenerator,
     MIN_FREQ as SINE_MIN_FREQ,
@@ -52,8 +54,15 @@ from Sinewave import (
     FREQ_STEP as SINE_FREQ_STEP,
     MAX_AMP as SINE_MAX_AMP,
     AMP_STEP as SINE_AMP_STEP,
+    BURST_CYCLES,
+    BURST_PERIOD_S,
+    CHIRP_STEPS,
+    DUAL_RATIOS,
+    SWEEP_DWELL_S,
 )
 from Sinewave_measurement import FrequencyMeter
+from arbitrary_wave import SHAPES as ARB_SHAPES, load_csv as load_arb_csv
+from waveform_capture import WaveformCapture
 import random
 
 
@@ -102,9 +111,16 @@ state = {
 
     # Function generator
     'fg_type': 'square',
+    'fg_shape': None,          # arbitrary waveform name ('arb' type)
+    'fg_samples': None,        # its sample array
     'fg_freq': 1000,
     'fg_amp': 0.0,
     'fg_output_on': False,
+    'fg_sweep_dwell': SWEEP_DWELL_S,
+    'fg_burst_cycles': BURST_CYCLES,
+    'fg_burst_period_ms': int(BURST_PERIOD_S * 1000),
+    'fg_dual_ratio': DUAL_RATIOS[3],   # square / sine frequency (1)
+    'fg_dual_phase': 0.0,              # degrees of the sine period
 
     # DC Reference
     'dc_voltage': 0.0,
@@ -147,7 +163,8 @@ def run_function_generator_menu():
     while True:
         choice = pick_menu(
             "Function Generator",
-            ["Type", "Frequency", "Amplitude", "Output", "Back", "Main"],
+            ["Type", "Frequency", "Amplitude", "Output", "Sweep", "Burst", "Dual",
+             "Back", "Main"],
         )
 
         if choice == "Type":
@@ -170,6 +187,21 @@ def run_function_generator_menu():
             if result == "MAIN":
                 return "MAIN"
 
+        elif choice == "Sweep":
+            result = run_fg_sweep()
+            if result == "MAIN":
+                return "MAIN"
+
+        elif choice == "Burst":
+            result = run_fg_burst()
+            if result == "MAIN":
+                return "MAIN"
+
+        elif choice == "Dual":
+            result = run_fg_dual()
+            if result == "MAIN":
+                return "MAIN"
+
         elif choice == "Back":
             return "BACK"
 
@@ -178,18 +210,43 @@ def run_function_generator_menu():
 
 
 def run_fg_type():
-    choice = pick_menu("Type", ["Sine", "Square", "Back", "Main"])
+    choice = pick_menu("Type", ["Sine", "Square", "Arbitrary", "Back", "Main"])
     if choice == "Sine":
         state['fg_type'] = 'sine'
         return "BACK"
     elif choice == "Square":
         state['fg_type'] = 'square'
         return "BACK"
+    elif choice == "Arbitrary":
+        return run_fg_arbitrary()
     elif choice == "Main":
         return "MAIN"
     return "BACK"
 
 
+def run_fg_arbitrary():
+    """Pick an arbitrary waveform; it is output through the sine engine."""
+    choice = pick_menu("Arbitrary", list(ARB_SHAPES) + ["CSV File", "Back", "Main"])
+    if choice in ARB_SHAPES:
+        samples = ARB_SHAPES[choice]()
+    elif choice == "CSV File":
+        try:
+            samples = load_arb_csv()
+        except (OSError, ValueError) as e:
+            print(f"[Arb] {e}")
+            wait_for_back(lambda: ("CSV load failed", "arb_wave.csv", "", "Btn: back"))
+            return "BACK"
+    elif choice == "Main":
+        return "MAIN"
+    else:
+        return "BACK"
+
+    state['fg_type'] = 'arb'
+    state['fg_shape'] = choice
+    state['fg_samples'] = samples
+    return "BACK"
+
+
 def run_fg_frequency():
     choice = pick_menu("Frequency", ["Input Frequency", "Back", "Main"])
     if choice == "Input Frequency":
@@ -232,19 +289,37 @@ def run_fg_output():
         choice = pick_menu("Output", ["On", "Off", "Back", "Main"])
 
         if choice == "On":
-            gen = sine_gen if state['fg_type'] == 'sine' else sq_gen
+            gen = sq_gen if state['fg_type'] == 'square' else sine_gen
+            if gen is sine_gen:
+                sine_gen.set_waveform(state['fg_samples'] if state['fg_type'] == 'arb' else None)
             gen.set_frequency(state['fg_freq'])
             gen.set_amplitude(state['fg_amp'])
-            gen.start()
+            try:
+                gen.start()
+            except ValueError as e:
+                # No wave for this frequency: show that, not the plan
+                print(f"[Output] {e}")
+                wait_for_back(lambda: ("Output failed", str(e)[:20], "", "Btn: back"))
+                continue
             state['fg_output_on'] = True
 
-            type_label = "Sine" if state['fg_type'] == 'sine' else "Square"
-            wait_for_back(lambda: (
-                f"Output: ON ({type_label})",
-                f"Freq: {state['fg_freq']} Hz",
-                f"Amp:  {state['fg_amp']:.4f} V",
-                "Btn: back",
-            ))
+            if gen is sine_gen:
+                # Show the frequency the sample plan actually produces
+                plan = sine_gen.plan
+                label = "Sine" if state['fg_type'] == 'sine' else state['fg_shape']
+                wait_for_back(lambda: (
+                    f"Output: ON ({label})",
+                    f"Freq: {plan.frequency:.2f} Hz",
+                    f"Amp:  {state['fg_amp']:.4f} V",
+                    f"N={plan.n} THD~{plan.thd:.1%}",
+                ))
+            else:
+                wait_for_back(lambda: (
+                    "Output: ON (Square)",
+                    f"Freq: {state['fg_freq']} Hz",
+                    f"Amp:  {state['fg_amp']:.4f} V",
+                    "Btn: back",
+                ))
             gen.stop()
             state['fg_output_on'] = False
 
@@ -266,6 +341,199 @@ def run_fg_output():
             return "MAIN"
 
 
+def run_fg_sweep():
+    """Sine (or arbitrary) sweep over the whole range; button stops it."""
+    while True:
+        choice = pick_menu("Sweep", ["Linear", "Log", "Chirp", "Dwell", "Back", "Main"])
+
+        if choice == "Dwell":
+            val = adjust_value(
+                "Dwell per step",
+                state['fg_sweep_dwell'],
+                0.05, 5.0, 0.05,
+                lambda v: f"{v:.2f} s",
+            )
+            if val is not None:
+                state['fg_sweep_dwell'] = val
+
+        elif choice in ("Linear", "Log", "Chirp"):
+            sq_gen.stop()
+            sine_gen.set_waveform(state['fg_samples'] if state['fg_type'] == 'arb' else None)
+            sine_gen.set_amplitude(state['fg_amp'])
+            try:
+                if choice == "Chirp":
+                    sine_gen.start_sweep(log=True, dwell_s=0.0, steps=CHIRP_STEPS, repeat=True)
+                else:
+                    sine_gen.start_sweep(dwell_s=state['fg_sweep_dwell'], log=(choice == "Log"))
+            except ValueError as e:
+                print(f"[Sweep] {e}")
+                wait_for_back(lambda: ("Sweep failed", str(e)[:20], "", "Btn: back"))
+                continue
+            state['fg_output_on'] = True
+            _show_sweep(choice)
+            sine_gen.stop()
+            state['fg_output_on'] = False
+
+        elif choice == "Main":
+            return "MAIN"
+
+        else:
+            return "BACK"
+
+
+def run_fg_burst():
+    """Gated bursts of the selected waveform; button stops them."""
+    while True:
+        choice = pick_menu("Burst", ["Start", "Cycles", "Period", "Back", "Main"])
+
+        if choice == "Cycles":
+            val = adjust_value(
+                "Cycles per burst",
+                state['fg_burst_cycles'],
+                1, 1000, 1,
+                lambda v: f"{int(v)} cycles",
+            )
+            if val is not None:
+                state['fg_burst_cycles'] = int(val)
+
+        elif choice == "Period":
+            val = adjust_value(
+                "Burst period",
+                state['fg_burst_period_ms'],
+                1, 10_000, 1,
+                lambda v: f"{int(v)} ms",
+            )
+            if val is not None:
+                state['fg_burst_period_ms'] = int(val)
+
+        elif choice == "Start":
+            sq_gen.stop()
+            sine_gen.stop()
+            gen = sq_gen if state['fg_type'] == 'square' else sine_gen
+            if gen is sine_gen:
+                sine_gen.set_waveform(state['fg_samples'] if state['fg_type'] == 'arb' else None)
+            gen.set_frequency(state['fg_freq'])
+            gen.set_amplitude(state['fg_amp'])
+            try:
+                burst = gen.start_burst(state['fg_burst_cycles'],
+                                        state['fg_burst_period_ms'] / 1000)
+            except ValueError as e:
+                print(f"[Burst] {e}")
+                wait_for_back(lambda: ("Burst failed", str(e)[:20], "", "Btn: back"))
+                continue
+            state['fg_output_on'] = True
+            wait_for_back(lambda: (
+                f"Burst: {burst.cycles} cycles",
+                f"Freq: {burst.frequency:.2f} Hz",
+                f"On {burst.on_us / 1000:.2f}/{burst.period_us / 1000:.0f} ms",
+                "Btn: stop",
+            ))
+            gen.stop()
+            state['fg_output_on'] = False
+
+        elif choice == "Main":
+            return "MAIN"
+
+        else:
+            return "BACK"
+
+
+def run_fg_dual():
+    """Sine (or arbitrary) plus a phase-locked square from one wave."""
+    while True:
+        choice = pick_menu("Dual", ["Start", "Ratio", "Phase", "Back", "Main"])
+
+        if choice == "Ratio":
+            labels = {str(r): r for r in DUAL_RATIOS}
+            pick = pick_menu("Square/Sine ratio", list(labels) + ["Back"])
+            if pick in labels:
+                state['fg_dual_ratio'] = labels[pick]
+
+        elif choice == "Phase":
+            val = adjust_value(
+                "Square phase",
+                state['fg_dual_phase'],
+                0.0, 355.0, 5.0,
+                lambda v: f"{v:.0f} deg",
+            )
+            if val is not None:
+                state['fg_dual_phase'] = val
+
+        elif choice == "Start":
+            # The square comes from the sine's wave, not hardware PWM
+            sq_gen.stop()
+            sq_gen.set_amplitude(state['fg_amp'])
+            sine_gen.set_waveform(state['fg_samples'] if state['fg_type'] == 'arb' else None)
+            sine_gen.set_frequency(state['fg_freq'])
+            sine_gen.set_amplitude(state['fg_amp'])
+            sine_gen.set_dual(state['fg_dual_ratio'], state['fg_dual_phase'])
+            try:
+                sine_gen.start()
+            except ValueError as e:
+                print(f"[Dual] {e}")
+                sine_gen.set_dual(None)
+                wait_for_back(lambda: ("Dual failed", str(e)[:20], "", "Btn: back"))
+                continue
+            state['fg_output_on'] = True
+
+            plan = sine_gen.plan
+            ratio = state['fg_dual_ratio']
+            wait_for_back(lambda: (
+                "Dual: sine + square",
+                f"Sine {plan.frequency:.2f} Hz",
+                f"Sq x{ratio} {float(plan.frequency * ratio):.2f}",
+                f"Phase {state['fg_dual_phase']:.0f} deg",
+            ))
+            sine_gen.stop()
+            sine_gen.set_dual(None)
+            sq_gen.stop()
+            state['fg_output_on'] = False
+
+        elif choice == "Main":
+            return "MAIN"
+
+        else:
+            return "BACK"
+
+
+def _show_sweep(label):
+    """Live sweep progress until the button is pressed."""
+    state['button_pressed'] = False
+    state['button_last_tick'] = None
+    clear_callbacks(state)
+
+    DEBOUNCE_US = 200_000
+
+    def _on_button(_gpio, level, tick):
+        if level != 0:
+            return
+        last = state.get('button_last_tick')
+        if last is not None and pigpio.tickDiff(last, tick) < DEBOUNCE_US:
+            return
+        state['button_last_tick'] = tick
+        state['button_pressed'] = True
+
+    cb_btn = pi.callback(ROTARY_BTN_PIN, pigpio.FALLING_EDGE, _on_button)
+    state['active_callbacks'] = [cb_btn]
+
+    lcd.put_line(0, f"Sweep: {label}")
+    lcd.put_line(3, "Btn: stop")
+    try:
+        while not state['button_pressed']:
+            prog = sine_gen.sweep_progress()
+            if prog is None:
+                break
+            if prog.done:
+                lcd.put_line(1, "Done")
+                lcd.put_line(2, "")
+            else:
+                lcd.put_line(1, f"{prog.frequency} Hz")
+                lcd.put_line(2, f"Step {prog.step + 1}/{prog.steps} {prog.fraction:4.0%}")
+            time.sleep(0.1)
+    finally:
+        clear_callbacks(state)
+
+
 def run_frequency_measurement():
     """Frequency measurement via SAR zero-crossing. Runs measurement in a
     background thread so Back/Main navigation stays responsive."""
@@ -308,7 +576,10 @@ def run_frequency_measurement():
     lcd.put_line(1, "Waiting...")
     _draw_nav()
 
-    last_update = 0.0
+    acq = AcquisitionService(freq_meter.snapshot, interval=0.5, name="freq")
+    acq.start()
+
+    last_seq = 0
     try:
         while True:
             delta = state.get('encoder_delta', 0)
@@ -321,22 +592,70 @@ def run_frequency_measurement():
                 state['button_pressed'] = False
                 return "BACK" if nav_idx == 0 else "MAIN"
 
-            now = time.time()
-            if now - last_update >= 0.5:
-                last_update = now
-                freq = freq_meter.get_frequency()
-                if freq > 0:
-                    lcd.put_line(1, f"{freq:.1f} Hz")
+            reading = acq.latest()
+            if reading is not None and reading.seq != last_seq:
+                last_seq = reading.seq
+                snap = reading.value
+                if snap.frequency > 0:
+                    lcd.put_line(1, f"{snap.frequency:.1f}+/-{snap.uncertainty:.1f}Hz")
                 else:
                     lcd.put_line(1, "No signal")
 
             time.sleep(0.05)
     finally:
+        acq.stop()
         freq_meter.cleanup()
         state['button_pressed'] = False
         clear_callbacks(state)
 
 
+def run_waveform_capture():
+    """Equivalent-time capture of the voltmeter input. Button cancels."""
+    state['button_pressed'] = False
+    state['button_last_tick'] = None
+    clear_callbacks(state)
+
+    DEBOUNCE_US = 200_000
+
+    def _progress(done, total):
+        lcd.put_line(1, f"Threshold {done}/{total}")
+
+    cap = WaveformCapture(pi, spi_ce1, progress=_progress)
+
+    def _on_button(_gpio, level, tick):
+        if level != 0:
+            return
+        last = state.get('button_last_tick')
+        if last is not None and pigpio.tickDiff(last, tick) < DEBOUNCE_US:
+            return
+        state['button_last_tick'] = tick
+        cap.cancel()
+
+    cb_btn = pi.callback(ROTARY_BTN_PIN, pigpio.FALLING_EDGE, _on_button)
+    state['active_callbacks'] = [cb_btn]
+
+    lcd.put_line(0, "Waveform Capture")
+    lcd.put_line(1, "Starting...")
+    lcd.put_line(2, "")
+    lcd.put_line(3, "Btn: cancel")
+
+    try:
+        result = cap.capture()
+    finally:
+        clear_callbacks(state)
+
+    if result.cancelled or result.dc_offset is None:
+        return "BACK"
+
+    wait_for_back(lambda: (
+        f"Wave {result.frequency:.0f} Hz",
+        f"Vpp {result.vpp:.2f}V",
+        f"DC {result.dc_offset:+.2f}V",
+        "Btn: back",
+    ))
+    return "BACK"
+
+
 def run_ohmmeter():
     """Live resistance reading with Back/Main on the same screen."""
     state['encoder_delta'] = 0
@@ -378,7 +697,16 @@ def run_ohmmeter():
     lcd.put_line(1, "Measuring...")
     _draw_nav()
 
-    last_update = 0.0
+    tracker = TrackingADC(pi, spi_ce1, COMPARATOR2_PIN)
+
+    def _measure():
+        tracker.read()
+        return tracker.fractional()
+
+    acq = AcquisitionService(_measure, interval=TRACK_INTERVAL_S, name="ohmmeter")
+    acq.start()
+
+    last_seq = 0
     try:
         while True:
             delta = state.get('encoder_delta', 0)
@@ -391,21 +719,22 @@ def run_ohmmeter():
                 state['button_pressed'] = False
                 return "BACK" if nav_idx == 0 else "MAIN"
 
-            now = time.time()
-            if now - last_update >= 0.5:
-                last_update = now
-                step = ohm_averaged_measure(pi, spi_ce1, COMPARATOR2_PIN, n=11)
+            reading = acq.latest()
+            if reading is not None and reading.seq != last_seq:
+                last_seq = reading.seq
+                step, u = reading.value
                 resistance = step_to_resistance(step)
-                tol = ohm_tolerance(step)
+                tol = ohm_fractional_tolerance(step, u)
 
                 if resistance < 500 or resistance > 10000:
                     lcd.put_line(1, "Not in range")
                 else:
                     lcd.put_line(1, f"{resistance:.0f}+/-{tol:.0f} ohm")
-                print(f"[Ohmmeter] step={step}  R={resistance:.0f}  tol={tol:.0f}")
+                print(f"[Ohmmeter] step={step:.2f}+/-{u:.2f}  R={resistance:.0f}  tol={tol:.0f}")
 
             time.sleep(0.05)
     finally:
+        acq.stop()
         state['button_pressed'] = False
         clear_callbacks(state)
 
@@ -549,7 +878,7 @@ try:
         while True:
             choice = pick_menu(
                 "Mode Select",
-                ["Function Generator", "Ohmmeter", "Voltmeter", "DC Reference", "Frequency Meas.", "Back", "Main"],
+                ["Function Generator", "Ohmmeter", "Voltmeter", "DC Reference", "Frequency Meas.", "Waveform Cap.", "Back", "Main"],
             )
 
             if choice == "Function Generator":
@@ -567,6 +896,9 @@ try:
             elif choice == "Frequency Meas.":
                 result = run_frequency_measurement()
 
+            elif choice == "Waveform Cap.":
+                result = run_waveform_capture()
+
             elif choice in ("Back", "Main"):
                 break  # go back to top screen
 
@@ -578,6 +910,7 @@ finally:
     sq_gen.cleanup()
     sine_gen.cleanup()
     dc_ref.cleanup()
+    close_engines(pi)
     clear_callbacks(state)
     lcd.close()
     pi.spi_close(spi_ce0)
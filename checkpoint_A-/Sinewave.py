@@ -1,6 +1,26 @@
+import hashlib
 import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from fractions import Fraction
+
+import numpy as np
 import pigpio
 
+from wave_chains import (
+    BURST_CYCLES,
+    BURST_PERIOD_S,
+    CHAIN_LOOP_MAX,
+    MAX_PERIODS,
+    Burst,
+    chain_delay,
+    chain_loop,
+    check_chain,
+    wave_periods,
+)
+
 PWM_GPIO = 26
 
 MIN_FREQ = 1000
@@ -16,6 +36,110 @@ SPI_BAUD = 1_000_000
 CMD_WRITE_WIPER0 = 0x00
 MAX_WIPER_STEP = 127
 
+# Created waves are kept in pigpiod and reused (WaveCache).  The cache is
+# bounded by WAVE_CACHE_MAX and by the daemon's pulse / control-block
+# limits; each pulse costs about CBS_PER_PULSE DMA control blocks.
+WAVE_CACHE_MAX = 32
+CBS_PER_PULSE = 2
+
+# Packed pulse layout, the same 12 bytes per pulse that wave_add_generic
+# sends to pigpiod (gpio_on, gpio_off, delay).
+PULSE_DTYPE = np.dtype([("on", "<u4"), ("off", "<u4"), ("delay", "<u4")])
+
+# wave_add_packed sends a PULSE_DTYPE array as the WVAG extension through
+# pigpio's socket internals, only on releases checked to have them as
+# used here.  That saves about 0.7 µs of Python per pulse, less than a
+# socket round trip below PACKED_MIN_PULSES, so smaller waves take the
+# public wave_add_generic path.
+PACKED_PIGPIO_VERSIONS = ("1.78",)
+PACKED_MIN_PULSES = 100
+_PACKED_UPLOAD = (getattr(pigpio, "VERSION", None) in PACKED_PIGPIO_VERSIONS
+                  and hasattr(pigpio, "_pigpio_command_ext"))
+
+# Sample-count planner (plan_samples).  A wave may use 1/WAVES_IN_BUDGET
+# of the daemon's pulses and control blocks, leaving room for the wave on
+# the output, a retiring one and the cache.  A slot under MIN_SLOT_US
+# can only be fully on or off.  THD counts harmonics 2..THD_HARMONICS;
+# the PWM carrier above them is left to the output filter.
+SAMPLE_CANDIDATES = (8, 12, 16, 20, 24, 32, 40, 48, 64, 96, 128)
+WAVES_IN_BUDGET = 4
+MIN_SLOT_US = 2
+THD_HARMONICS = 7
+
+# Oversampled / noise-shaped PWM (set_pwm_mode): every sample slot is
+# split into `oversample` PWM cells, the duty interpolated between the
+# samples, which moves the carrier from N * f to oversample * N * f.
+# With noise shaping the high times are rounded as a running sum (first
+# order sigma-delta), so the 1 µs rounding error is pushed up towards
+# the carrier instead of landing in the harmonics.
+OVERSAMPLE_FACTORS = (1, 2, 4, 8)
+
+# Sweeps (start_sweep): every step's wave is created up front and one
+# wave_chain plays them back to back, each looped for the dwell, so the
+# DMA engine times the whole sweep.  A step played once needs no loop
+# counter (see wave_chains), which is how a chirp (dwell 0) gets many
+# steps.
+SWEEP_MAX_STEPS  = 200
+SWEEP_DWELL_S    = 0.5
+SWEEP_LOG_STEPS  = 16
+CHIRP_STEPS      = 100
+SWEEP_POLL_S     = 0.005
+
+# Hardware-PWM DDS backend (backend=BACKEND_DDS): PWM channel 0 on
+# DDS_GPIO runs at DDS_CARRIER_HZ and a producer thread rewrites its
+# duty about DDS_UPDATE_HZ times a second from a phase accumulator
+# advanced by the measured elapsed time, so the average frequency is
+# exact and frequency changes are phase-continuous.  Every update is one
+# pigpiod command, so the socket round trip bounds the update rate: a few
+# thousand a second, not DDS_UPDATE_HZ.  That makes it a low-frequency
+# backend only: it needs about 20 updates per period for a clean sine,
+# so set_frequency() keeps it to DDS_MIN_FREQ..DDS_MAX_FREQ in
+# DDS_FREQ_STEP steps, below the wave backend's MIN_FREQ; it is not a
+# substitute for the wave backend (see dds_bench.py).  The output filter
+# has to be wired to DDS_GPIO (GPIO 13 / 19 are channel 1, the square
+# wave), and hardware PWM and DMA waves cancel each other.
+BACKEND_WAVE   = "wave"
+BACKEND_DDS    = "dds"
+DDS_GPIO       = 12
+DDS_CARRIER_HZ = 250_000
+DDS_UPDATE_HZ  = 20_000
+DDS_DUTY_MAX   = 1_000_000
+DDS_MIN_FREQ   = 10
+DDS_MAX_FREQ   = 100
+DDS_FREQ_STEP  = 10
+
+# Dual output (set_dual): the square on DUAL_GPIO (the square wave's
+# pin, square_wave.PWM_GPIO) is added to the sine's own wave, so both
+# channels come from one DMA timebase.  The ratio is square / sine
+# frequency; the wave spans enough periods to hold a whole number of
+# square cycles.  Phase is in degrees of the sine period, to 1 µs.
+DUAL_GPIO = 13
+DUAL_RATIOS = (Fraction(1, 4), Fraction(1, 3), Fraction(1, 2), Fraction(1),
+               Fraction(2), Fraction(3), Fraction(4))
+DUAL_MAX_DENOMINATOR = 4
+
+# n: samples per period, periods: periods in the wave, frequency: what
+# the span gives (Hz), freq_error: frequency - requested (Hz),
+# timing_error_us: RMS error of the per-sample high time against
+# unquantised PWM, oversample: PWM cells per sample, shaped: noise shaping
+SamplePlan = namedtuple("SamplePlan", [
+    "n", "periods", "frequency", "freq_error", "span_us", "min_slot_us",
+    "timing_error_us", "pulses", "cbs", "thd", "oversample", "shaped",
+])
+
+# DDS producer counters: late is updates issued after their deadline
+DdsStats = namedtuple("DdsStats", ["updates", "late", "rate_hz"])
+
+# Square channel of the dual output: ratio (Fraction), phase_deg
+DualOutput = namedtuple("DualOutput", ["ratio", "phase_deg"])
+
+# One sweep step: its wave is played `loops` times, dwell_s in total
+SweepStep = namedtuple("SweepStep", ["frequency", "wave_id", "loops", "dwell_s"])
+# step: index into the sweep, fraction: of the whole sweep (of the
+# current pass when repeating), done: a single sweep has finished
+SweepProgress = namedtuple("SweepProgress", ["step", "steps", "frequency",
+                                             "fraction", "done"])
+
 
 def _clamp(value, lo, hi):
     return max(lo, min(hi, value))
@@ -87,29 +211,755 @@ CAL_TABLES = {
 }
 
 
+def exp_correction(frequency):
+    """ Smooth frequency trend of the amplitude correction. """
+    f = float(frequency)
+    corr = 0.4065 * ((f / 1000.0) ** 0.312)
+    return _clamp(corr, 0.30, 1.00)
+
+
+def _find_bracketing_freqs(freq):
+    freqs = sorted(CAL_TABLES.keys())
+
+    if freq <= freqs[0]:
+        return freqs[0], freqs[0]
+    if freq >= freqs[-1]:
+        return freqs[-1], freqs[-1]
+
+    for i in range(1, len(freqs)):
+        if freq <= freqs[i]:
+            return freqs[i - 1], freqs[i]
+
+    return freqs[-1], freqs[-1]
+
+
+def table_correction(frequency, amp):
+    """ CAL_TABLES interpolated in amplitude at the bracketing
+        frequencies, then linearly in frequency. """
+    # Find the left-bound and right-bound freqs of the set freq
+    f0, f1 = _find_bracketing_freqs(frequency)
+
+    def corr_at_freq(freq):
+        table = CAL_TABLES[freq]
+        xs = sorted(table.keys())
+        ys = [table[x] for x in xs]
+        return _interp(amp, xs, ys)
+
+    """ Use amp to find adjusted amp values for left-bound and
+        right-bound freqs. """
+    c0 = corr_at_freq(f0)
+    c1 = corr_at_freq(f1)
+
+    if f0 == f1:
+        return c0
+
+    frac = (frequency - f0) / (f1 - f0)
+    return c0 + frac * (c1 - c0)
+
+
+def corrected_amplitude(frequency, amp):
+    """ Command amplitude for a wanted Vpp: table x exponential correction,
+        clamped to MAX_AMP.  CalSurface.from_tables() samples this. """
+    return _clamp(table_correction(frequency, amp) * exp_correction(frequency),
+                  0.0, MAX_AMP)
+
+
+# Precomputed amplitude calibration (CalSurface).  A fitted surface saved
+# to CAL_SURFACE_PATH is loaded at import; otherwise it is sampled from
+# CAL_TABLES on the FREQ_STEP x AMP_STEP grid the UI can set.
+CAL_SURFACE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sine_cal_surface.npz"
+)
+GRID_SNAP = 1e-9            # grid index this close to a whole number is on it
+
+
+class CalSurface:
+    """
+    Command amplitude over a regular (frequency, amplitude) grid.
+
+    lookup() is O(1): the grid is uniform, so the cell comes from one
+    division per axis, and the value is bilinear in the cell.  On grid
+    points it returns the stored value unchanged.
+    """
+
+    def __init__(self, freqs, amps, values):
+        self.freqs = np.asarray(freqs, dtype=np.float64)
+        self.amps = np.asarray(amps, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+        if self.values.shape != (len(self.freqs), len(self.amps)):
+            raise ValueError("values must be len(freqs) x len(amps)")
+        self._f0, self._df = float(self.freqs[0]), float(self.freqs[1] - self.freqs[0])
+        self._a0, self._da = float(self.amps[0]), float(self.amps[1] - self.amps[0])
+        self._rows = self.values.tolist()   # plain floats for lookup()
+
+    @staticmethod
+    def grid():
+        """ The frequencies and amplitudes the UI can set. """
+        freqs = np.arange(MIN_FREQ, MAX_FREQ + 1, FREQ_STEP, dtype=np.float64)
+        amps = np.arange(0, round(MAX_AMP / AMP_STEP) + 1) * AMP_STEP
+        return freqs, amps
+
+    @classmethod
+    def from_tables(cls):
+        """ Sample corrected_amplitude() (CAL_TABLES) on the grid. """
+        freqs, amps = cls.grid()
+        values = [[corrected_amplitude(int(f), round(float(a), 3)) for a in amps]
+                  for f in freqs]
+        return cls(freqs, amps, values)
+
+    @classmethod
+    def fit(cls, freq, amp, command, degree=None):
+        """
+        Surface through measured points.
+
+        freq, amp : where each point was measured (Hz, wanted Vpp)
+        command   : command amplitude that produced amp
+        degree    : None interpolates piecewise-linearly, first along
+                    amplitude at each measured frequency and then along
+                    frequency, like CAL_TABLES; a (frequency, amplitude)
+                    degree fits a least-squares polynomial instead, for
+                    scattered or noisy points.
+        """
+        freqs, amps = cls.grid()
+        freq = np.asarray(freq, dtype=np.float64)
+        amp = np.asarray(amp, dtype=np.float64)
+        command = np.asarray(command, dtype=np.float64)
+
+        if degree is None:
+            measured = np.unique(freq)
+            rows = []
+            for f in measured:
+                sel = freq == f
+                order = np.argsort(amp[sel])
+                rows.append(np.interp(amps, amp[sel][order], command[sel][order]))
+            rows = np.array(rows)
+            values = np.array([np.interp(freqs, measured, rows[:, j])
+                               for j in range(len(amps))]).T
+            return cls(freqs, amps, np.clip(values, 0.0, MAX_AMP))
+
+        # Scale both axes to [0, 1] to keep the fit well conditioned
+        def basis(f, a):
+            f = (np.asarray(f, dtype=np.float64) - MIN_FREQ) / (MAX_FREQ - MIN_FREQ)
+            a = np.asarray(a, dtype=np.float64) / MAX_AMP
+            return np.stack([f ** i * a ** j for i in range(degree[0] + 1)
+                             for j in range(degree[1] + 1)], axis=-1)
+
+        coef, *_ = np.linalg.lstsq(basis(freq, amp), command, rcond=None)
+        ff, aa = np.meshgrid(freqs, amps, indexing="ij")
+        values = np.clip(basis(ff, aa) @ coef, 0.0, MAX_AMP)
+        return cls(freqs, amps, values)
+
+    def _cell(self, x, x0, dx, size):
+        pos = (x - x0) / dx
+        i = round(pos)
+        if abs(pos - i) < GRID_SNAP:
+            return int(_clamp(i, 0, size - 1)), 0.0
+        i = int(_clamp(math.floor(pos), 0, size - 2))
+        return i, _clamp(pos - i, 0.0, 1.0)
+
+    def lookup(self, frequency, amp):
+        """ Bilinear command amplitude, clamped to the grid's edges. """
+        i, tf = self._cell(frequency, self._f0, self._df, len(self.freqs))
+        j, ta = self._cell(amp, self._a0, self._da, len(self.amps))
+        v = self._rows
+        if tf == 0.0 and ta == 0.0:
+            return v[i][j]
+        i1 = min(i + 1, len(self.freqs) - 1)
+        j1 = min(j + 1, len(self.amps) - 1)
+        lo = v[i][j] + ta * (v[i][j1] - v[i][j])
+        hi = v[i1][j] + ta * (v[i1][j1] - v[i1][j])
+        return lo + tf * (hi - lo)
+
+    def save(self, path=CAL_SURFACE_PATH):
+        np.savez_compressed(path, freqs=self.freqs, amps=self.amps,
+                            values=self.values)
+
+    @classmethod
+    def load(cls, path=CAL_SURFACE_PATH):
+        """ The saved surface, or None if there is none. """
+        try:
+            with np.load(path) as data:
+                return cls(data["freqs"], data["amps"], data["values"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+CAL_SURFACE = CalSurface.load() or CalSurface.from_tables()
+
+
+def _slot_widths(frequency, n, periods=1):
+    """ Integer µs slot per sample over `periods` periods, summing to the
+        rounded span.
+
+        Slot i ends at round((i + 1) * period / n), so rounding never
+        accumulates: this is a phase accumulator with 1 µs resolution,
+        and over several periods the fractional µs average out. """
+    period_us = 1_000_000.0 / frequency
+    ends = np.rint(np.arange(1, n * periods + 1) * (period_us / n)).astype(np.int64)
+    slots = np.diff(ends, prepend=0)
+    return np.maximum(slots, 1)
+
+
+def sine_table(n):
+    return np.sin(2 * np.pi * np.arange(n) / n)
+
+
+def normalize_samples(samples):
+    """ Samples scaled and offset to span -1..1 as a float64 array; the
+        amplitude setting gives the Vpp.  A flat array becomes zeros.
+        Raises ValueError if it is empty or holds nan / inf. """
+    samples = np.asarray(samples, dtype=np.float64).ravel()
+    if len(samples) == 0:
+        raise ValueError("empty sample array")
+    if not np.isfinite(samples).all():
+        raise ValueError("sample array holds nan or inf")
+    lo, hi = samples.min(), samples.max()
+    if hi == lo:
+        return np.zeros_like(samples)
+    return (2 * samples - (hi + lo)) / (hi - lo)
+
+
+def waveform_key(samples):
+    """ Content hash of a normalised sample array, for the wave cache. """
+    return hashlib.sha1(np.ascontiguousarray(samples).tobytes()).hexdigest()[:16]
+
+
+def _periodic_interp(samples, phase):
+    """ samples (one period) linearly interpolated at phase 0..1,
+        wrapping from the last sample back to the first.  O(len(phase)). """
+    pos = phase * len(samples)
+    i = np.floor(pos).astype(np.int64) % len(samples)
+    frac = pos - np.floor(pos)
+    return samples[i] + frac * (samples[(i + 1) % len(samples)] - samples[i])
+
+
+def resample_table(samples, n):
+    """ One period of samples (any length) resampled to n points. """
+    return _periodic_interp(np.asarray(samples, dtype=np.float64), np.arange(n) / n)
+
+
+def _slot_times(frequency, n, periods=1, table=None, oversample=1,
+                noise_shaping=False):
+    """ (slot widths, high times, duty) per PWM cell, integer µs.
+
+        table: n samples in -1..1 for one period (default sine_table).
+        oversample: cells per sample, the duty linearly interpolated
+        between samples (the sine is computed exactly).
+        noise_shaping: round the running sum of the high times rather
+        than each one, so every cell's rounding error is carried into
+        the next (first-order sigma-delta). """
+    cells = n * oversample
+    slots = _slot_widths(frequency, cells, periods)
+    if table is None:
+        table = sine_table(cells)
+    elif oversample > 1:
+        table = _periodic_interp(np.asarray(table, dtype=np.float64),
+                                 np.arange(cells) / cells)
+    duty = np.clip(0.5 + 0.5 * np.tile(table, periods), 0.0, 1.0)
+    if noise_shaping:
+        # 0 <= duty * slot <= slot, so each difference stays in 0..slot
+        high = np.diff(np.rint(np.cumsum(duty * slots)).astype(np.int64), prepend=0)
+    else:
+        high = np.rint(duty * slots).astype(np.int64)
+    return slots, high, duty
+
+
+def build_sine_pulses(frequency, n, gpio=PWM_GPIO, alternate=True, periods=1,
+                      oversample=1, noise_shaping=False):
+    """ Sine PWM wave: build_pwm_pulses() with an n-point sine_table. """
+    if oversample > 1:
+        # Interpolating the n-point table would flatten the peaks
+        n, oversample = n * oversample, 1
+    return build_pwm_pulses(frequency, sine_table(n), gpio, alternate, periods,
+                            oversample, noise_shaping)
+
+
+def build_pwm_pulses(frequency, table, gpio=PWM_GPIO, alternate=True, periods=1,
+                     oversample=1, noise_shaping=False, wrap=True):
+    """
+    Vectorised PWM builder.  Returns a PULSE_DTYPE array.
+
+    Every sample slot is split into a high and a low time from the
+    table (values -1..1).  With alternate=True odd slots are emitted
+    low-then-high, so the low (or high) parts of neighbouring slots
+    touch; runs of the same level are then merged into one pulse,
+    including across the wrap from the last slot to the first.  That is
+    about one pulse per sample instead of two, and the period is
+    unchanged.  The wrap merge moves the wave's start off sample 0;
+    wrap=False skips it, so the wave starts exactly at sample 0.
+
+    periods > 1 builds that many periods in one wave (see wave_periods).
+    oversample and noise_shaping are as for _slot_times().
+    """
+    slots, high, _ = _slot_times(frequency, len(table), periods, table,
+                                 oversample, noise_shaping)
+    low = slots - high
+    total = len(slots)
+
+    first_high = np.ones(total, dtype=bool)
+    if alternate:
+        first_high[1::2] = False
+
+    # Two segments per slot, in output order
+    levels = np.empty(2 * total, dtype=bool)
+    durs = np.empty(2 * total, dtype=np.int64)
+    levels[0::2] = first_high
+    levels[1::2] = ~first_high
+    durs[0::2] = np.where(first_high, high, low)
+    durs[1::2] = np.where(first_high, low, high)
+
+    keep = durs > 0
+    levels, durs = levels[keep], durs[keep]
+
+    # Merge runs of the same level
+    starts = np.concatenate(([0], np.flatnonzero(levels[1:] != levels[:-1]) + 1))
+    durs = np.add.reduceat(durs, starts)
+    levels = levels[starts]
+
+    # The wave repeats, so a last run at the first run's level joins it
+    if wrap and len(levels) > 1 and levels[0] == levels[-1]:
+        durs[0] += durs[-1]
+        levels, durs = levels[:-1], durs[:-1]
+
+    mask = 1 << gpio
+    pulses = np.empty(len(durs), dtype=PULSE_DTYPE)
+    pulses["on"] = np.where(levels, mask, 0)
+    pulses["off"] = np.where(levels, 0, mask)
+    pulses["delay"] = durs
+    return pulses
+
+
+def dual_periods(periods, ratio):
+    """ Fewest sine periods, a multiple of `periods`, that hold a whole
+        number of square cycles at `ratio`. """
+    q = Fraction(ratio).denominator
+    return periods * q // math.gcd(periods, q)
+
+
+def build_dual_pulses(frequency, table, ratio=1, phase_deg=0.0, gpio=PWM_GPIO,
+                      square_gpio=DUAL_GPIO, periods=1, oversample=1,
+                      noise_shaping=False):
+    """
+    PWM wave (build_pwm_pulses) on `gpio` plus a 50 % square on
+    square_gpio at `ratio` times the frequency, in one PULSE_DTYPE wave.
+
+    The square's rising edges are phase_deg (of the sine period) after
+    the start of the sine, every square period; edges are rounded to
+    the µs without accumulating.  periods * ratio must be whole (see
+    dual_periods).  Edges of both pins on the same µs share a pulse.
+    """
+    ratio = Fraction(ratio)
+    cycles = periods * ratio
+    if cycles.denominator != 1:
+        raise ValueError(f"{periods} periods hold {cycles} square cycles")
+    # Unrotated, so time 0 is the start of sine sample 0
+    sine = build_pwm_pulses(frequency, table, gpio, periods=periods,
+                            oversample=oversample, noise_shaping=noise_shaping,
+                            wrap=False)
+    span = int(sine["delay"].sum())
+    sine_t = np.concatenate(([0], np.cumsum(sine["delay"][:-1])))
+
+    edges = 2 * int(cycles)
+    offset = (phase_deg % 360.0) / 360.0 * span / periods
+    square_t = np.rint(offset + np.arange(edges) * (span / edges)).astype(np.int64) % span
+    rising = np.arange(edges) % 2 == 0
+
+    times = np.union1d(sine_t, square_t)
+    on = np.zeros(len(times), dtype=np.uint32)
+    off = np.zeros(len(times), dtype=np.uint32)
+    i = np.searchsorted(times, sine_t)
+    on[i] |= sine["on"]
+    off[i] |= sine["off"]
+    mask = 1 << square_gpio
+    j = np.searchsorted(times, square_t)
+    np.bitwise_or.at(on, j, np.where(rising, mask, 0).astype(np.uint32))
+    np.bitwise_or.at(off, j, np.where(rising, 0, mask).astype(np.uint32))
+
+    pulses = np.empty(len(times), dtype=PULSE_DTYPE)
+    pulses["on"] = on
+    pulses["off"] = off
+    pulses["delay"] = np.diff(times, append=span)
+    return pulses
+
+
+def predicted_thd(pulses, harmonics=THD_HARMONICS, periods=1):
+    """ THD of a pulse train from the FFT of its 1 µs timeline.
+
+        For a multi-period wave every bin up to the last counted
+        harmonic except the fundamental counts, so the spurs from
+        period-to-period jitter are included. """
+    timeline = np.repeat(np.where(pulses["on"] != 0, 1.0, -1.0), pulses["delay"])
+    spectrum = np.abs(np.fft.rfft(timeline))
+    if len(spectrum) <= periods or spectrum[periods] == 0:
+        return float("inf")
+    h = np.delete(spectrum[1:harmonics * periods + 1], periods - 1)
+    return float(np.sqrt(np.sum(h * h)) / spectrum[periods])
+
+
+def _target_spectrum(samples, span_us, periods, harmonics):
+    """ Magnitudes of bins 1..harmonics*periods of the ideal waveform
+        over a span_us µs wave. """
+    phase = ((np.arange(span_us) + 0.5) * periods / span_us) % 1.0
+    target = _periodic_interp(np.asarray(samples, dtype=np.float64), phase)
+    return np.abs(np.fft.rfft(target))[1:harmonics * periods + 1]
+
+
+def predicted_distortion(pulses, samples, harmonics=THD_HARMONICS, periods=1,
+                         target=None):
+    """ Shape error of a pulse train against one period of samples:
+        RMS difference of the spectrum magnitudes over harmonics
+        1..harmonics (every bin up to there for a multi-period wave),
+        relative to the target's.  For a sine this is the THD plus the
+        fundamental's amplitude error.
+
+        target: _target_spectrum() if already computed for this span. """
+    timeline = np.repeat(np.where(pulses["on"] != 0, 1.0, -1.0), pulses["delay"])
+    want = target
+    if want is None:
+        want = _target_spectrum(samples, len(timeline), periods, harmonics)
+    got = np.abs(np.fft.rfft(timeline))[1:harmonics * periods + 1]
+    ref = np.sqrt(np.sum(want * want))
+    if ref == 0:
+        return float("inf")
+    return float(np.sqrt(np.sum((got - want) ** 2)) / ref)
+
+
+def sample_plans(frequency, max_pulses, max_cbs, candidates=SAMPLE_CANDIDATES,
+                 max_periods=1, samples=None, oversample=1, noise_shaping=False,
+                 min_slot_us=MIN_SLOT_US):
+    """ SamplePlan for every candidate N that fits the pulse / CB budget
+        and min_slot_us at this frequency.  max_periods > 1 lets the wave
+        span several periods (wave_periods) for an exact frequency.
+
+        samples: one period of an arbitrary waveform (-1..1, any length),
+        resampled to each N; thd is then predicted_distortion() against
+        it.  None plans a sine.
+
+        oversample, noise_shaping: PWM cells per sample and sigma-delta
+        rounding (_slot_times); min_slot_us then applies to the cells. """
+    periods = wave_periods(frequency, max_periods)
+    period_ideal = 1_000_000.0 / frequency
+    target = None
+    if samples is not None:
+        # Every N gives the same span, so the target is computed once
+        span = int(_slot_widths(frequency, 1, periods).sum())
+        target = _target_spectrum(samples, span, periods, THD_HARMONICS)
+    plans = []
+    for n in candidates:
+        if samples is None:
+            # Exact sine at every cell rather than interpolated
+            table = sine_table(n * oversample)
+            n_table, k = n * oversample, 1
+        else:
+            table = resample_table(samples, n)
+            n_table, k = n, oversample
+        slots, high, duty = _slot_times(frequency, n_table, periods, table, k,
+                                        noise_shaping)
+        min_slot = int(slots.min())
+        if min_slot < min_slot_us:
+            continue
+        pulses = build_pwm_pulses(frequency, table, periods=periods,
+                                  oversample=k, noise_shaping=noise_shaping)
+        cbs = len(pulses) * CBS_PER_PULSE
+        if len(pulses) > max_pulses or cbs > max_cbs:
+            continue
+        if samples is None:
+            thd = predicted_thd(pulses, periods=periods)
+        else:
+            thd = predicted_distortion(pulses, samples, periods=periods,
+                                       target=target)
+
+        span_us = int(slots.sum())
+        actual = 1_000_000.0 * periods / span_us
+        cell_ideal = period_ideal / (n * oversample)
+        timing = float(np.sqrt(np.mean((high - duty * cell_ideal) ** 2)))
+        plans.append(SamplePlan(n, periods, actual, actual - frequency, span_us,
+                                min_slot, timing, len(pulses), cbs, thd,
+                                oversample, noise_shaping))
+    return plans
+
+
+def plan_samples(frequency, max_pulses, max_cbs, candidates=SAMPLE_CANDIDATES,
+                 max_periods=1, samples=None, oversample=1, noise_shaping=False):
+    """ The SamplePlan with the lowest predicted THD within budget (the
+        smaller N on a tie).  Falls back to the smallest candidate in a
+        single period, without oversampling and whatever its slot width,
+        if none fits. """
+    plans = sample_plans(frequency, max_pulses, max_cbs, candidates,
+                         max_periods, samples, oversample, noise_shaping)
+    if not plans:
+        n = min(candidates)
+        # _slot_widths never makes a slot under 1 µs, so this always plans
+        return sample_plans(frequency, float("inf"), float("inf"), (n,),
+                            samples=samples, noise_shaping=noise_shaping,
+                            min_slot_us=1)[0]
+    return min(plans, key=lambda p: (p.thd, p.n))
+
+
+def pwm_mode_report(frequency, max_pulses, max_cbs, factors=OVERSAMPLE_FACTORS,
+                    max_periods=1, samples=None):
+    """ The plan_samples() choice for every oversample factor, without
+        and with noise shaping, for trading pulses / control blocks
+        against predicted THD.  Settings with no candidate in budget are
+        left out. """
+    report = []
+    for oversample in factors:
+        for shaped in (False, True):
+            plans = sample_plans(frequency, max_pulses, max_cbs,
+                                 max_periods=max_periods, samples=samples,
+                                 oversample=oversample, noise_shaping=shaped)
+            if plans:
+                report.append(min(plans, key=lambda p: (p.thd, p.n)))
+    return report
+
+
+def sweep_frequencies(f_start=MIN_FREQ, f_stop=MAX_FREQ, steps=None, log=False):
+    """
+    Step frequencies (whole Hz) from f_start to f_stop inclusive.
+
+    Linear sweeps default to FREQ_STEP spacing, log sweeps to
+    SWEEP_LOG_STEPS points.  f_stop < f_start sweeps downwards.
+    """
+    if log:
+        n = SWEEP_LOG_STEPS if steps is None else steps
+        freqs = np.geomspace(f_start, f_stop, max(n, 2))
+    elif steps is None:
+        step = FREQ_STEP if f_stop >= f_start else -FREQ_STEP
+        freqs = np.arange(f_start, f_stop + step, step)
+        freqs = freqs[(freqs - f_stop) * step <= 0]
+    else:
+        freqs = np.linspace(f_start, f_stop, max(steps, 2))
+    freqs = np.clip(np.rint(freqs), MIN_FREQ, MAX_FREQ).astype(int)
+    # Drop repeats from rounding, keeping the order
+    out = []
+    for f in freqs.tolist():
+        if not out or f != out[-1]:
+            out.append(f)
+    return out
+
+
+def sweep_chain(steps, repeat=False):
+    """
+    wave_chain data for a list of SweepStep.
+
+    A step played more than once is a loop block (255 0, wave, 255 1
+    lo hi); repeat wraps the chain in a loop-forever block.  Raises
+    ValueError if pigpiod's chain length or loop counter limits are
+    exceeded.
+    """
+    chain = []
+    for step in steps:
+        chain += chain_loop(step.wave_id, step.loops)
+    if repeat:
+        chain = [255, 0] + chain + [255, 3]
+    check_chain(chain)
+    return chain
+
+
+def wave_add_packed(pi, pulses):
+    """
+    wave_add_generic for a PULSE_DTYPE array.
+
+    Normally an ordinary pigpio.pulse list.  A wave of PACKED_MIN_PULSES
+    or more on a pigpio release in PACKED_PIGPIO_VERSIONS is sent as the
+    array bytes, as they are, with no pigpio.pulse objects.
+    """
+    if _PACKED_UPLOAD and len(pulses) >= PACKED_MIN_PULSES and hasattr(pi, "sl"):
+        return pigpio._u2i(pigpio._pigpio_command_ext(
+            pi.sl, pigpio._PI_CMD_WVAG, 0, 0,
+            len(pulses) * PULSE_DTYPE.itemsize, [pulses.tobytes()]))
+    return pi.wave_add_generic(
+        [pigpio.pulse(on, off, delay) for on, off, delay in pulses.tolist()])
+
+
+def create_wave(pi, pulses):
+    """ wave_create from a pulse list or PULSE_DTYPE array: the wave ID,
+        or a negative pigpio error code. """
+    pi.wave_add_new()
+    if isinstance(pulses, np.ndarray):
+        wave_add_packed(pi, pulses)
+    else:
+        pi.wave_add_generic(pulses)
+    return pi.wave_create()
+
+
+class WaveCache:
+    """
+    LRU cache of created pigpio waves keyed by (waveform, frequency, N,
+    periods), waveform being "sine" or a waveform_key() content hash.
+
+    Each entry keeps its wave ID and pulses (a PULSE_DTYPE array or a
+    pigpio.pulse list).  Before a new wave is created, least recently
+    used entries are deleted until it fits the daemon's pulse and
+    control-block budget; the wave on the output is never evicted.
+
+    pigpiod only reuses a deleted wave's memory for a wave of exactly
+    the same size, or once every higher-numbered wave is deleted too,
+    so after enough evictions wave_create can fail although the budget
+    says it fits.  reset() is the way back to an empty daemon.
+    """
+
+    def __init__(self, pi, max_waves=WAVE_CACHE_MAX):
+        self._pi = pi
+        self.max_waves = max_waves
+        self.max_pulses = pi.wave_get_max_pulses()
+        self.max_cbs = pi.wave_get_max_cbs()
+        self._waves = OrderedDict()   # key -> (wave_id, pulses)
+        self.hits = 0
+        self.misses = 0
+        self.resets = 0
+
+    def __contains__(self, key):
+        return key in self._waves
+
+    def __len__(self):
+        return len(self._waves)
+
+    def _pulses_used(self):
+        return sum(len(p) for _, p in self._waves.values())
+
+    def _fits(self, n_pulses):
+        pulses = self._pulses_used() + n_pulses
+        return (len(self._waves) < self.max_waves
+                and pulses <= self.max_pulses
+                and pulses * CBS_PER_PULSE <= self.max_cbs)
+
+    def _evict_one(self, keep):
+        for key, (wave_id, _) in self._waves.items():
+            if wave_id not in keep:
+                self.evict(key)
+                return True
+        return False
+
+    def evict(self, key):
+        wave_id, _ = self._waves.pop(key)
+        try:
+            self._pi.wave_delete(wave_id)
+        except pigpio.error:
+            pass
+
+    def get(self, key, build, keep=()):
+        """
+        Wave ID for key, calling build() for the pulse list on a miss.
+
+        keep: wave IDs that must not be evicted (the one on the output).
+        Returns a negative pigpio error code if the wave cannot be created.
+        """
+        entry = self._waves.get(key)
+        if entry is not None:
+            self._waves.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        pulses = build()
+        while not self._fits(len(pulses)) and self._evict_one(keep):
+            pass
+
+        wave_id = create_wave(self._pi, pulses)
+        if wave_id < 0:
+            return wave_id
+
+        self._waves[key] = (wave_id, pulses)
+        return wave_id
+
+    def pulses(self, key):
+        return self._waves[key][1]
+
+    def clear(self):
+        """Delete every cached wave."""
+        self._waves.clear()
+        self._pi.wave_clear()
+
+    def reset(self):
+        """Stop the output and delete every wave, freeing all wave memory."""
+        self._pi.wave_tx_stop()
+        self.clear()
+        self.resets += 1
+
+
 class SineWaveGenerator:
-    def __init__(self, pi, debug=False):
+    def __init__(self, pi, debug=False, seamless=True, exact=True,
+                 calibration=None, oversample=1, noise_shaping=False,
+                 backend=BACKEND_WAVE):
+        """ seamless=True hands frequency changes over on a cycle
+            boundary (WAVE_MODE_REPEAT_SYNC) instead of stopping the
+            output and starting the new wave.
+
+            exact=True builds multi-period waves (up to MAX_PERIODS)
+            so the average frequency is exact rather than 1 / a whole
+            number of µs.
+
+            calibration: CalSurface for the amplitude correction
+            (default CAL_SURFACE).
+
+            oversample, noise_shaping: PWM cells per sample and
+            sigma-delta rounding of the high times (set_pwm_mode).
+
+            backend: BACKEND_WAVE (DMA waves on PWM_GPIO) or BACKEND_DDS
+            (hardware PWM on DDS_GPIO with a duty-updating thread; low
+            frequencies only, DDS_MIN_FREQ..DDS_MAX_FREQ; no sweeps or
+            bursts). """
+        if backend not in (BACKEND_WAVE, BACKEND_DDS):
+            raise ValueError(f"unknown backend {backend!r}")
         self._pi = pi
-        self._frequency = MIN_FREQ
+        self._frequency = MIN_FREQ if backend == BACKEND_WAVE else DDS_MAX_FREQ
         self._amp_v = 0.0
         self._running = False
         self._wave_id = None
+        # Previous waves, possibly still on the output until the sync
+        # switch lands
+        self._retiring = set()
+        self._seamless = seamless
+        self._max_periods = MAX_PERIODS if exact else 1
+        self._calibration = CAL_SURFACE if calibration is None else calibration
         self._debug = debug
+        self._cache = WaveCache(pi)
+        self._oversample = int(oversample)
+        self._noise_shaping = bool(noise_shaping)
+        # (waveform, frequency, share, max_periods, oversample,
+        #  noise_shaping) -> SamplePlan
+        self._plans = {}
+        # None: sine; else normalised arbitrary samples (set_waveform)
+        self._samples = None
+        self._waveform = "sine"
+        # Running sweep: (steps, start time, duration_s, repeat)
+        self._sweep = None
+        self._sweep_stop = threading.Event()
+        self._sweep_thread = None
+        self._sweep_waves = []    # wave IDs the sweep chain plays
+        self._burst = None        # running Burst (start_burst)
+        self._backend = backend
+        self._dds_stop = threading.Event()
+        self._dds_thread = None
+        self._dds_table = None    # arbitrary samples as a list, or None
+        self._dds_stats = DdsStats(0, 0, 0.0)
+        self._dual = None         # DualOutput (set_dual) or None
 
         self._spi = pi.spi_open(SPI_CHANNEL, SPI_BAUD, 0)
 
         pi.set_mode(PWM_GPIO, pigpio.OUTPUT)
         pi.write(PWM_GPIO, 0)
 
-    def _get_samples(self):
-        f = self._frequency
-        if f <= 1500:
-            return 48
-        if f <= 3000:
-            return 32
-        if f <= 6000:
-            return 16
-        return 8
+    def _plan(self, frequency=None, share=WAVES_IN_BUDGET, max_periods=None):
+        """ SamplePlan for `frequency` (default the current one):
+            plan_samples with 1/share of the daemon's wave budget and up
+            to max_periods periods (default per the exact setting). """
+        frequency = self._frequency if frequency is None else frequency
+        max_periods = self._max_periods if max_periods is None else max_periods
+        key = (self._waveform, frequency, share, max_periods,
+               self._oversample, self._noise_shaping)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = plan_samples(frequency,
+                                self._cache.max_pulses // share,
+                                self._cache.max_cbs // share,
+                                max_periods=max_periods,
+                                samples=self._samples,
+                                oversample=self._oversample,
+                                noise_shaping=self._noise_shaping)
+            self._plans[key] = plan
+        return plan
 
     def _write_wiper0(self, step):
         step = int(_clamp(step, 0, MAX_WIPER_STEP))
@@ -127,165 +977,189 @@ class SineWaveGenerator:
         Exponential frequency correction.
         Keeps the smooth frequency trend correction in place.
         """
-        f = float(self._frequency)
-        corr = 0.4065 * ((f / 1000.0) ** 0.312)
-        return _clamp(corr, 0.30, 1.00)
-
-    def _find_bracketing_freqs(self, freq):
-        freqs = sorted(CAL_TABLES.keys())
-
-        if freq <= freqs[0]:
-            return freqs[0], freqs[0]
-        if freq >= freqs[-1]:
-            return freqs[-1], freqs[-1]
-
-        for i in range(1, len(freqs)):
-            if freq <= freqs[i]:
-                return freqs[i - 1], freqs[i]
-
-        return freqs[-1], freqs[-1]
+        return exp_correction(self._frequency)
 
     def _table_correction(self, amp):
         """Returns the calibrated amplitude value based on the
            set frequency using CAL_TABLES to do linear
            interpolation."""
-        # Find the left-bound and right-bound freqs of the set freq 
-        f0, f1 = self._find_bracketing_freqs(self._frequency)
-
-        def corr_at_freq(freq):
-            table = CAL_TABLES[freq]
-            xs = sorted(table.keys())
-            ys = [table[x] for x in xs]
-            return _interp(amp, xs, ys)
-
-        """ Use amp to find adjusted amp values for left-bound and
-            right-bound freqs. """
-        c0 = corr_at_freq(f0)
-        c1 = corr_at_freq(f1)
-
-        if f0 == f1:
-            return c0
-
-        frac = (self._frequency - f0) / (f1 - f0)
-        return c0 + frac * (c1 - c0)
+        return table_correction(self._frequency, amp)
 
-    def _amp_to_step(self, amp):
+    def _amp_to_step(self, amp, frequency=None):
         amp = self._snap_amplitude(amp)
+        frequency = self._frequency if frequency is None else frequency
 
-        exp_corr = self._exp_correction()
-        table_corr = self._table_correction(amp)
-
-        corrected_amp = table_corr * exp_corr
-        corrected_amp = _clamp(corrected_amp, 0.0, MAX_AMP)
+        corrected_amp = self._calibration.lookup(frequency, amp)
 
         if self._debug:
             print(
-                f"[Cal] freq={self._frequency}Hz "
+                f"[Cal] freq={frequency}Hz "
                 f"target={amp:.3f}Vpp "
-                f"exp={exp_corr:.3f} "
-                f"table={table_corr:.3f} "
+                f"exp={exp_correction(frequency):.3f} "
+                f"table={table_correction(frequency, amp):.3f} "
                 f"final={corrected_amp:.3f}"
             )
 
         step = round((corrected_amp / MAX_AMP) * MAX_WIPER_STEP)
         return int(_clamp(step, 0, MAX_WIPER_STEP))
 
-    def _build_wave(self):
-        """ Outputs the sine wave from the PWM GPIO pin using samples
-            in slot_list to switch the pin on/off based on duty cycle. """
-        n = self._get_samples()
-        lut = [math.sin(2 * math.pi * i / n) for i in range(n)]
-
-        period_us = 1_000_000.0 / self._frequency
-
-        slot_list = [] # contains the samples for storing time
-        acc = 0.0 # the ideal time elapsed in a period
-        used = 0 # the actual time used per sample
-
-        # Fill the slot list with approx pieces of the ideal period
-        for _ in range(n):
-            acc += period_us / n
-            slot = int(round(acc - used))
-            if slot < 1:
-                slot = 1
-            slot_list.append(slot)
-            used += slot
-
-        # The resulting slot list has an error compared to acc
-        target_total = int(round(period_us))
-        error = target_total - sum(slot_list)
-        slot_list[-1] += error
-
-        # If needed, fix the final slot time from 0 to 1
-        if slot_list[-1] < 1:
-            slot_list[-1] = 1
-
-        # Bit masks for turning the PWM GPIO on and off
-        on_mask = 1 << PWM_GPIO
-        off_mask = 1 << PWM_GPIO
-        # Stores the pulses in a list
-        pulses = []
-
-        # Find the duty cycle 
-        for sample, slot_us in zip(lut, slot_list):
-            # The duty cycle from a lut sample between 0 and 1
-            duty = _clamp(0.5 + 0.5 * sample, 0.0, 1.0)
-
-            # high and low pulses comprise the sample value
-            high_us = int(round(duty * slot_us))
-            low_us = slot_us - high_us
-
-            # high_us > 0 turns on the GPIO, low_us > 0 turns off the GPIO
-            if high_us > 0:
-                pulses.append(pigpio.pulse(on_mask, 0, high_us))
-            if low_us > 0:
-                pulses.append(pigpio.pulse(0, off_mask, low_us))
-
-        self._pi.wave_tx_stop()
-
-        if self._wave_id is not None:
-            try:
-                self._pi.wave_delete(self._wave_id)
-            except pigpio.error:
-                pass
-            self._wave_id = None
-
-        self._pi.wave_clear()
-        self._pi.wave_add_generic(pulses)
-        wave_id = self._pi.wave_create()
+    def _build_wave(self, frequency=None, share=WAVES_IN_BUDGET, max_periods=None):
+        """ Returns the packed pulses (build_pwm_pulses) that output the
+            planned number of periods of the waveform from the PWM GPIO
+            pin. """
+        frequency = self._frequency if frequency is None else frequency
+        plan = self._plan(frequency, share, max_periods)
+        if self._samples is None:
+            # Exact sine at every cell rather than interpolated
+            table, oversample = sine_table(plan.n * plan.oversample), 1
+        else:
+            table, oversample = resample_table(self._samples, plan.n), plan.oversample
+        if self._dual is None:
+            pulses = build_pwm_pulses(frequency, table, periods=plan.periods,
+                                      oversample=oversample,
+                                      noise_shaping=plan.shaped)
+        else:
+            pulses = build_dual_pulses(frequency, table, *self._dual,
+                                       periods=dual_periods(plan.periods, self._dual.ratio),
+                                       oversample=oversample,
+                                       noise_shaping=plan.shaped)
 
         if self._debug:
-            actual_period = sum(slot_list)
-            actual_freq = 1_000_000.0 / actual_period
             print(
-                f"[SineWave] req={self._frequency}Hz "
-                f"actual={actual_freq:.2f}Hz "
-                f"N={n} period={actual_period}us pulses={len(pulses)} wave_id={wave_id}"
+                f"[SineWave] wave={self._waveform} req={frequency}Hz "
+                f"actual={plan.frequency:.2f}Hz "
+                f"N={plan.n}x{plan.oversample}{' shaped' if plan.shaped else ''} "
+                f"periods={plan.periods} span={plan.span_us}us "
+                f"pulses={len(pulses)} "
+                f"min_slot={plan.min_slot_us}us thd={plan.thd:.1%}"
             )
 
-        return wave_id
+        return pulses
+
+    def _wave_key(self, frequency=None, share=WAVES_IN_BUDGET, max_periods=None):
+        frequency = self._frequency if frequency is None else frequency
+        plan = self._plan(frequency, share, max_periods)
+        return (self._waveform, frequency, plan.n, plan.periods,
+                plan.oversample, plan.shaped, self._dual)
 
-    def _apply(self):
+    def _apply(self, wave=True):
+        """ Writes the amplitude to the digipot and, with wave=True,
+            switches the output to the cached wave for the current
+            frequency (built on a miss).
+
+            Raises ValueError if the wave cannot be created even on an
+            empty daemon; the output is then stopped rather than left
+            on the previous wave. """
         step = self._amp_to_step(self._amp_v)
         self._write_wiper0(step)
 
-        wave_id = self._build_wave()
-        if wave_id < 0:
-            print(f"[SineWave] wave_create failed (error {wave_id})")
+        if not wave:
             return
 
-        self._pi.wave_send_repeat(wave_id)
-        self._wave_id = wave_id
+        if self._backend == BACKEND_DDS:
+            # The producer reads the frequency and table on every update
+            self._dds_table = None if self._samples is None else self._samples.tolist()
+            if self._dds_thread is None:
+                self._dds_stop.clear()
+                self._dds_thread = threading.Thread(target=self._dds_loop, daemon=True)
+                self._dds_thread.start()
+            return
+
+        self._check_switch()
+        keep = set(self._retiring)
+        if self._wave_id is not None:
+            keep.add(self._wave_id)
+        wave_id = self._cache.get(self._wave_key(), self._build_wave, keep)
+        if wave_id < 0:
+            # Wave memory fragmented by evictions: start over from an
+            # empty daemon, at the cost of one gap in the output
+            self._cache.reset()
+            self._wave_id = None
+            self._retiring.clear()
+            wave_id = self._cache.get(self._wave_key(), self._build_wave)
+        if wave_id < 0:
+            self.stop()
+            raise ValueError(f"wave_create failed at {self._frequency} Hz (error {wave_id})")
+
+        if wave_id != self._wave_id:
+            if self._seamless and self._wave_id is not None:
+                # The new wave starts when the current cycle ends; the
+                # old one stays protected until wave_tx_at() shows it.
+                self._pi.wave_send_using_mode(wave_id, pigpio.WAVE_MODE_REPEAT_SYNC)
+                self._retiring.add(self._wave_id)
+            else:
+                self._pi.wave_tx_stop()
+                self._pi.wave_send_repeat(wave_id)
+            self._wave_id = wave_id
 
         if self._debug:
             print(
                 f"[SineWave] applied freq={self._frequency}Hz "
-                f"amp={self._amp_v:.3f}Vpp step={step}"
+                f"amp={self._amp_v:.3f}Vpp step={step} wave_id={wave_id} "
+                f"cache={len(self._cache)} hits={self._cache.hits} "
+                f"misses={self._cache.misses}"
             )
 
+    def _dds_loop(self):
+        """ DDS producer: one hardware_PWM duty update per DDS_UPDATE_HZ
+            tick, sleeping on the stop event in between so the thread
+            yields the core (the wakeup jitter counts as lateness).
+            An update that is late is not made up; the phase comes from
+            the clock, so lateness costs resolution, not frequency. """
+        interval = 1.0 / DDS_UPDATE_HZ
+        phase = 0.0
+        updates = late = 0
+        start = last = deadline = time.perf_counter()
+        while not self._dds_stop.is_set():
+            now = time.perf_counter()
+            phase = (phase + self._frequency * (now - last)) % 1.0
+            last = now
+            table = self._dds_table
+            if table is None:
+                value = math.sin(2 * math.pi * phase)
+            else:
+                pos = phase * len(table)
+                i = int(pos)
+                value = table[i] + (pos - i) * (table[(i + 1) % len(table)] - table[i])
+            duty = int(_clamp(0.5 + 0.5 * value, 0.0, 1.0) * DDS_DUTY_MAX)
+            self._pi.hardware_PWM(DDS_GPIO, DDS_CARRIER_HZ, duty)
+            updates += 1
+
+            deadline += interval
+            now = time.perf_counter()
+            if now > deadline:
+                late += 1
+                deadline = now
+            self._dds_stats = DdsStats(updates, late, updates / (now - start or interval))
+            if self._dds_stop.wait(deadline - now):
+                break
+
+    def _stop_dds(self):
+        if self._dds_thread is None:
+            return
+        self._dds_stop.set()
+        self._dds_thread.join()
+        self._dds_thread = None
+        self._pi.hardware_PWM(DDS_GPIO, 0, 0)
+
+    def _check_switch(self):
+        """ Releases the retiring waves once the output is on the
+            current wave. """
+        if not self._retiring:
+            return
+        if self._pi.wave_tx_at() == self._wave_id:
+            self._retiring.clear()
+
     def set_frequency(self, frequency):
-        snapped = round(int(frequency) / FREQ_STEP) * FREQ_STEP
-        self._frequency = int(_clamp(snapped, MIN_FREQ, MAX_FREQ))
+        """ Snaps to the backend's step and clamps to its range:
+            MIN_FREQ..MAX_FREQ by FREQ_STEP for waves,
+            DDS_MIN_FREQ..DDS_MAX_FREQ by DDS_FREQ_STEP for DDS. """
+        if self._backend == BACKEND_DDS:
+            low, high, step = DDS_MIN_FREQ, DDS_MAX_FREQ, DDS_FREQ_STEP
+        else:
+            low, high, step = MIN_FREQ, MAX_FREQ, FREQ_STEP
+        snapped = round(int(frequency) / step) * step
+        self._frequency = int(_clamp(snapped, low, high))
 
         if self._running:
             self._apply()
@@ -293,34 +1167,292 @@ class SineWaveGenerator:
         if self._debug:
             print(f"[SineWave] frequency -> {self._frequency} Hz")
 
+    def set_waveform(self, samples=None):
+        """ Output one period of `samples` (any length, normalised to the
+            amplitude setting) instead of the sine; None goes back to the
+            sine.  Compiled waves are cached by content hash, so setting
+            the same samples again reuses them. """
+        if samples is None:
+            self._samples, self._waveform = None, "sine"
+        else:
+            self._samples = normalize_samples(samples)
+            self._waveform = waveform_key(self._samples)
+
+        if self._running:
+            self._apply()
+
+        if self._debug:
+            print(f"[SineWave] waveform -> {self._waveform}")
+
+    def set_pwm_mode(self, oversample=1, noise_shaping=False):
+        """ PWM cells per sample (carrier at oversample * N * f) and
+            sigma-delta rounding of the high times; see pwm_mode_report()
+            for the THD and pulse cost of each setting.  Waves already
+            built for another mode stay cached. """
+        self._oversample = max(1, int(oversample))
+        self._noise_shaping = bool(noise_shaping)
+
+        if self._running:
+            self._apply()
+
+        if self._debug:
+            print(f"[SineWave] pwm mode -> x{self._oversample} "
+                  f"shaping={self._noise_shaping}")
+
+    def set_dual(self, ratio=1, phase_deg=0.0):
+        """ Also output a square on DUAL_GPIO from the same wave, at
+            `ratio` times the frequency (a Fraction, denominator up to
+            DUAL_MAX_DENOMINATOR, within DUAL_RATIOS' range), its rising
+            edge phase_deg of the sine period after the sine's phase 0.
+            None turns the square channel off.  Stop the square wave
+            generator first: pigpiod runs either hardware PWM or waves,
+            starting one cancels the other.  Wave backend only; raises
+            ValueError otherwise. """
+        if ratio is None:
+            dual = None
+        else:
+            if self._backend != BACKEND_WAVE:
+                raise ValueError("dual output needs the wave backend")
+            ratio = Fraction(ratio)
+            if (ratio.denominator > DUAL_MAX_DENOMINATOR
+                    or not min(DUAL_RATIOS) <= ratio <= max(DUAL_RATIOS)):
+                raise ValueError(f"unsupported square / sine ratio {ratio}")
+            dual = DualOutput(ratio, float(phase_deg) % 360.0)
+
+        was_dual = self._dual is not None
+        self._dual = dual
+        if self._running:
+            if dual is not None:
+                self._pi.set_mode(DUAL_GPIO, pigpio.OUTPUT)
+            self._apply()
+            if was_dual and dual is None:
+                self._pi.write(DUAL_GPIO, 0)
+
+        if self._debug:
+            print(f"[SineWave] dual -> {dual}")
+
     def set_amplitude(self, amplitude_vpp):
         self._amp_v = self._snap_amplitude(amplitude_vpp)
 
+        # The wave does not depend on amplitude: one SPI write
         if self._running:
-            self._apply()
+            self._apply(wave=False)
 
         if self._debug:
             print(f"[SineWave] amplitude -> {self._amp_v:.3f} Vpp")
 
+    def start_sweep(self, f_start=MIN_FREQ, f_stop=MAX_FREQ, dwell_s=SWEEP_DWELL_S,
+                    steps=None, log=False, repeat=False):
+        """
+        Sweep the output from f_start to f_stop, dwell_s per step
+        (rounded to whole waves, at least one).  steps / log as for
+        sweep_frequencies().  repeat=True loops the sweep until stop().
+
+        A chirp is a sweep with dwell_s=0: each step plays its wave once
+        and needs no loop counter, so up to SWEEP_MAX_STEPS steps fit.
+        Chirp steps are single-period waves, so every step lasts one
+        period and the chirp rate is even.
+
+        All step waves are created first and played by one wave_chain,
+        so step changes are gapless and DMA-timed; a helper thread only
+        follows the schedule to update the amplitude calibration per
+        step.  The step waves get the daemon to themselves: the wave
+        cache is cleared first and they are deleted on stop().  Returns
+        the list of SweepStep.  Raises ValueError if the sweep does not
+        fit a chain or the daemon.
+        """
+        if self._backend != BACKEND_WAVE or self._dual is not None:
+            raise ValueError("sweeps need the single-channel wave backend")
+        freqs = sweep_frequencies(f_start, f_stop, steps, log)
+        if len(freqs) > SWEEP_MAX_STEPS:
+            raise ValueError(f"{len(freqs)} sweep steps, max {SWEEP_MAX_STEPS}")
+        self.stop()
+        # Cached waves would fragment the daemon's wave memory under the
+        # sweep's (see WaveCache); start from an empty one
+        self._cache.clear()
+
+        # Every step's wave is on the DMA engine at once
+        share = max(WAVES_IN_BUDGET, len(freqs))
+        max_periods = 1 if dwell_s == 0 else None
+        sweep = []
+        for f in freqs:
+            wave_id = create_wave(self._pi, self._build_wave(f, share, max_periods))
+            if wave_id < 0:
+                self._delete_sweep_waves()
+                raise ValueError(f"wave_create failed at {f} Hz (error {wave_id})")
+            self._sweep_waves.append(wave_id)
+            span_s = self._plan(f, share, max_periods).span_us / 1_000_000
+            loops = int(_clamp(round(dwell_s / span_s), 1, CHAIN_LOOP_MAX))
+            sweep.append(SweepStep(f, wave_id, loops, loops * span_s))
+
+        try:
+            chain = sweep_chain(sweep, repeat)
+        except ValueError:
+            self._delete_sweep_waves()
+            raise
+        self._write_wiper0(self._amp_to_step(self._amp_v, freqs[0]))
+        err = self._pi.wave_chain(chain)
+        if err < 0:
+            self._delete_sweep_waves()
+            raise ValueError(f"wave_chain failed (error {err})")
+
+        duration = sum(step.dwell_s for step in sweep)
+        self._sweep = (sweep, time.monotonic(), duration, repeat)
+        self._sweep_stop.clear()
+        self._sweep_thread = threading.Thread(target=self._follow_sweep,
+                                              name="sine-sweep", daemon=True)
+        self._sweep_thread.start()
+
+        if self._debug:
+            print(f"[SineWave] sweep {freqs[0]}->{freqs[-1]}Hz steps={len(sweep)} "
+                  f"duration={duration:.3f}s chain={len(chain)} repeat={repeat}")
+        return sweep
+
+    def _follow_sweep(self):
+        """ Writes the calibrated amplitude for each step as the chain
+            reaches it.  The wave timing does not depend on this. """
+        last = None
+        while not self._sweep_stop.wait(SWEEP_POLL_S):
+            prog = self.sweep_progress()
+            if prog is None or prog.done:
+                return
+            key = (prog.step, self._amp_v)
+            if key != last:
+                self._write_wiper0(self._amp_to_step(self._amp_v, prog.frequency))
+                last = key
+
+    def sweep_progress(self):
+        """ SweepProgress of the running sweep, or None.  Computed from
+            the step schedule and the time since the chain started. """
+        sweep = self._sweep
+        if sweep is None:
+            return None
+        steps, start, duration, repeat = sweep
+        elapsed = time.monotonic() - start
+        if repeat:
+            elapsed %= duration
+        elif elapsed >= duration:
+            return SweepProgress(len(steps) - 1, len(steps), steps[-1].frequency, 1.0, True)
+
+        t = 0.0
+        for i, step in enumerate(steps):
+            t += step.dwell_s
+            if elapsed < t:
+                break
+        return SweepProgress(i, len(steps), step.frequency, elapsed / duration, False)
+
+    def _delete_sweep_waves(self):
+        """ Deletes the sweep's waves, highest ID first so pigpiod gets
+            all of their memory back.  Only once the chain has stopped. """
+        for wave_id in sorted(self._sweep_waves, reverse=True):
+            self._pi.wave_delete(wave_id)
+        self._sweep_waves = []
+
+    def _stop_sweep(self):
+        self._sweep_stop.set()
+        thread = self._sweep_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._sweep_thread = None
+        self._sweep = None
+
+    def _idle_wave(self, span_us, slot_us, keep):
+        """ Wave ID of span_us µs of 50 % duty (0 V after the filter) in
+            slots of about slot_us. """
+        n = max(2, int(span_us // max(slot_us, 2 * MIN_SLOT_US)) // 2 * 2)
+        key = ("idle", span_us, n)
+        return self._cache.get(
+            key, lambda: build_pwm_pulses(1_000_000.0 / span_us, np.zeros(n)), keep)
+
+    def start_burst(self, cycles=BURST_CYCLES, period_s=BURST_PERIOD_S):
+        """
+        Repeated bursts: `cycles` periods of the waveform, then 0 V (50 %
+        duty) until the next burst, every period_s, until stop().
+
+        Burst and idle times are whole waves and delays in one looped
+        wave_chain, so they are DMA-timed to the µs; the burst always
+        starts at phase 0.  Returns the Burst actually produced.  Raises
+        ValueError if the burst is longer than the period.
+        """
+        if self._backend != BACKEND_WAVE or self._dual is not None:
+            raise ValueError("bursts need the single-channel wave backend")
+        self.stop()
+        f = self._frequency
+        cycles = max(1, int(cycles))
+
+        # The burst wave must hold a whole number of cycles
+        plan = self._plan(f)
+        max_periods = None
+        if cycles % plan.periods:
+            max_periods = 1
+            plan = self._plan(f, max_periods=1)
+        keep = set()
+        on_id = self._cache.get(self._wave_key(f, max_periods=max_periods),
+                                lambda: self._build_wave(f, max_periods=max_periods), keep)
+        if on_id < 0:
+            raise ValueError(f"wave_create failed (error {on_id})")
+        keep.add(on_id)
+        on_loops = cycles // plan.periods
+        on_us = on_loops * plan.span_us
+
+        period_us = int(round(period_s * 1_000_000))
+        gap_us = period_us - on_us
+        if gap_us < 0:
+            raise ValueError(f"{cycles} cycles take {on_us} us, longer than the period")
+
+        # Idle: whole one-period idle waves, then a shorter tail wave
+        slot_us = plan.span_us / (plan.n * plan.oversample * plan.periods)
+        unit_us = int(round(1_000_000 / f))
+        chain = [255, 0] + chain_loop(on_id, on_loops)
+        idle_loops, tail_us = divmod(gap_us, unit_us)
+        if idle_loops:
+            idle_id = self._idle_wave(unit_us, slot_us, keep)
+            keep.add(idle_id)
+            chain += chain_loop(idle_id, idle_loops)
+        if tail_us >= 2 * MIN_SLOT_US:
+            tail_id = self._idle_wave(tail_us, slot_us, keep)
+            keep.add(tail_id)
+            chain.append(tail_id)
+        elif tail_us:
+            chain += chain_delay(tail_us)
+        chain += [255, 3]
+        check_chain(chain)
+
+        self._write_wiper0(self._amp_to_step(self._amp_v))
+        err = self._pi.wave_chain(chain)
+        if err < 0:
+            raise ValueError(f"wave_chain failed (error {err})")
+        burst = Burst(cycles, plan.frequency, on_us, period_us)
+        self._burst = burst
+        if self._debug:
+            print(f"[SineWave] burst {burst} chain={len(chain)}")
+        return burst
+
     def start(self):
+        # A sweep or burst chain may be playing cached waves
+        if self._sweep is not None or self._burst is not None:
+            self.stop()
         self._running = True
+        if self._dual is not None:
+            self._pi.set_mode(DUAL_GPIO, pigpio.OUTPUT)
         self._apply()
 
         if self._debug:
             print("[SineWave] started")
 
     def stop(self):
+        """ Stops the output or sweep; created waves stay cached for the
+            next start. """
+        self._stop_sweep()
+        self._stop_dds()
+        self._burst = None
         self._pi.wave_tx_stop()
+        self._delete_sweep_waves()
         self._pi.write(PWM_GPIO, 0)
-
-        if self._wave_id is not None:
-            try:
-                self._pi.wave_delete(self._wave_id)
-            except pigpio.error:
-                pass
-            self._wave_id = None
-
-        self._pi.wave_clear()
+        if self._dual is not None:
+            self._pi.write(DUAL_GPIO, 0)
+        self._wave_id = None
+        self._retiring.clear()
         self._running = False
 
         if self._debug:
@@ -328,6 +1460,7 @@ class SineWaveGenerator:
 
     def cleanup(self):
         self.stop()
+        self._cache.clear()
         self._pi.spi_close(self._spi)
 
     @property
@@ -338,6 +1471,45 @@ class SineWaveGenerator:
     def amplitude(self):
         return self._amp_v
 
+    @property
+    def waveform(self):
+        """ "sine" or the content hash of the arbitrary samples. """
+        return self._waveform
+
+    @property
+    def sweeping(self):
+        return self._sweep is not None
+
+    @property
+    def burst(self):
+        """ The running Burst, or None. """
+        return self._burst
+
+    @property
+    def dual(self):
+        """ DualOutput of the square channel, or None. """
+        return self._dual
+
+    @property
+    def backend(self):
+        return self._backend
+
+    @property
+    def dds_stats(self):
+        """ DdsStats of the DDS producer (the last run once stopped). """
+        return self._dds_stats
+
+    @property
+    def pwm_mode(self):
+        """ (oversample, noise_shaping) """
+        return self._oversample, self._noise_shaping
+
+    @property
+    def plan(self):
+        """ SamplePlan in use: N, periods, actual frequency and error,
+            quantisation error. """
+        return self._plan()
+
 
 if __name__ == "__main__":
     import time
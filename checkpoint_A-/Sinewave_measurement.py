@@ -1,45 +1,337 @@
+import math
+import os
 import pigpio
+import select
+import threading
 import time
-from collections import deque
+from collections import deque, namedtuple
+
+import numpy as np
 
 GPIO_PIN   = 5    # Comparator output -> Pi GPIO 5
 MIN_DT_US       = 50   # ignore pulses shorter than 50µs
 BUFFER_LEN      = 32   # rolling average over last 32 periods
 EDGE_DIVISOR    = 1   # comparator fires 2 edges per sine cycle — divide out
 
+# Measurement modes.  Reciprocal times every period from callback ticks;
+# gated counts edges over a gate window, for inputs fast enough that
+# per-edge Python work would drop edges.  Auto switches between them with
+# hysteresis.
+#
+# Gated mode reads the daemon's notification pipe (/dev/pigpio<handle>)
+# in PIPE_READ_CHUNK blocks and counts rising edges with NumPy, so there
+# is no Python per edge, and the gate is timed by the ticks of its first
+# and last edges.  The pipe only exists next to pigpiod; elsewhere (a
+# remote daemon, fake_pi) gated mode falls back to pigpio's callback
+# tally, which still runs Python for every edge on pigpio's thread, with
+# the gate timed by time.monotonic().
+MODE_AUTO       = "auto"
+MODE_RECIPROCAL = "reciprocal"
+MODE_GATED      = "gated"
+
+GATED_ABOVE_HZ      = 2500
+RECIPROCAL_BELOW_HZ = 1500
+
+# Gate length for TARGET_RESOLUTION: at least 1/TARGET_RESOLUTION counts,
+# and long enough that GATE_TIMING_S (the notification-delivery jitter on
+# when the tally is read) is within it too.
+TARGET_RESOLUTION = 0.001
+GATE_TIMING_S     = 0.0005
+MIN_GATE_S        = GATE_TIMING_S / TARGET_RESOLUTION
+
+PIPE_READ_CHUNK = 64 * 1024
+PIPE_POLL_S     = 0.05
+
+# frequency / uncertainty in Hz over the last BUFFER_LEN periods (or the
+# last gate); mean, jitter (std dev), min and max period in µs; min/max
+# and edges count everything since the last reset()
+FrequencySnapshot = namedtuple("FrequencySnapshot", [
+    "frequency", "uncertainty", "mean_period_us", "jitter_us",
+    "min_period_us", "max_period_us", "edges", "periods", "mode",
+], defaults=(MODE_RECIPROCAL,))
+
 
 class FrequencyMeter:
-    """ Calculate the frequency of a sine wave on a button press."""
-    def __init__(self, pi, gpio_pin=GPIO_PIN):
+    """ Calculate the frequency of a sine wave on a button press.
+
+    The edge callback is O(1): the window of periods keeps a running sum
+    and a Welford mean/variance that is updated as periods enter and
+    leave, so nothing is re-summed per edge.  It takes no lock; _seq is
+    odd while an update is in progress and snapshot() retries until it
+    reads a stable state.
+
+    In gated mode the edges are counted from the notification pipe (or
+    tallied); snapshot() closes the gate once it has run for its length
+    and reports the count rate.
+    """
+    def __init__(self, pi, gpio_pin=GPIO_PIN, mode=MODE_AUTO):
+        if mode not in (MODE_AUTO, MODE_RECIPROCAL, MODE_GATED):
+            raise ValueError(f"unknown mode {mode!r}")
         self.pi        = pi
         self.gpio_pin  = gpio_pin
+        self.mode      = mode
         self.last_tick = None
-        self.frequency = 0.0
         # The buffer stores number of periods to average (update) frequency
         self._buf      = deque(maxlen=BUFFER_LEN)
+        self._seq      = 0
+        self._reset_pending = False
+        self._reset_stats()
+        self.cb        = None
+        self._last_snap = None
+        self._pipe     = None     # (notify handle, fd) in gated mode
+        self._pipe_thread = None
+        self._pipe_stop = threading.Event()
+        # (rising edges, tick of the last one) counted from the pipe
+        self._pipe_state = (0, None)
 
         # 1 sine wave cycle = 2 ticks, so seek rising edge
         pi.set_mode(self.gpio_pin, pigpio.INPUT)
-        self.cb = pi.callback(self.gpio_pin, pigpio.RISING_EDGE, self._cb)
+        self._start(MODE_GATED if mode == MODE_GATED else MODE_RECIPROCAL)
+
+    def _start(self, active):
+        self._stop_counting()
+        self.active = active
+        if active == MODE_RECIPROCAL:
+            self._reset_pending = True
+            self.cb = self.pi.callback(self.gpio_pin, pigpio.RISING_EDGE, self._cb)
+        else:
+            self._gate_tick = None
+            if not self._open_pipe():
+                # No func: pigpio just tallies the edges
+                self.cb = self.pi.callback(self.gpio_pin, pigpio.RISING_EDGE)
+            self._gate_count = self._count()
+            self._gate_t = time.monotonic()
+            self._gate_s = MIN_GATE_S
+            self._gate_result = None
+            self._gated_edges = 0
+
+    def _stop_counting(self):
+        if self.cb is not None:
+            self.cb.cancel()
+            self.cb = None
+        if self._pipe is not None:
+            self._pipe_stop.set()
+            self._pipe_thread.join()
+            handle, fd = self._pipe
+            self.pi.notify_close(handle)
+            os.close(fd)
+            self._pipe = None
+
+    def _open_pipe(self):
+        """Start counting from the notification pipe; False if there is none."""
+        if not hasattr(self.pi, "notify_open"):
+            return False
+        handle = self.pi.notify_open()
+        if handle < 0:
+            return False
+        try:
+            fd = os.open(f"/dev/pigpio{handle}", os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            # Remote daemon: the pipe is on the other machine
+            self.pi.notify_close(handle)
+            return False
+        self._pipe = (handle, fd)
+        self._pipe_state = (0, None)
+        self._pipe_stop.clear()
+        self._pipe_thread = threading.Thread(target=self._read_pipe, args=(fd,),
+                                             name="freq-gate", daemon=True)
+        self._pipe_thread.start()
+        self.pi.notify_begin(handle, 1 << self.gpio_pin)
+        return True
+
+    def _read_pipe(self, fd):
+        """Count rising edges a chunk of notification records at a time."""
+        # edge_analysis imports this module for GPIO_PIN
+        from edge_analysis import NTFY_FLAGS_MASK, RECORD_DTYPE
+
+        size = RECORD_DTYPE.itemsize
+        pending = b""
+        last_level = None
+        while not self._pipe_stop.is_set():
+            ready, _, _ = select.select([fd], [], [], PIPE_POLL_S)
+            if not ready:
+                continue
+            try:
+                data = pending + os.read(fd, PIPE_READ_CHUNK)
+            except BlockingIOError:
+                continue
+            whole = len(data) - len(data) % size
+            pending = data[whole:]
+            records = np.frombuffer(data[:whole], dtype=RECORD_DTYPE)
+            records = records[(records["flags"] & NTFY_FLAGS_MASK) == 0]
+            if len(records) == 0:
+                continue
+            levels = ((records["level"] >> self.gpio_pin) & 1).astype(np.int8)
+            before = np.empty_like(levels)
+            before[0] = levels[0] if last_level is None else last_level
+            before[1:] = levels[:-1]
+            rising = np.flatnonzero((levels == 1) & (before == 0))
+            last_level = levels[-1]
+            if len(rising):
+                count, _ = self._pipe_state
+                self._pipe_state = (count + len(rising),
+                                    int(records["tick"][rising[-1]]))
+
+    def _count(self):
+        if self._pipe is not None:
+            return self._pipe_state[0]
+        return self.cb.tally()
+
+    def _reset_stats(self):
+        self._buf.clear()
+        self.last_tick = None
+        self._sum     = 0
+        self._mean    = 0.0
+        self._m2      = 0.0
+        self._min_dt  = math.inf
+        self._max_dt  = 0
+        self._edges   = 0
+
+    def reset(self):
+        """Clear the statistics; applied by the callback on the next edge."""
+        self._reset_pending = True
 
     def _cb(self, gpio, level, tick):
-        if self.last_tick is not None:
-            dt = pigpio.tickDiff(self.last_tick, tick)
+        # Hot path: runs on pigpio's thread for every edge, so the window
+        # update is inlined (Welford add, plus the inverse update for the
+        # period that drops out) rather than split into helper calls.
+        self._seq += 1
+        if self._reset_pending:
+            self._reset_pending = False
+            self._reset_stats()
+        self._edges += 1
+        last = self.last_tick
+        self.last_tick = tick
+        if last is not None:
+            dt = (tick - last) & 0xFFFFFFFF
             # On button press, change avg_dt to update frequency
             if dt >= MIN_DT_US:
-                self._buf.append(dt)
-                avg_dt = sum(self._buf) / len(self._buf)
-                self.frequency = (1_000_000.0 / avg_dt) / EDGE_DIVISOR
+                buf = self._buf
+                mean = self._mean
+                m2 = self._m2
+                if len(buf) == BUFFER_LEN:
+                    old = buf.popleft()
+                    self._sum -= old
+                    new_mean = (mean * BUFFER_LEN - old) / (BUFFER_LEN - 1)
+                    m2 -= (old - mean) * (old - new_mean)
+                    mean = new_mean
+                buf.append(dt)
+                self._sum += dt
+                delta = dt - mean
+                mean += delta / len(buf)
+                self._m2 = m2 + delta * (dt - mean)
+                self._mean = mean
 
-        self.last_tick = tick
+                if dt < self._min_dt:
+                    self._min_dt = dt
+                if dt > self._max_dt:
+                    self._max_dt = dt
+        self._seq += 1
+
+    @property
+    def frequency(self):
+        return self.snapshot().frequency
 
     def get_frequency(self):
         return self.frequency
 
+    def _poll_gate(self):
+        """Close the gate if it has run its length and start the next."""
+        now = time.monotonic()
+        if self._pipe is not None:
+            count, tick = self._pipe_state
+            if self._gate_tick is None:
+                # Gates run from edge to edge: wait for the opening one
+                if tick is not None:
+                    self._gate_count, self._gate_tick, self._gate_t = count, tick, now
+                return
+        if now - self._gate_t < self._gate_s:
+            return
+        if self._pipe is not None:
+            n = count - self._gate_count
+            if n:
+                # n whole periods between the opening and the last edge
+                gate, timed = ((tick - self._gate_tick) & 0xFFFFFFFF) / 1_000_000, True
+                self._gate_tick = tick
+            else:
+                gate, timed = now - self._gate_t, False
+        else:
+            count = self.cb.tally()
+            n = count - self._gate_count
+            gate, timed = now - self._gate_t, False
+        self._gate_count, self._gate_t = count, now
+        self._gated_edges += n
+        self._gate_result = (n, gate, timed)
+        freq = n / gate if gate > 0 else 0.0
+        if freq > 0:
+            self._gate_s = max(MIN_GATE_S, 1.0 / (TARGET_RESOLUTION * freq))
+
+    def _gated_snapshot(self):
+        self._poll_gate()
+        if self._gate_result is None:
+            return None
+        n, gate, timed = self._gate_result
+        if n == 0 or gate <= 0:
+            return FrequencySnapshot(0.0, 0.0, 0.0, 0.0, 0, 0,
+                                     self._gated_edges, 0, MODE_GATED)
+        freq = (n / gate) / EDGE_DIVISOR
+        if timed:
+            # Edge to edge: only the 1 µs tick at either end
+            uncertainty = freq * 1e-6 / gate
+        else:
+            # +/-1 count, plus the uncertainty in when the gate opened and closed
+            uncertainty = freq * (1.0 / n + GATE_TIMING_S / gate)
+        period = 1_000_000.0 / freq
+        return FrequencySnapshot(freq, uncertainty, period, 0.0, 0, 0,
+                                 self._gated_edges, n, MODE_GATED)
+
+    def snapshot(self):
+        """FrequencySnapshot from the active mode, switching mode in auto."""
+        if self.active == MODE_GATED:
+            snap = self._gated_snapshot()
+            if snap is None:
+                # First gate still open: keep showing the last reading
+                return self._last_snap or FrequencySnapshot(
+                    0.0, 0.0, 0.0, 0.0, 0, 0, 0, 0, MODE_GATED)
+            if self.mode == MODE_AUTO and snap.frequency < RECIPROCAL_BELOW_HZ:
+                self._start(MODE_RECIPROCAL)
+        else:
+            if self._reset_pending and self._last_snap is not None:
+                # Just switched back: no period measured yet
+                return self._last_snap
+            snap = self._reciprocal_snapshot()
+            if self.mode == MODE_AUTO and snap.frequency > GATED_ABOVE_HZ:
+                self._start(MODE_GATED)
+        self._last_snap = snap
+        return snap
+
+    def _reciprocal_snapshot(self):
+        """Consistent snapshot of the period statistics."""
+        while True:
+            seq = self._seq
+            if seq & 1:
+                time.sleep(0)
+                continue
+            n = len(self._buf)
+            total, m2 = self._sum, self._m2
+            min_dt, max_dt, edges = self._min_dt, self._max_dt, self._edges
+            if self._seq == seq:
+                break
+
+        if n == 0 or total <= 0:
+            return FrequencySnapshot(0.0, 0.0, 0.0, 0.0, 0, 0, edges, 0)
+        avg_dt = total / n
+        freq = (1_000_000.0 / avg_dt) / EDGE_DIVISOR
+        var = max(m2, 0.0) / (n - 1) if n > 1 else 0.0
+        jitter = var ** 0.5
+        # Standard error of the mean period plus the 1 µs tick quantisation
+        # spread over the n periods the window spans.
+        u_period = (var / n) ** 0.5 + 1.0 / n
+        return FrequencySnapshot(freq, freq * u_period / avg_dt, avg_dt, jitter,
+                                 min_dt, max_dt, edges, n)
+
     def cleanup(self):
-        if self.cb is not None:
-            self.cb.cancel()
-            self.cb = None
+        self._stop_counting()
 
 
 if __name__ == "__main__":
@@ -51,9 +343,10 @@ if __name__ == "__main__":
 
     try:
         while True:
-            freq = meter.get_frequency()
-            if freq > 0:
-                print(f"Frequency: {freq:.2f} Hz")
+            snap = meter.snapshot()
+            if snap.frequency > 0:
+                print(f"Frequency: {snap.frequency:.2f} +/- {snap.uncertainty:.2f} Hz  "
+                      f"jitter={snap.jitter_us:.1f} us  edges={snap.edges}")
             else:
                 print("No signal")
             time.sleep(0.5)
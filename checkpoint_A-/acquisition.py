@@ -0,0 +1,131 @@
+"""
+acquisition.py
+Background acquisition for the live measurement screens.
+
+A worker thread calls a blocking measurement function over and over
+and stores timestamped readings in a fixed-size ring buffer.  The UI
+loop only calls latest(), so the encoder and button keep being
+serviced every 50 ms no matter how long one conversion takes.
+
+Usage:
+  acq = AcquisitionService(lambda: tracker.read(), interval=0.1)
+  acq.start()
+  ...
+  reading = acq.latest()        # Reading(seq, t, value) or None
+  ...
+  acq.stop()
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+RING_SIZE = 64
+ERROR_BACKOFF_S = 0.2
+
+# seq: running count of readings, t: time.monotonic() when it finished
+Reading = namedtuple("Reading", ["seq", "t", "value"])
+
+
+class RingBuffer:
+    """Fixed-size, thread-safe buffer that keeps the newest items."""
+
+    def __init__(self, size=RING_SIZE):
+        self._buf = [None] * size
+        self._size = size
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, item):
+        with self._lock:
+            self._buf[self._count % self._size] = item
+            self._count += 1
+
+    def latest(self):
+        with self._lock:
+            if self._count == 0:
+                return None
+            return self._buf[(self._count - 1) % self._size]
+
+    def items(self):
+        """Oldest-to-newest copy of what is currently held."""
+        with self._lock:
+            n = min(self._count, self._size)
+            start = self._count - n
+            return [self._buf[i % self._size] for i in range(start, self._count)]
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+
+    def __len__(self):
+        with self._lock:
+            return min(self._count, self._size)
+
+
+class AcquisitionService:
+    def __init__(self, measure_fn, interval=0.0, size=RING_SIZE, name="acq"):
+        """
+        measure_fn : blocking function returning one reading value
+        interval   : minimum time between the start of two measurements
+        size       : ring buffer length
+        """
+        self._measure = measure_fn
+        self._interval = interval
+        self._name = name
+        self.buffer = RingBuffer(size)
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_error = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop the worker and wait for the conversion in progress."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                value = self._measure()
+            except Exception as e:
+                self.last_error = e
+                print(f"[{self._name}] measurement failed: {e}")
+                self._stop.wait(ERROR_BACKOFF_S)
+                continue
+
+            self._seq += 1
+            self.buffer.append(Reading(self._seq, time.monotonic(), value))
+
+            remaining = self._interval - (time.monotonic() - started)
+            if remaining > 0:
+                self._stop.wait(remaining)
+
+    def latest(self):
+        """Newest Reading, or None before the first one completes."""
+        return self.buffer.latest()
+
+    def readings(self):
+        return self.buffer.items()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
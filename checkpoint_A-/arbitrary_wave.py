@@ -0,0 +1,77 @@
+"""
+arbitrary_wave.py
+Sample tables for the arbitrary-waveform mode of SineWaveGenerator.
+
+Each function returns one period as a NumPy array; the generator
+normalises it to -1..1 (the amplitude setting gives the Vpp), resamples
+it to the planned N and compiles it with the same slot/duty engine as
+the sine.  Compiled waves are cached by a hash of the samples.
+
+Usage:
+  sine_gen.set_waveform(triangle())
+  sine_gen.set_waveform(load_csv("arb_wave.csv"))
+  sine_gen.set_waveform(None)          # back to sine
+"""
+
+import csv
+import math
+import os
+
+import numpy as np
+
+ARB_POINTS = 256
+PULSE_DUTY = 0.25
+
+ARB_CSV_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "arb_wave.csv"
+)
+
+
+def triangle(n=ARB_POINTS):
+    """Rises from the minimum at phase 0 to the peak at 0.5 and back."""
+    phase = np.arange(n) / n
+    return 1.0 - 4.0 * np.abs(phase - 0.5)
+
+
+def sawtooth(n=ARB_POINTS):
+    """Rising ramp over the period, dropping back at the wrap."""
+    return 2.0 * np.arange(n) / n - 1.0
+
+
+def pulse_train(duty=PULSE_DUTY, n=ARB_POINTS):
+    """High for the first `duty` of the period, low for the rest."""
+    return np.where(np.arange(n) < round(duty * n), 1.0, -1.0)
+
+
+def load_csv(path=ARB_CSV_PATH, column=-1):
+    """
+    One period of samples from a CSV file, one row per sample.
+
+    column picks the value column (default the last, so both "value"
+    and "time,value" files work).  Rows whose value is not a number,
+    such as a header, are skipped.  Raises ValueError for a nan or inf
+    value, which float() accepts but the wave builder cannot use.
+    """
+    values = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            try:
+                value = float(row[column])
+            except (ValueError, IndexError):
+                continue
+            if not math.isfinite(value):
+                raise ValueError(f"{path}: sample {len(values)} is {row[column].strip()}")
+            values.append(value)
+    if len(values) < 2:
+        raise ValueError(f"{path}: need at least two samples")
+    return np.array(values)
+
+
+# Menu name -> sample function (the CSV entry is handled by the caller)
+SHAPES = {
+    "Triangle": triangle,
+    "Sawtooth": sawtooth,
+    "Pulse 25%": pulse_train,
+}
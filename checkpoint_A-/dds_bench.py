@@ -0,0 +1,144 @@
+"""
+dds_bench.py
+Compare the two SineWaveGenerator backends on the same settings against
+fake_pi.FakePi.
+
+  wave : DMA waves from _build_wave (BACKEND_WAVE)
+  dds  : hardware PWM with the duty-updating thread (BACKEND_DDS)
+
+Each backend runs over its own frequency range (set_frequency clamps the
+dds backend to DDS_MIN_FREQ..DDS_MAX_FREQ, the wave backend to
+MIN_FREQ..MAX_FREQ), so the rows compare the same settings per backend,
+not the same frequencies.  For each frequency the generator runs for
+--seconds and the table shows
+the frequency produced and its error, the duty update rate and the
+spread of the update intervals (jitter), the in-band distortion and the
+CPU time used as a fraction of the run.
+
+For the wave backend the updates are the PWM cells timed by the DMA
+engine: the interval spread is their whole-µs rounding and the
+frequency and distortion are the sample plan's.  For the dds backend
+every hardware_PWM call is logged with its time; the output is rebuilt
+from the log on a 1 µs grid (the duty held between updates, as after
+the filter) and its frequency and distortion are taken from the FFT.
+Distortion counts every bin up to THD_HARMONICS times the frequency
+except the fundamental, so aliasing from slow updates shows up as well.
+
+cpu is the process CPU time (time.process_time) spent over the run, in
+seconds and as a fraction of one core.  It covers every thread of the
+process, so the dds producer is included.
+
+--latency-ms models the pigpiod socket; each dds update pays it.  FakePi
+sleeps for it, as a real socket wait would, so it costs no CPU time.
+
+Usage:
+  python3 dds_bench.py [--latency-ms 0.3] [--seconds 0.5]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import Sinewave
+from fake_pi import FakePi
+
+FREQS = (Sinewave.MIN_FREQ, 2000, 5000, Sinewave.MAX_FREQ)
+DDS_FREQS = (Sinewave.DDS_MIN_FREQ, 50, Sinewave.DDS_MAX_FREQ)
+MAIN_LOBE_BINS = 3          # Hann main lobe half-width, in bins
+
+
+class _RecordingPi(FakePi):
+    """FakePi that logs each hardware_PWM duty update as it lands."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.updates = []
+
+    def hardware_PWM(self, gpio, frequency, duty):
+        err = super().hardware_PWM(gpio, frequency, duty)
+        if frequency:
+            self.updates.append((time.perf_counter(), duty))
+        return err
+
+
+def _run(gen, seconds):
+    """Start, hold for `seconds`, stop; returns (process CPU s, wall s)."""
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    gen.start()
+    time.sleep(seconds)
+    gen.stop()
+    return time.process_time() - cpu0, time.perf_counter() - t0
+
+
+def _wave_row(args, f):
+    pi = FakePi(latency_s=args.latency_ms / 1000)
+    gen = Sinewave.SineWaveGenerator(pi)
+    gen.set_amplitude(5.0)
+    gen.set_frequency(f)
+    cpu = _run(gen, args.seconds)
+    p = gen.plan
+    slots = Sinewave._slot_widths(f, p.n * p.oversample, p.periods)
+    gen.cleanup()
+    return (p.frequency, 1_000_000.0 * len(slots) / p.span_us, float(slots.mean()),
+            float(slots.std()), 0.0, p.thd, cpu)
+
+
+def _dds_spectrum(updates):
+    """(frequency, distortion) of the held-duty output from the log."""
+    t = np.array([u[0] for u in updates])
+    duty = np.array([u[1] for u in updates]) / Sinewave.DDS_DUTY_MAX
+    edges = np.rint((t - t[0]) * 1_000_000).astype(np.int64)
+    timeline = np.repeat(2 * duty[:-1] - 1, np.diff(edges))
+    timeline -= timeline.mean()
+    spectrum = np.abs(np.fft.rfft(timeline * np.hanning(len(timeline))))
+
+    # Fundamental: the peak, refined by parabolic interpolation
+    k = int(np.argmax(spectrum[1:])) + 1
+    a, b, c = np.log(spectrum[k - 1:k + 2] + 1e-12)
+    k_fine = k + 0.5 * (a - c) / (a - 2 * b + c)
+    frequency = k_fine * 1_000_000 / len(timeline)
+
+    top = min(len(spectrum), int(round(k_fine * Sinewave.THD_HARMONICS)) + 1)
+    power = spectrum[1:top] ** 2
+    lobe = slice(max(0, k - 1 - MAIN_LOBE_BINS), k + MAIN_LOBE_BINS)
+    fundamental = power[lobe].sum()
+    return frequency, float(np.sqrt((power.sum() - fundamental) / fundamental))
+
+
+def _dds_row(args, f):
+    pi = _RecordingPi(latency_s=args.latency_ms / 1000)
+    gen = Sinewave.SineWaveGenerator(pi, backend=Sinewave.BACKEND_DDS)
+    gen.set_amplitude(5.0)
+    gen.set_frequency(f)
+    cpu = _run(gen, args.seconds)
+    stats = gen.dds_stats
+    gen.cleanup()
+
+    intervals = np.diff([u[0] for u in pi.updates]) * 1_000_000
+    frequency, distortion = _dds_spectrum(pi.updates)
+    return (frequency, stats.rate_hz, float(intervals.mean()), float(intervals.std()),
+            stats.late / max(stats.updates, 1), distortion, cpu)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency-ms", type=float, default=0.3)
+    ap.add_argument("--seconds", type=float, default=0.5)
+    args = ap.parse_args()
+
+    print(f"latency={args.latency_ms} ms  run={args.seconds} s  "
+          f"dds target={Sinewave.DDS_UPDATE_HZ} updates/s")
+    print(f"{'freq':>6} {'backend':>7} | {'actual Hz':>10} {'err ppm':>9} | "
+          f"{'upd/s':>8} {'int us':>7} {'jit us':>7} {'late':>5} | "
+          f"{'dist':>7} | {'cpu s':>6} {'core':>5}")
+    for name, row, freqs in (("wave", _wave_row, FREQS), ("dds", _dds_row, DDS_FREQS)):
+        for f in freqs:
+            actual, rate, mean, jitter, late, dist, (cpu, wall) = row(args, f)
+            print(f"{f:6d} {name:>7} | {actual:10.2f} {(actual - f) / f * 1e6:+9.0f} | "
+                  f"{rate:8.0f} {mean:7.1f} {jitter:7.2f} {late:5.0%} | "
+                  f"{dist:7.1%} | {cpu:6.3f} {cpu / wall:5.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+edge_analysis.py
+NumPy reader for edge_capture.py recordings.
+
+The file is mapped with np.memmap as an array of notification records,
+so loading is zero-copy; periods, duty cycle and histograms are computed
+with vectorised operations over the tick column.  Tick differences are
+taken in uint32, which handles the 72-minute tick wrap.
+
+Usage:
+  rec = EdgeRecording("edges.bin")
+  print(rec.frequency(), rec.periods_us().std())
+  counts, edges = rec.period_histogram(bins=50)
+"""
+
+import os
+
+import numpy as np
+
+from Sinewave_measurement import GPIO_PIN
+
+RECORD_DTYPE = np.dtype([
+    ("seqno", "<u2"),
+    ("flags", "<u2"),
+    ("tick",  "<u4"),
+    ("level", "<u4"),
+])
+
+# Records with any of these set are keep-alive / watchdog / event reports
+# rather than level changes.
+NTFY_FLAGS_MASK = 0x00E0
+
+
+class EdgeRecording:
+    def __init__(self, path, gpio=GPIO_PIN):
+        self.gpio = gpio
+        if os.path.getsize(path) == 0:
+            # edge_capture leaves an empty file when no edges arrived;
+            # np.memmap cannot map zero bytes
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        else:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r")
+
+        changes = self.records[(self.records["flags"] & NTFY_FLAGS_MASK) == 0]
+        levels = ((changes["level"] >> gpio) & 1).astype(np.int8)
+        # Keep records where this pin actually changed
+        keep = np.ones(len(levels), dtype=bool)
+        keep[1:] = levels[1:] != levels[:-1]
+        self.ticks = changes["tick"][keep]
+        self.levels = levels[keep]
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def times_us(self):
+        """Edge times in µs from the first edge, unwrapped."""
+        if len(self.ticks) == 0:
+            return np.zeros(0, dtype=np.int64)
+        steps = np.diff(self.ticks).astype(np.int64)   # uint32 diff wraps
+        return np.concatenate(([0], np.cumsum(steps)))
+
+    def rising_times_us(self):
+        t = self.times_us()
+        rising = np.flatnonzero(self.levels == 1)
+        return t[rising[rising > 0]]
+
+    def periods_us(self):
+        """Rising-to-rising periods in µs."""
+        return np.diff(self.rising_times_us())
+
+    def frequency(self):
+        periods = self.periods_us()
+        if len(periods) == 0:
+            return 0.0
+        return 1_000_000.0 * len(periods) / periods.sum()
+
+    def duty(self):
+        """High-time fraction for every complete period."""
+        t = self.times_us()
+        rising = np.flatnonzero(self.levels == 1)
+        rising = rising[rising > 0]
+        if len(rising) < 2:
+            return np.zeros(0)
+        start, end = rising[:-1], rising[1:]
+        # The edge after each rising edge is its falling edge
+        fall = start + 1
+        ok = (fall < end) & (self.levels[np.minimum(fall, len(t) - 1)] == 0)
+        high = t[fall[ok]] - t[start[ok]]
+        return high / (t[end[ok]] - t[start[ok]])
+
+    def jitter_us(self):
+        periods = self.periods_us()
+        return float(periods.std()) if len(periods) > 1 else 0.0
+
+    def period_histogram(self, bins=50):
+        """np.histogram of the periods (counts, bin edges in µs)."""
+        return np.histogram(self.periods_us(), bins=bins)
+
+    def duty_histogram(self, bins=50):
+        return np.histogram(self.duty(), bins=bins, range=(0.0, 1.0))
+
+    def summary(self):
+        periods = self.periods_us()
+        duty = self.duty()
+        return {
+            "edges": len(self),
+            "periods": len(periods),
+            "frequency_hz": float(self.frequency()),
+            "mean_period_us": float(periods.mean()) if len(periods) else 0.0,
+            "jitter_us": self.jitter_us(),
+            "min_period_us": int(periods.min()) if len(periods) else 0,
+            "max_period_us": int(periods.max()) if len(periods) else 0,
+            "mean_duty": float(duty.mean()) if len(duty) else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    import sys
+
+    rec = EdgeRecording(sys.argv[1] if len(sys.argv) > 1 else "edges.bin")
+    for key, value in rec.summary().items():
+        print(f"{key:>15}: {value}")
+    counts, edges = rec.period_histogram(bins=20)
+    peak = max(int(counts.max()), 1) if len(counts) else 1
+    for c, lo in zip(counts, edges):
+        print(f"  {lo:9.1f} us  {c:7d}  " + "#" * int(40 * c / peak))
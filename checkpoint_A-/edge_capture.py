@@ -0,0 +1,116 @@
+"""
+edge_capture.py
+Record comparator edges to a file through a pigpio notification pipe.
+
+pigpiod writes one 12-byte record per GPIO level change to
+/dev/pigpio<handle>:
+
+  H seqno, H flags, I tick (us), I level (GPIO 0-31 bank)
+
+capture_edges() preallocates a file for max_records records, maps it
+and reads the pipe straight into the mapping with os.readv, so minutes
+of 10 kHz edges are recorded with no Python object per edge.  The file
+is truncated to the bytes actually received; edge_analysis.py reads it
+back zero-copy with NumPy.
+
+The notification pipe only exists on the Pi running pigpiod, so this
+must run locally.
+
+Usage:
+  n = capture_edges(pi, "edges.bin", duration_s=60)
+"""
+
+import mmap
+import os
+import select
+import time
+
+from Sinewave_measurement import GPIO_PIN
+
+RECORD_SIZE     = 12
+DEFAULT_RATE_HZ = 10_000
+HEADROOM        = 4          # records per expected edge, incl. falling edges
+READ_CHUNK      = 64 * 1024
+POLL_S          = 0.1
+
+
+def capture_edges(pi, path, duration_s, gpio=GPIO_PIN, max_records=None,
+                  progress=None):
+    """
+    Stream notification records for `gpio` into `path` for duration_s.
+
+    max_records : file size in records (default sized for 10 kHz)
+    progress    : called as progress(records, elapsed_s) about every POLL_S
+
+    Stops early if the file fills.  Returns the number of records written.
+    """
+    if max_records is None:
+        max_records = int(duration_s * DEFAULT_RATE_HZ * HEADROOM)
+    size = max_records * RECORD_SIZE
+
+    with open(path, "wb+") as f:
+        f.truncate(size)
+        mm = mmap.mmap(f.fileno(), size)
+        view = memoryview(mm)
+
+        handle = pi.notify_open()
+        if handle < 0:
+            view.release()
+            mm.close()
+            raise OSError(f"notify_open failed ({handle})")
+
+        written = 0
+        fd = os.open(f"/dev/pigpio{handle}", os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            pi.notify_begin(handle, 1 << gpio)
+            start = time.monotonic()
+            while written < size:
+                elapsed = time.monotonic() - start
+                if elapsed >= duration_s:
+                    break
+                ready, _, _ = select.select([fd], [], [], POLL_S)
+                if ready:
+                    chunk = view[written:min(written + READ_CHUNK, size)]
+                    try:
+                        written += os.readv(fd, [chunk])
+                    except BlockingIOError:
+                        pass
+                    finally:
+                        chunk.release()
+                if progress is not None:
+                    progress(written // RECORD_SIZE, elapsed)
+        finally:
+            pi.notify_close(handle)
+            os.close(fd)
+            view.release()
+            mm.flush()
+            mm.close()
+
+        # Drop a trailing partial record and the unused preallocation
+        written -= written % RECORD_SIZE
+        f.truncate(written)
+
+    return written // RECORD_SIZE
+
+
+if __name__ == "__main__":
+    import sys
+    import pigpio
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "edges.bin"
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+
+    pi = pigpio.pi()
+    if not pi.connected:
+        raise SystemExit("Run 'sudo pigpiod' first.")
+
+    pi.set_mode(GPIO_PIN, pigpio.INPUT)
+
+    def _progress(records, elapsed):
+        print(f"\r  {elapsed:5.1f} s  {records} records", end="", flush=True)
+
+    try:
+        n = capture_edges(pi, path, seconds, progress=_progress)
+        print(f"\nWrote {n} records to {path}")
+    finally:
+        pi.stop()
@@ -0,0 +1,552 @@
+"""
+fake_pi.py
+Minimal stand-in for a pigpio.pi connection, used by the benchmark
+scripts so SAR changes can be measured without the Pi-Hat.
+
+The analog side is simulated in 5-bit SAR step units: each comparator
+pin has an input level, the CE1 MCP4131 register sets the DAC level
+(code * 31 / 127) and a comparator reads 0 while input >= DAC, the
+same polarity as the LM339 wiring.  With tau_s set, the DAC output
+settles exponentially towards each new code, so reads taken too soon
+after a large jump still see the old level.
+
+Every method that would be a pigpiod socket command bumps
+`round_trips` and optionally sleeps `latency_s` to model the socket.
+Stored scripts are interpreted for the subset of commands that
+sar_script.py emits.
+
+Waves are kept as pulse lists against the daemon's pulse and wave-ID
+limits; the wave being transmitted is recorded in `wave_tx`.  Wave
+memory follows pigpiod's reuse rule: a new wave goes above the highest
+wave ID in use unless a deleted wave had exactly its size, and a
+deleted wave's pulses only come back once every higher wave is deleted
+too (or on wave_clear).
+
+`signals` maps a gpio to a function of time (seconds) giving its input
+level, e.g. a sine from the generator.  While callbacks are registered
+a background thread samples every watched comparator each
+EDGE_SAMPLE_S, bisects any change down to EDGE_RESOLUTION_S and fires
+them with microsecond ticks taken from time.monotonic(), the same clock
+the edges are computed on.
+"""
+
+import math
+import random
+import threading
+import time
+
+import pigpio
+
+MAX_STEP     = 31
+DAC_MAX_CODE = 127
+
+# Wave limits as reported by pigpiod on a Pi 3/4
+MAX_WAVE_PULSES = 12000
+MAX_WAVE_CBS    = 25016
+MAX_WAVES       = 250
+MAX_CHAIN_LEN   = 600
+MAX_CHAIN_LOOPS = 20
+
+EDGE_SAMPLE_S     = 10e-6
+EDGE_RESOLUTION_S = 1e-6
+EDGE_POLL_S       = 0.001
+
+
+def _tick(t):
+    return int(t * 1_000_000) & 0xFFFFFFFF
+
+
+class _FakeCallback:
+    """pigpio._callback look-alike; counts edges when no func is given."""
+
+    def __init__(self, pi, gpio, edge, func):
+        self._pi = pi
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+        self.count = 0
+
+    def _fire(self, level, tick):
+        if self.edge == pigpio.RISING_EDGE and level != 1:
+            return
+        if self.edge == pigpio.FALLING_EDGE and level != 0:
+            return
+        if self.func is None:
+            self.count += 1
+        else:
+            self.func(self.gpio, level, tick)
+
+    def cancel(self):
+        self._pi._remove_callback(self)
+
+    def tally(self):
+        return self.count
+
+    def reset_tally(self):
+        self.count = 0
+
+
+class FakePi:
+    def __init__(self, inputs=None, noise=0.0, latency_s=0.0, seed=0,
+                 tau_s=0.0, signals=None, max_wave_pulses=MAX_WAVE_PULSES):
+        """
+        inputs    : {gpio: input level in SAR steps}
+        signals   : {gpio: f(t) -> input level in SAR steps}, overrides inputs
+        noise     : gaussian sigma (steps) added on every comparator read
+        latency_s : simulated socket round-trip time per command
+        tau_s     : DAC / buffer settling time constant
+        max_wave_pulses : wave memory in pulses (control blocks scale with it)
+        """
+        self.connected = True
+        self.inputs = dict(inputs or {})
+        self.noise = noise
+        self.latency_s = latency_s
+        self.round_trips = 0
+        self.spi_writes = 0
+        self.dac_code = 0
+        self.tau_s = tau_s
+        self._from_level = 0.0
+        self._write_t = 0.0
+        self._rng = random.Random(seed)
+        self._scripts = {}
+        self._next_script = 0
+        self.waves = {}
+        self.max_wave_pulses = max_wave_pulses
+        self._wave_sizes = []         # pulses allocated per wave ID, in order
+        self.wave_tx = None           # (wave_id, mode) being transmitted
+        self._wave_pending = None     # (wave_id, mode, at) after a SYNC send
+        self._chain = None            # (start, duration_s or None, wave ids)
+        self.hw_pwm = {}              # gpio -> (frequency, duty)
+        self.wave_switches = 0
+        self.tx_gaps = 0              # times a transmitting wave was stopped
+        self.pulses_sent = 0
+        self._new_wave = []
+        self.signals = dict(signals or {})
+        self._callbacks = []
+        self._cb_lock = threading.Lock()
+        self._edge_thread = None
+
+    # -- socket accounting -------------------------------------------------
+
+    def _cmd(self):
+        self.round_trips += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def reset_counters(self):
+        self.round_trips = 0
+        self.spi_writes = 0
+
+    # -- analog model ------------------------------------------------------
+
+    def dac_level(self, now=None):
+        target = self.dac_code * MAX_STEP / DAC_MAX_CODE
+        if not self.tau_s:
+            return target
+        if now is None:
+            now = time.monotonic()
+        decay = math.exp(-max(0.0, now - self._write_t) / self.tau_s)
+        return target + (self._from_level - target) * decay
+
+    def _input(self, gpio, now):
+        signal = self.signals.get(gpio)
+        if signal is not None:
+            return signal(now)
+        return self.inputs.get(gpio, 0.0)
+
+    def _comparator(self, gpio, now=None):
+        if now is None:
+            now = time.monotonic()
+        vin = self._input(gpio, now)
+        if self.noise:
+            vin += self._rng.gauss(0.0, self.noise)
+        return 0 if vin >= self.dac_level(now) else 1
+
+    # -- GPIO / SPI --------------------------------------------------------
+
+    def set_mode(self, gpio, mode):
+        self._cmd()
+        return 0
+
+    def set_pull_up_down(self, gpio, pud):
+        self._cmd()
+        return 0
+
+    def write(self, gpio, level):
+        self._cmd()
+        return 0
+
+    def read(self, gpio):
+        self._cmd()
+        return self._comparator(gpio)
+
+    def read_bank_1(self):
+        """Levels of GPIO 0-31; every simulated comparator is sampled at once."""
+        self._cmd()
+        now = time.monotonic()
+        bits = 0
+        for gpio in set(self.inputs) | set(self.signals):
+            if gpio < 32 and self._comparator(gpio, now):
+                bits |= 1 << gpio
+        return bits
+
+    def spi_open(self, channel, baud, flags=0):
+        self._cmd()
+        return channel
+
+    def spi_close(self, handle):
+        self._cmd()
+        return 0
+
+    def spi_write(self, handle, data):
+        self._cmd()
+        self._spi_write(data)
+        return len(data)
+
+    def _spi_write(self, data, now=None):
+        if now is None:
+            now = time.monotonic()
+        self._from_level = self.dac_level(now)
+        self._write_t = now
+        self.spi_writes += 1
+        self.dac_code = int(list(data)[1])
+
+    # -- callbacks / edges -------------------------------------------------
+
+    def get_current_tick(self):
+        self._cmd()
+        return _tick(time.monotonic())
+
+    def callback(self, user_gpio, edge=pigpio.RISING_EDGE, func=None):
+        self._cmd()
+        cb = _FakeCallback(self, user_gpio, edge, func)
+        with self._cb_lock:
+            self._callbacks.append(cb)
+        if self._edge_thread is None:
+            self._edge_thread = threading.Thread(target=self._edge_loop, daemon=True)
+            self._edge_thread.start()
+        return cb
+
+    def _remove_callback(self, cb):
+        with self._cb_lock:
+            if cb in self._callbacks:
+                self._callbacks.remove(cb)
+
+    def _edge_loop(self):
+        levels = {}
+        t = time.monotonic()
+        while True:
+            with self._cb_lock:
+                callbacks = list(self._callbacks)
+            if not callbacks:
+                self._edge_thread = None
+                return
+            gpios = {cb.gpio for cb in callbacks}
+            end = time.monotonic()
+            while t < end:
+                for gpio in gpios:
+                    level = self._comparator(gpio, t)
+                    if gpio in levels and level != levels[gpio]:
+                        tick = _tick(self._find_edge(gpio, t - EDGE_SAMPLE_S, t, level))
+                        for cb in callbacks:
+                            if cb.gpio == gpio:
+                                cb._fire(level, tick)
+                    levels[gpio] = level
+                t += EDGE_SAMPLE_S
+            time.sleep(EDGE_POLL_S)
+
+    def _find_edge(self, gpio, lo, hi, level):
+        """Bisect (lo, hi] for the first time gpio reads `level`."""
+        while hi - lo > EDGE_RESOLUTION_S:
+            mid = (lo + hi) / 2
+            if self._comparator(gpio, mid) == level:
+                hi = mid
+            else:
+                lo = mid
+        return hi
+
+    # -- waves -------------------------------------------------------------
+
+    def wave_get_max_pulses(self):
+        self._cmd()
+        return self.max_wave_pulses
+
+    def wave_get_max_cbs(self):
+        self._cmd()
+        return MAX_WAVE_CBS * self.max_wave_pulses // MAX_WAVE_PULSES
+
+    def wave_add_new(self):
+        self._cmd()
+        self._new_wave = []
+        return 0
+
+    def wave_add_generic(self, pulses):
+        self._cmd()
+        self._new_wave.extend(pulses)
+        self.pulses_sent += len(pulses)
+        return len(self._new_wave)
+
+    def wave_create(self):
+        self._cmd()
+        size = len(self._new_wave)
+        # A deleted wave's space is reused only by a wave of its size
+        wave_id = next((i for i, n in enumerate(self._wave_sizes)
+                        if n == size and i not in self.waves), None)
+        if wave_id is None:
+            if sum(self._wave_sizes) + size > self.max_wave_pulses:
+                return pigpio.PI_TOO_MANY_PULSES
+            if len(self._wave_sizes) >= MAX_WAVES:
+                return pigpio.PI_NO_WAVEFORM_ID
+            wave_id = len(self._wave_sizes)
+            self._wave_sizes.append(size)
+        self.waves[wave_id] = self._new_wave
+        self._new_wave = []
+        return wave_id
+
+    def wave_delete(self, wave_id):
+        self._cmd()
+        if wave_id not in self.waves:
+            raise pigpio.error("bad wave id")
+        self._wave_advance()
+        on_air = {w[0] for w in (self.wave_tx, self._wave_pending) if w is not None}
+        if self._chain_busy():
+            on_air |= self._chain[2]
+        if wave_id in on_air:
+            raise AssertionError(f"fake_pi: wave {wave_id} deleted while transmitting")
+        del self.waves[wave_id]
+        # Space is freed from the top down to the highest wave in use
+        while self._wave_sizes and len(self._wave_sizes) - 1 not in self.waves:
+            self._wave_sizes.pop()
+        return 0
+
+    def wave_clear(self):
+        self._cmd()
+        self.waves.clear()
+        self._wave_sizes = []
+        self._new_wave = []
+        self.wave_tx = None
+        self._chain = None
+        return 0
+
+    def wave_send_repeat(self, wave_id):
+        return self.wave_send_using_mode(wave_id, pigpio.WAVE_MODE_REPEAT)
+
+    def wave_send_once(self, wave_id):
+        return self.wave_send_using_mode(wave_id, pigpio.WAVE_MODE_ONE_SHOT)
+
+    def _wave_period_s(self, wave_id):
+        return sum(p.delay for p in self.waves.get(wave_id, ())) / 1_000_000
+
+    def _wave_advance(self):
+        """Apply a pending SYNC switch once the old wave's cycle has ended."""
+        if self._wave_pending is not None and time.monotonic() >= self._wave_pending[2]:
+            self.wave_tx = self._wave_pending[:2]
+            self._wave_pending = None
+
+    def wave_send_using_mode(self, wave_id, mode):
+        """Like pigpiod, sending a wave cancels any hardware PWM."""
+        self._cmd()
+        if wave_id not in self.waves:
+            raise pigpio.error("bad wave id")
+        self._wave_advance()
+        self.wave_switches += 1
+        self.hw_pwm.clear()
+        sync = mode in (pigpio.WAVE_MODE_ONE_SHOT_SYNC, pigpio.WAVE_MODE_REPEAT_SYNC)
+        if sync and self.wave_tx is not None:
+            at = time.monotonic() + self._wave_period_s(self.wave_tx[0])
+            self._wave_pending = (wave_id, mode, at)
+        else:
+            self.wave_tx = (wave_id, mode)
+            self._wave_pending = None
+        self._chain = None
+        return len(self.waves[wave_id])
+
+    def _chain_block(self, data, i, depth):
+        """Parse from data[i] to the matching loop end: (duration_s, ids, i, loops)."""
+        duration, ids, loops = 0.0, set(), 0
+        while i < len(data):
+            b = data[i]
+            if b != 255:
+                if b not in self.waves:
+                    raise ValueError(pigpio.PI_BAD_WAVE_ID)
+                duration += self._wave_period_s(b)
+                ids.add(b)
+                i += 1
+                continue
+            cmd = data[i + 1]
+            if cmd == 0:
+                inner, inner_ids, i, inner_loops = self._chain_block(data, i + 2, depth + 1)
+                ids |= inner_ids
+                loops += inner_loops
+                if i < len(data) and data[i] == 255 and data[i + 1] == 3:
+                    return None, ids, len(data), loops + 1
+                count = data[i + 2] + 256 * data[i + 3]
+                duration += inner * count
+                loops += 1
+                i += 4
+            elif cmd == 1 or cmd == 3:
+                if depth == 0:
+                    raise ValueError(pigpio.PI_BAD_CHAIN_LOOP)
+                return duration, ids, i, loops
+            elif cmd == 2:
+                duration += (data[i + 2] + 256 * data[i + 3]) / 1_000_000
+                i += 4
+            else:
+                raise ValueError(pigpio.PI_BAD_CHAIN_CMD)
+        return duration, ids, i, loops
+
+    def wave_chain(self, data):
+        """Play a chain; only its total duration and wave ids are modelled.
+        Like a wave send, it cancels any hardware PWM."""
+        self._cmd()
+        data = bytes(data)
+        if len(data) > MAX_CHAIN_LEN:
+            return pigpio.PI_CHAIN_TOO_BIG
+        try:
+            duration, ids, _, loops = self._chain_block(data, 0, 0)
+        except ValueError as e:
+            return e.args[0]
+        if loops > MAX_CHAIN_LOOPS:
+            return pigpio.PI_CHAIN_COUNTER
+        self.wave_tx = None
+        self._wave_pending = None
+        self.hw_pwm.clear()
+        self.wave_switches += 1
+        self._chain = (time.monotonic(), duration, ids)
+        return 0
+
+    def hardware_PWM(self, gpio, frequency, duty):
+        """Like pigpiod, starting hardware PWM cancels any wave (and
+        starting a wave or chain cancels hardware PWM)."""
+        self._cmd()
+        if frequency:
+            self.wave_tx = None
+            self._wave_pending = None
+            self._chain = None
+            self.hw_pwm[gpio] = (frequency, duty)
+        else:
+            self.hw_pwm.pop(gpio, None)
+        return 0
+
+    def _chain_busy(self):
+        if self._chain is None:
+            return False
+        start, duration, _ = self._chain
+        return duration is None or time.monotonic() < start + duration
+
+    def wave_tx_stop(self):
+        self._cmd()
+        if self.wave_tx is not None or self._chain_busy():
+            self.tx_gaps += 1
+        self.wave_tx = None
+        self._wave_pending = None
+        self._chain = None
+        return 0
+
+    def wave_tx_busy(self):
+        self._cmd()
+        return 1 if self.wave_tx is not None or self._chain_busy() else 0
+
+    def wave_tx_at(self):
+        self._cmd()
+        self._wave_advance()
+        if self._chain_busy():
+            return pigpio.WAVE_NOT_FOUND
+        if self.wave_tx is None:
+            return pigpio.NO_TX_WAVE
+        return self.wave_tx[0]
+
+    # -- stored scripts ----------------------------------------------------
+
+    def store_script(self, script):
+        self._cmd()
+        if isinstance(script, (bytes, bytearray)):
+            script = script.decode()
+        sid = self._next_script
+        self._next_script += 1
+        self._scripts[sid] = {
+            'tokens': script.split(),
+            'params': [0] * 10,
+            'done_at': 0.0,
+        }
+        return sid
+
+    def delete_script(self, script_id):
+        self._cmd()
+        self._scripts.pop(script_id, None)
+        return 0
+
+    def run_script(self, script_id, params=None):
+        self._cmd()
+        s = self._scripts[script_id]
+        pars = list(params or [])
+        s['params'] = pars + s['params'][len(pars):]
+        delay_us = self._exec(s['tokens'], s['params'])
+        s['done_at'] = time.monotonic() + delay_us / 1_000_000
+        return 0
+
+    def script_status(self, script_id):
+        self._cmd()
+        s = self._scripts[script_id]
+        if time.monotonic() < s['done_at']:
+            return pigpio.PI_SCRIPT_RUNNING, list(s['params'])
+        return pigpio.PI_SCRIPT_HALTED, list(s['params'])
+
+    def _exec(self, tokens, params):
+        """Interpret a script; returns the total MICS delay it asked for."""
+        variables = {}
+        tags = {}
+        for i, tok in enumerate(tokens):
+            if tok == 'tag':
+                tags[tokens[i + 1]] = i + 2
+
+        def value(tok):
+            if tok[0] == 'p':
+                return params[int(tok[1:])]
+            if tok[0] == 'v':
+                return variables.get(tok, 0)
+            return int(tok, 0)
+
+        def store(tok, val):
+            if tok[0] == 'p':
+                params[int(tok[1:])] = val
+            else:
+                variables[tok] = val
+
+        acc = 0
+        delay_us = 0
+        start = time.monotonic()
+        pc = 0
+        while pc < len(tokens):
+            op = tokens[pc]
+            if op == 'spiw':
+                pc += 2
+                data = []
+                while pc < len(tokens) and tokens[pc][0].isdigit():
+                    data.append(int(tokens[pc], 0))
+                    pc += 1
+                self._spi_write(data, start + delay_us / 1_000_000)
+                continue
+            if op == 'halt':
+                break
+            arg = tokens[pc + 1]
+            pc += 2
+            if op == 'tag':
+                pass
+            elif op == 'mics':
+                delay_us += value(arg)
+            elif op == 'r':
+                acc = self._comparator(int(arg), start + delay_us / 1_000_000)
+            elif op == 'lda':
+                acc = value(arg)
+            elif op == 'sta':
+                store(arg, acc)
+            elif op == 'jmp':
+                pc = tags[arg]
+            elif op == 'jnz' and acc != 0:
+                pc = tags[arg]
+            elif op == 'jz' and acc == 0:
+                pc = tags[arg]
+            elif op not in ('jnz', 'jz'):
+                raise ValueError(f"fake_pi: unsupported script command {op!r}")
+        return delay_us
@@ -0,0 +1,97 @@
+"""
+freq_bench.py
+Benchmark the FrequencyMeter edge callback.
+
+Feeds synthetic rising-edge ticks (a fixed period plus gaussian jitter)
+straight into FrequencyMeter._cb and reports the cost per edge, next to
+the previous callback that re-summed the 32-period deque on every edge.
+The snapshot is printed to check the statistics.
+
+Needs no pigpiod.
+
+Usage:
+  python3 freq_bench.py [--freq 10000] [--jitter-us 2] [--edges 200000]
+                        [--window 32]
+"""
+
+import argparse
+import random
+import time
+from collections import deque
+
+import pigpio
+
+import Sinewave_measurement as sm
+from fake_pi import FakePi
+
+
+class _ResumMeter:
+    """The callback as it was: sum() over the deque for every edge."""
+
+    def __init__(self):
+        self.last_tick = None
+        self.frequency = 0.0
+        self._buf = deque(maxlen=sm.BUFFER_LEN)
+
+    def _cb(self, gpio, level, tick):
+        if self.last_tick is not None:
+            dt = pigpio.tickDiff(self.last_tick, tick)
+            if dt >= sm.MIN_DT_US:
+                self._buf.append(dt)
+                avg_dt = sum(self._buf) / len(self._buf)
+                self.frequency = (1_000_000.0 / avg_dt) / sm.EDGE_DIVISOR
+        self.last_tick = tick
+
+
+def _ticks(args):
+    rng = random.Random(1)
+    period = 1_000_000 / args.freq
+    t = 0.0
+    ticks = []
+    for _ in range(args.edges):
+        t += period + rng.gauss(0.0, args.jitter_us)
+        ticks.append(int(t) & 0xFFFFFFFF)
+    return ticks
+
+
+def _per_edge(cb, ticks):
+    t0 = time.perf_counter()
+    for tick in ticks:
+        cb(sm.GPIO_PIN, 1, tick)
+    return (time.perf_counter() - t0) / len(ticks)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--freq", type=float, default=10_000)
+    ap.add_argument("--jitter-us", type=float, default=2.0)
+    ap.add_argument("--edges", type=int, default=200_000)
+    ap.add_argument("--window", type=int, default=sm.BUFFER_LEN,
+                    help="periods averaged (Sinewave_measurement.BUFFER_LEN)")
+    args = ap.parse_args()
+
+    sm.BUFFER_LEN = args.window
+
+    ticks = _ticks(args)
+
+    pi = FakePi()
+    meter = sm.FrequencyMeter(pi, mode=sm.MODE_RECIPROCAL)
+    meter.cleanup()
+
+    old = _per_edge(_ResumMeter()._cb, ticks)
+    new = _per_edge(meter._cb, ticks)
+
+    budget = 1.0 / args.freq
+    print(f"freq={args.freq:.0f} Hz  jitter={args.jitter_us} us  "
+          f"edges={args.edges}  window={args.window}")
+    print(f"re-sum callback : {old * 1e6:6.2f} us/edge  ({old / budget:5.1%} of the period)")
+    print(f"running stats   : {new * 1e6:6.2f} us/edge  ({new / budget:5.1%} of the period)")
+
+    snap = meter.snapshot()
+    print(f"snapshot        : {snap.frequency:.2f} +/- {snap.uncertainty:.2f} Hz  "
+          f"mean={snap.mean_period_us:.2f} us  jitter={snap.jitter_us:.2f} us  "
+          f"min={snap.min_period_us} max={snap.max_period_us}  edges={snap.edges}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,15 @@ Measures frequency of a sine wave by repeatedly sampling through the
 existing SAR ADC (CE1 / MCP4131 on GPIO 23), detecting threshold crossings,
 and using linear interpolation for sub-sample timing accuracy.
 
+Two modes:
+  "edge" (default) - the DAC is written once to THRESHOLD_STEP and the
+                     comparator is used as a zero-crossing detector; each
+                     crossing is timestamped by a pigpio tick callback
+                     (1 us resolution, no SPI traffic per sample).  Covers
+                     the full 1 kHz - 10 kHz generator range.
+  "sar"            - a full SAR conversion per sample with interpolated
+                     crossings.  ~100 ms per sample, so sub-Hz signals only.
+
 Hardware (same as CheckpointB voltmeter):
   SPI CE1 -> MCP4131 DAC  (GPIO 7 chip-select)
   GPIO 23 -> LM339 comparator 1 output
@@ -19,12 +28,18 @@ import pigpio
 
 from voltmeter import _sar_measure, COMPARATOR1_PIN, step_to_voltage
 from ohmmeter  import MCP4131_MAX_STEPS
+from sar_engine import get_engine
 
 # Step 15 ~ -0.13V, step 16 ~ +0.19V, so this straddles 0V on the +-5V scale
 THRESHOLD_STEP   = 15
 DEFAULT_CROSSINGS = 8
 TIMEOUT_S        = 5.0
 
+# Edge mode: DAC settle after writing the threshold, and how long the
+# comparator must sit high before a falling edge counts as a crossing
+# (well under the 50 us half-period at 10 kHz).
+EDGE_SETTLE_S     = 0.01
+EDGE_HOLDOFF_US   = 20
 
 
 def _single_sar(pi, spi_handle):
@@ -33,22 +48,42 @@ def _single_sar(pi, spi_handle):
     return step, t
 
 
-def measure_frequency(pi, spi_handle, num_crossings=DEFAULT_CROSSINGS):
+def _frequency_from_crossings(crossing_times):
     """
-    Detects rising-edge zero-crossings and computes frequency from the
-    average period between them.
+    Frequency from the average period between crossing times (seconds).
 
     Returns (frequency_hz, confidence) where confidence is 0.0-1.0.
-    Returns (0.0, 0.0) on timeout or no signal.
     """
+    periods = [
+        crossing_times[i + 1] - crossing_times[i]
+        for i in range(len(crossing_times) - 1)
+    ]
+
+    avg_period = sum(periods) / len(periods)
+    if avg_period <= 0:
+        return 0.0, 0.0
+
+    frequency = 1.0 / avg_period
+
+    # Coefficient of variation - lower means more consistent periods = better signal
+    if len(periods) >= 2:
+        variance   = sum((p - avg_period) ** 2 for p in periods) / len(periods)
+        cv         = (variance ** 0.5) / avg_period
+        confidence = max(0.0, 1.0 - cv * 10)
+    else:
+        confidence = 0.5
+
+    return frequency, confidence
+
+
+def _sar_crossings(pi, spi_handle, num_crossings):
     crossing_times = []
     prev_step, prev_t = _single_sar(pi, spi_handle)
     deadline = time.monotonic() + TIMEOUT_S
 
     while len(crossing_times) < num_crossings:
         if time.monotonic() > deadline:
-            print("[freq_meter_sw] Timeout - not enough crossings detected.")
-            return 0.0, 0.0
+            return None
 
         curr_step, curr_t = _single_sar(pi, spi_handle)
 
@@ -64,26 +99,74 @@ def measure_frequency(pi, spi_handle, num_crossings=DEFAULT_CROSSINGS):
         prev_step = curr_step
         prev_t    = curr_t
 
-    periods = [
-        crossing_times[i + 1] - crossing_times[i]
-        for i in range(len(crossing_times) - 1)
-    ]
+    return crossing_times
 
-    avg_period = sum(periods) / len(periods)
-    if avg_period <= 0:
-        return 0.0, 0.0
 
-    frequency = 1.0 / avg_period
+def _edge_crossings(pi, spi_handle, num_crossings):
+    """
+    Rising zero-crossings timestamped by pigpio ticks.
 
-    # Coefficient of variation - lower means more consistent periods = better signal
-    if len(periods) >= 2:
-        variance   = sum((p - avg_period) ** 2 for p in periods) / len(periods)
-        cv         = (variance ** 0.5) / avg_period
-        confidence = max(0.0, 1.0 - cv * 10)
+    The comparator output is 0 while input >= DAC, so the signal rising
+    through THRESHOLD_STEP is a falling edge on GPIO 23.  A falling edge
+    only counts once the output has been high for EDGE_HOLDOFF_US, which
+    rejects the chatter around both crossings of a noisy signal.  Tick
+    differences are accumulated so the 32-bit tick wrap does not matter.
+    """
+    engine = get_engine(pi, spi_handle)
+    engine.write_step(THRESHOLD_STEP)
+    engine.settle(EDGE_SETTLE_S)
+
+    ticks = []
+    last_rise = [None]
+
+    def _on_edge(_gpio, level, tick):
+        if level == 1:
+            last_rise[0] = tick
+            return
+        if last_rise[0] is None or pigpio.tickDiff(last_rise[0], tick) < EDGE_HOLDOFF_US:
+            return
+        if len(ticks) < num_crossings:
+            ticks.append(tick)
+
+    cb = pi.callback(COMPARATOR1_PIN, pigpio.EITHER_EDGE, _on_edge)
+    try:
+        deadline = time.monotonic() + TIMEOUT_S
+        while len(ticks) < num_crossings:
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(0.001)
+    finally:
+        cb.cancel()
+
+    crossing_times = [0.0]
+    for i in range(1, len(ticks)):
+        crossing_times.append(
+            crossing_times[-1] + pigpio.tickDiff(ticks[i - 1], ticks[i]) / 1_000_000)
+    return crossing_times
+
+
+def measure_frequency(pi, spi_handle, num_crossings=DEFAULT_CROSSINGS, mode="edge"):
+    """
+    Detects rising-edge zero-crossings and computes frequency from the
+    average period between them.
+
+    mode is "edge" (tick-timed comparator edges) or "sar" (SAR sampling).
+
+    Returns (frequency_hz, confidence) where confidence is 0.0-1.0.
+    Returns (0.0, 0.0) on timeout or no signal.
+    """
+    if mode == "edge":
+        crossing_times = _edge_crossings(pi, spi_handle, num_crossings)
+    elif mode == "sar":
+        crossing_times = _sar_crossings(pi, spi_handle, num_crossings)
     else:
-        confidence = 0.5
+        raise ValueError(f"unknown mode {mode!r}")
 
-    return frequency, confidence
+    if crossing_times is None:
+        print("[freq_meter_sw] Timeout - not enough crossings detected.")
+        return 0.0, 0.0
+
+    return _frequency_from_crossings(crossing_times)
 
 
 if __name__ == "__main__":
@@ -96,7 +179,7 @@ if __name__ == "__main__":
 
     spi = pi.spi_open(1, 50_000, 0)
 
-    print("Frequency Meter - Method 2 (Software Zero-Crossing)")
+    print("Frequency Meter - Method 2 (Comparator Zero-Crossing)")
     print(f"Threshold: step {THRESHOLD_STEP} (~{step_to_voltage(THRESHOLD_STEP):.2f} V)")
     print()
 
@@ -11,16 +11,24 @@ Special cases:
 - Not in range
 """
 
-import time
 import math
 import pigpio
 
+from sar_engine import (
+    AVG_CONFIDENCE,
+    MCP4131_MAX_STEPS,
+    QUANT_UNCERTAINTY,
+    SETTLE_CANDIDATES_S,
+    TRACK_WINDOW,
+    get_engine,
+    save_settle_profile,
+)
+
 ADC_SPI_CHANNEL   = 1
 ADC_SPI_SPEED     = 50_000
 ADC_SPI_FLAGS     = 0
 
 COMPARATOR2_PIN   = 24
-MCP4131_MAX_STEPS = 31
 
 R_REF_OHMS            = 2000
 R_REF_TOLERANCE_PCT   = 0.02
@@ -28,8 +36,6 @@ R_REF_TOLERANCE_PCT   = 0.02
 R_MIN_OHMS = 500
 R_MAX_OHMS = 10000
 
-_SETTLE_S = 0.02
-
 # -------------------------------------------------------------------
 # Step-based calibration points from measured hardware data
 # Format: (step, actual_ohms)
@@ -64,36 +70,47 @@ def close_adc(pi, spi_handle):
 
 def _write_dac(pi, spi_handle, step):
     """Scale 5-bit step (0..31) to MCP4131 7-bit register DAC (0..127)."""
-    step = max(0, min(step, MCP4131_MAX_STEPS))
-    dac_code = round(step * 127 / MCP4131_MAX_STEPS)
-    pi.spi_write(spi_handle, [0x00, dac_code])
+    get_engine(pi, spi_handle).write_step(step)
+
 
+def sar_measure(pi, spi_handle, comp_pin, verbose=True):
+    return get_engine(pi, spi_handle).convert(comp_pin, verbose)
 
-def sar_measure(pi, spi_handle, comp_pin):
-    step = 0
 
-    for bit_pos in range(4, -1, -1):
-        trial = min(step | (1 << bit_pos), MCP4131_MAX_STEPS)
-        _write_dac(pi, spi_handle, trial)
-        time.sleep(_SETTLE_S)
+def averaged_measure(pi, spi_handle, comp_pin, n=11,
+                     confidence=AVG_CONFIDENCE, with_count=False):
+    """Return the median step from up to n SAR conversions.
+
+    with_count=True returns (step, conversions_used) instead.
+    """
+    return get_engine(pi, spi_handle).averaged(
+        comp_pin, n, confidence, with_count, verbose=True)
 
-        comp = pi.read(comp_pin)
-        print(
-            f"  bit {bit_pos}: trial={trial:2d}  comp={comp}  "
-            f"-> {'KEEP' if comp == 0 else 'DISCARD'}"
-        )
 
-        if comp == 0:
-            step = trial
+def fractional_measure(pi, spi_handle, comp_pin, n=11):
+    """Return (fractional step, uncertainty in steps) from n SAR conversions."""
+    return get_engine(pi, spi_handle).fractional(comp_pin, n)
 
-    _write_dac(pi, spi_handle, step)
-    return step
 
+def track_measure(pi, spi_handle, comp_pin, prev_step, window=TRACK_WINDOW):
+    """Tracking conversion seeded from prev_step (SarEngine.track)."""
+    return get_engine(pi, spi_handle).track(comp_pin, prev_step, window)
 
-def averaged_measure(pi, spi_handle, comp_pin, n=11):
-    """Return the median step from n SAR conversions."""
-    readings = sorted(sar_measure(pi, spi_handle, comp_pin) for _ in range(n))
-    return readings[n // 2]
+
+def calibrate_settle_profile(pi, spi_handle, comp_pin,
+                             candidates=SETTLE_CANDIDATES_S, trials=6,
+                             merge_with=None, save=True):
+    """
+    Calibrate the shared per-bit settle profile (SarEngine.calibrate_settle)
+    and save it to settle_profile.json.
+
+    Returns (profile, reference_codes).
+    """
+    profile, reference = get_engine(pi, spi_handle).calibrate_settle(
+        comp_pin, candidates, trials, merge_with)
+    if save:
+        save_settle_profile(profile)
+    return profile, reference
 
 
 def _interp(x, x0, y0, x1, y1):
@@ -168,3 +185,28 @@ def tolerance(step, r_ref=R_REF_OHMS):
         return max(15.0, resistance * 0.03)
 
     return max(20.0, resistance * R_REF_TOLERANCE_PCT)
+
+
+def fractional_tolerance(step, uncertainty, r_ref=R_REF_OHMS):
+    """
+    Tolerance for a fractional step (sar_engine.sub_lsb_estimate).
+
+    The step uncertainty is converted to ohms through the local slope of
+    STEP_CAL_POINTS over a +/-QUANT_UNCERTAINTY window, shifted to stay
+    inside the table at its ends; the reference-resistor tolerance is
+    the floor.  It never exceeds the plain tolerance(), so codes that do
+    not spread (uncertainty QUANT_UNCERTAINTY) fall back to it.
+    """
+    resistance = step_to_resistance(step, r_ref)
+
+    if math.isinf(resistance) or resistance <= 0:
+        return 0.0
+
+    pts = sorted(STEP_CAL_POINTS)
+    width = 2 * QUANT_UNCERTAINTY
+    lo = min(max(step - QUANT_UNCERTAINTY, pts[0][0]), pts[-1][0] - width)
+    hi = lo + width
+    slope = abs(calibrate_step_to_resistance(lo) - calibrate_step_to_resistance(hi)) / width
+
+    floor = resistance * R_REF_TOLERANCE_PCT
+    return min(tolerance(step, r_ref), max(floor, slope * uncertainty))
@@ -0,0 +1,157 @@
+"""
+sar_bench.py
+Benchmark the SAR conversion paths against fake_pi.FakePi.
+
+Reports, per input level, the step returned, the socket round trips,
+the SPI writes and the wall time for one averaged reading on each
+SarEngine path (Python loop vs pigpio stored script).  With --calibrate
+the settle profile is calibrated on the simulated DAC (time constant
+--tau-ms) separately for each path, since the Python path adds socket
+time on top of every delay, and the table is repeated.
+
+With --multi it instead compares converting the three CE1 comparators
+(GPIO 23/24/18) one at a time against one convert_multi() sweep; the
+last column is the multi sweep's round trips as a fraction of the
+separate ones (about a third for close inputs, three quarters for
+spread ones).
+
+With --tolerance it prints ohmmeter.fractional_tolerance() over every
+quarter step of the SAR range instead, including the steps near the
+ends of STEP_CAL_POINTS, for a quiet input (QUANT_UNCERTAINTY) and a
+spread one (SUB_LSB_FLOOR), and checks each is finite and never above
+the plain tolerance().
+
+Usage:
+  python3 sar_bench.py [--latency-ms 0.3] [--settle-ms 20]
+                       [--calibrate --tau-ms 2] [--fixed-n] [--multi]
+  python3 sar_bench.py --tolerance
+"""
+
+import argparse
+import math
+import time
+
+import ohmmeter
+import sar_engine
+import voltmeter
+from fake_pi import FakePi
+
+INPUTS = (0.0, 7.4, 15.5, 22.9, 31.0)
+MULTI_PINS = (23, 24, 18)
+MULTI_INPUTS = ((12.3, 25.1, 3.2), (15.2, 15.6, 16.1), (0.0, 31.0, 15.5))
+
+
+def _fake(args, pin, vin):
+    return FakePi({pin: vin}, latency_s=args.latency_ms / 1000,
+                  tau_s=args.tau_ms / 1000)
+
+
+def _bench_once(args, pi, pin):
+    pi.reset_counters()
+    t0 = time.perf_counter()
+    confidence = None if args.fixed_n else sar_engine.AVG_CONFIDENCE
+    step = voltmeter._averaged_measure(pi, 1, pin, n=args.n, confidence=confidence)
+    return step, time.perf_counter() - t0
+
+
+def _calibrate(args, pin):
+    profile = None
+    for vin in INPUTS:
+        engine = sar_engine.get_engine(_fake(args, pin, vin), 1)
+        profile, _ = engine.calibrate_settle(pin, merge_with=profile)
+    return profile
+
+
+def _table(args, pin, calibrate=False):
+    cols = []
+    for daemon in (False, True):
+        sar_engine.USE_DAEMON_SAR = daemon
+        if calibrate:
+            _calibrate(args, pin)
+        col = [f"{[round(t * 1000, 1) for t in sar_engine.settle_profile()]}"]
+        for vin in INPUTS:
+            pi = _fake(args, pin, vin)
+            step, dt = _bench_once(args, pi, pin)
+            st = sar_engine.get_engine(pi, 1).stats()
+            col.append(f"step={step:2d} rt={pi.round_trips:3d} "
+                       f"spi={st['spi_writes']:2d} {dt * 1000:6.1f}ms")
+        cols.append(col)
+    sar_engine.USE_DAEMON_SAR = False
+
+    print(f"{'input':>6} | {'python':>34} | {'daemon':>34}")
+    print(f"{'ms':>6} | {cols[0][0]:>34} | {cols[1][0]:>34}")
+    for i, vin in enumerate(INPUTS, start=1):
+        print(f"{vin:6.1f} | {cols[0][i]:>34} | {cols[1][i]:>34}")
+
+
+def _multi_table(args):
+    print(f"{'inputs':>18} | {'separate':>30} | {'multi':>30} | {'rt':>4}")
+    for vins in MULTI_INPUTS:
+        cols, trips = [], []
+        for multi in (False, True):
+            pi = FakePi(dict(zip(MULTI_PINS, vins)),
+                        latency_s=args.latency_ms / 1000, tau_s=args.tau_ms / 1000)
+            engine = sar_engine.get_engine(pi, 1)
+            t0 = time.perf_counter()
+            if multi:
+                steps = engine.convert_multi(MULTI_PINS)
+            else:
+                steps = {pin: engine.convert(pin) for pin in MULTI_PINS}
+            dt = time.perf_counter() - t0
+            codes = ",".join(f"{steps[p]:2d}" for p in MULTI_PINS)
+            cols.append(f"{codes} rt={pi.round_trips:2d} {dt * 1000:6.1f}ms")
+            trips.append(pi.round_trips)
+        label = ",".join(f"{v:.1f}" for v in vins)
+        print(f"{label:>18} | {cols[0]:>30} | {cols[1]:>30} | {trips[1] / trips[0]:4.0%}")
+
+
+def _tolerance_table():
+    print(f"{'step':>6} {'ohms':>9} {'tol':>8} {'quiet':>8} {'spread':>8}")
+    step = 0.0
+    while step <= sar_engine.MCP4131_MAX_STEPS:
+        r = ohmmeter.step_to_resistance(step)
+        tol = ohmmeter.tolerance(step)
+        fracs = [ohmmeter.fractional_tolerance(step, u)
+                 for u in (sar_engine.QUANT_UNCERTAINTY, sar_engine.SUB_LSB_FLOOR)]
+        for frac in fracs:
+            assert math.isfinite(frac) and frac <= tol, (step, tol, frac)
+        print(f"{step:6.2f} {r:9.1f} {tol:8.1f} {fracs[0]:8.1f} {fracs[1]:8.1f}")
+        step += 0.25
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency-ms", type=float, default=0.3)
+    ap.add_argument("--settle-ms", type=float, default=sar_engine.SLOW_SETTLE_S * 1000)
+    ap.add_argument("--tau-ms", type=float, default=0.0)
+    ap.add_argument("--calibrate", action="store_true")
+    ap.add_argument("--fixed-n", action="store_true",
+                    help="no confidence early exit (majority exit still applies)")
+    ap.add_argument("--multi", action="store_true",
+                    help="compare per-pin conversions with convert_multi")
+    ap.add_argument("--tolerance", action="store_true",
+                    help="fractional ohmmeter tolerance over the step range")
+    ap.add_argument("-n", type=int, default=11)
+    args = ap.parse_args()
+
+    if args.tolerance:
+        _tolerance_table()
+        return
+
+    sar_engine.SLOW_SETTLE_S = args.settle_ms / 1000
+    sar_engine.set_settle_profile([sar_engine.SLOW_SETTLE_S] * sar_engine.SAR_BITS)
+
+    pin = voltmeter.COMPARATOR1_PIN
+    print(f"latency={args.latency_ms} ms  tau={args.tau_ms} ms  n={args.n}")
+    if args.multi:
+        _multi_table(args)
+        return
+    _table(args, pin)
+
+    if args.calibrate:
+        print()
+        _table(args, pin, calibrate=True)
+
+
+if __name__ == "__main__":
+    main()
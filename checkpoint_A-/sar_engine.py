@@ -0,0 +1,591 @@
+"""
+sar_engine.py
+Shared SAR (successive-approximation) ADC engine.
+
+Every SAR conversion in the tool bench goes through SarEngine:
+  voltmeter._sar_measure        (CE1 MCP4131, GPIO 23)
+  ohmmeter.sar_measure          (CE1 MCP4131, GPIO 24)
+  DC_ref_internal._sar_measure  (CE1 MCP4131, GPIO 18)
+  sar_logic.SAR_ADC.read_step   (MCP4231 wiper, 7-bit)
+
+One engine drives one DAC.  The comparator pin is chosen per
+conversion, so the three CE1 instruments share a single engine (see
+get_engine) and its record of the last DAC code written, which lets it
+skip redundant SPI writes.  convert_multi() converts all of them in one
+DAC sweep, sampling every comparator with a single read_bank_1; that
+costs about one conversion only when the inputs are close, and still
+some three quarters of separate conversions when they are spread.
+
+Configuration:
+  bits          : SAR resolution
+  max_step      : highest step (defaults to 2**bits - 1)
+  dac_max_code  : DAC register value at max_step (steps are scaled)
+  dac_cmd       : SPI command byte (MCP4x31 wiper select)
+  keep_level    : comparator level meaning "input >= DAC, keep the bit"
+  settle_s      : one delay, or a per-bit profile MSB first; None follows
+                  the shared CE1 profile (settle_profile.json)
+  daemon        : run conversions as a pigpio stored script (sar_script.py);
+                  None follows USE_DAEMON_SAR
+
+Counters (stats()): conversions, spi_writes, skipped_writes,
+comparator_reads and sleep_s.
+"""
+
+import os
+import json
+import math
+import time
+from collections import deque
+
+from sar_script import DaemonSar, script_fits
+
+MCP4131_MAX_STEPS = 31
+MCP4131_MAX_CODE  = 127
+SAR_BITS          = 5
+
+SLOW_SETTLE_S = 0.02
+
+# Run the bit-trial loop inside pigpiod (sar_script.py) instead of
+# driving every DAC write / comparator read over the socket.
+USE_DAEMON_SAR = False
+
+# -------------------------------------------------------------------
+# Per-bit settle profile for the CE1 DAC, MSB (bit 4) first.
+#
+# The MSB trial can move the DAC by 16 steps, the LSB trial by one,
+# so the LSB settles far sooner.  SarEngine.calibrate_settle() finds the
+# shortest delay per bit that still gives the slow-path code; it is
+# saved to SETTLE_PROFILE_PATH.  Until then every bit uses SLOW_SETTLE_S.
+# -------------------------------------------------------------------
+SETTLE_PROFILE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "settle_profile.json"
+)
+SETTLE_CANDIDATES_S = (0.01, 0.005, 0.003, 0.002, 0.001, 0.0005, 0.0002, 0.0001)
+
+# Sequential early exit for averaged(): stop as soon as one code is the
+# median of the n conversions with this confidence (None = always run n).
+AVG_CONFIDENCE = 0.95
+
+# Tracking mode for the live screens: re-check the neighbours of the last
+# code instead of redoing the full search, and fall back to a full SAR
+# once the input has moved more than TRACK_WINDOW steps.
+TRACK_WINDOW     = 2
+TRACK_MEDIAN_N   = 5
+TRACK_INTERVAL_S = 0.1
+
+# Sub-LSB estimate (sub_lsb_estimate): input noise dithers the comparator,
+# so the mean of repeated codes resolves a fraction of a step.  Codes
+# that never spread give no such information and keep the +/-half-step
+# quantisation uncertainty; SUB_LSB_FLOOR is the best ever claimed, in
+# steps, to allow for DAC step-size error.
+QUANT_UNCERTAINTY = 0.5
+SUB_LSB_FLOOR     = 0.125
+TRACK_FRACTION_N  = 16
+
+
+def load_settle_profile(path=SETTLE_PROFILE_PATH):
+    """Return the saved per-bit profile, or None if there is none."""
+    try:
+        with open(path) as f:
+            profile = json.load(f)["settle_s"]
+    except (OSError, ValueError, KeyError):
+        return None
+    if len(profile) != SAR_BITS:
+        return None
+    return [float(t) for t in profile]
+
+
+def save_settle_profile(profile, path=SETTLE_PROFILE_PATH):
+    with open(path, "w") as f:
+        json.dump({"settle_s": list(profile)}, f, indent=2)
+
+
+_settle_profile = load_settle_profile() or [SLOW_SETTLE_S] * SAR_BITS
+
+
+def settle_profile():
+    """Current shared per-bit settle times in seconds, MSB first."""
+    return list(_settle_profile)
+
+
+def set_settle_profile(profile):
+    global _settle_profile
+    if len(profile) != SAR_BITS:
+        raise ValueError(f"settle profile needs {SAR_BITS} entries")
+    _settle_profile = [float(t) for t in profile]
+
+
+def settle_for_bit(bit_pos):
+    """Shared settle time after writing the trial for bit_pos (4 = MSB)."""
+    return _settle_profile[SAR_BITS - 1 - bit_pos]
+
+
+def _binom_tail(k, c):
+    """P(X >= c) for X ~ Binomial(k, 1/2)."""
+    return sum(math.comb(k, i) for i in range(c, k + 1)) / 2 ** k
+
+
+def sequential_median(convert, n=11, confidence=AVG_CONFIDENCE):
+    """
+    Median of up to n calls to convert(), stopping early when possible.
+
+    Stops when one code
+    - already holds a strict majority of n, so the full-n median cannot
+      change, or
+    - has a count among the k codes so far that a code holding no more
+      than half the conversions would reach with probability
+      <= 1 - confidence (one-sided binomial test against 1/2).
+
+    A quiet input stops after 5 conversions at 0.95; a code split evenly
+    between two steps still runs all n.
+
+    Returns (step, conversions_used).
+    """
+    counts = {}
+    readings = []
+    for k in range(1, n + 1):
+        code = convert()
+        readings.append(code)
+        counts[code] = counts.get(code, 0) + 1
+        c = counts[code]
+        if c > n // 2:
+            return code, k
+        if confidence is not None and _binom_tail(k, c) <= 1.0 - confidence:
+            return code, k
+
+    readings.sort()
+    return readings[n // 2], n
+
+
+def sub_lsb_estimate(codes):
+    """
+    Fractional step from a set of repeated SAR codes.
+
+    Returns (mean, uncertainty), both in steps.  The mean is on the same
+    scale as the calibration tables (integer k = centre of code k).  The
+    uncertainty is the standard error of the mean when the codes spread
+    over more than one step, else QUANT_UNCERTAINTY.
+    """
+    n = len(codes)
+    if n == 0:
+        raise ValueError("no codes")
+    mean = sum(codes) / n
+    if n < 2 or min(codes) == max(codes):
+        return mean, QUANT_UNCERTAINTY
+    var = sum((c - mean) ** 2 for c in codes) / (n - 1)
+    return mean, max(math.sqrt(var / n), SUB_LSB_FLOOR)
+
+
+class SarEngine:
+    def __init__(self, pi, spi_handle, bits=SAR_BITS, max_step=None,
+                 dac_max_code=MCP4131_MAX_CODE, dac_cmd=0x00, keep_level=0,
+                 settle_s=None, daemon=None):
+        self.pi = pi
+        self.spi_handle = spi_handle
+        self.bits = bits
+        self.max_step = (1 << bits) - 1 if max_step is None else max_step
+        self.dac_max_code = dac_max_code
+        self.dac_cmd = dac_cmd
+        self.keep_level = keep_level
+        # None = follow the shared CE1 profile (5-bit engines only)
+        self._settle = None
+        if settle_s is None and bits != SAR_BITS:
+            settle_s = SLOW_SETTLE_S
+        if settle_s is not None:
+            self._settle = self._as_profile(settle_s)
+        self._daemon = daemon
+        self._daemon_sars = {}
+        self._last_code = None
+        self._last_write_t = 0.0
+        self.reset_stats()
+
+    # -- configuration ----------------------------------------------------
+
+    @property
+    def daemon(self):
+        use = USE_DAEMON_SAR if self._daemon is None else self._daemon
+        return use and script_fits(self.bits)
+
+    @daemon.setter
+    def daemon(self, value):
+        self._daemon = value
+
+    def settle_profile(self):
+        """Per-bit settle times in seconds, MSB first."""
+        if self._settle is None:
+            return settle_profile()
+        return list(self._settle)
+
+    def _as_profile(self, profile):
+        if isinstance(profile, (int, float)):
+            profile = [profile] * self.bits
+        if len(profile) != self.bits:
+            raise ValueError(f"settle profile needs {self.bits} entries")
+        return [float(t) for t in profile]
+
+    def set_settle_profile(self, profile):
+        """Set the profile; a single number applies to every bit.
+
+        Engines that follow the shared CE1 profile update it.
+        """
+        if self._settle is None:
+            set_settle_profile(self._as_profile(profile))
+        else:
+            self._settle = self._as_profile(profile)
+
+    def settle_for_bit(self, bit_pos):
+        return self.settle_profile()[self.bits - 1 - bit_pos]
+
+    # -- counters ---------------------------------------------------------
+
+    def reset_stats(self):
+        self.conversions = 0
+        self.spi_writes = 0
+        self.skipped_writes = 0
+        self.comparator_reads = 0
+        self.sleep_s = 0.0
+
+    def stats(self):
+        return {
+            'conversions': self.conversions,
+            'spi_writes': self.spi_writes,
+            'skipped_writes': self.skipped_writes,
+            'comparator_reads': self.comparator_reads,
+            'sleep_s': self.sleep_s,
+        }
+
+    # -- DAC / comparator -------------------------------------------------
+
+    def dac_code(self, step):
+        """Scale a SAR step (0..max_step) to the DAC register value."""
+        step = max(0, min(step, self.max_step))
+        return round(step * self.dac_max_code / self.max_step)
+
+    def write_step(self, step, force=False):
+        """Write step to the DAC unless it already holds that code.
+
+        Returns True if an SPI write was made.
+        """
+        code = self.dac_code(step)
+        if code == self._last_code and not force:
+            self.skipped_writes += 1
+            return False
+        self.pi.spi_write(self.spi_handle, [self.dac_cmd, code])
+        self._last_code = code
+        self._last_write_t = time.monotonic()
+        self.spi_writes += 1
+        return True
+
+    def invalidate(self):
+        """Forget the last DAC code (something else wrote the DAC)."""
+        self._last_code = None
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+            self.sleep_s += seconds
+
+    def settle(self, seconds):
+        """Sleep until `seconds` have passed since the last DAC write."""
+        self.sleep(seconds - (time.monotonic() - self._last_write_t))
+
+    def read_comparator(self, comp_pin):
+        self.comparator_reads += 1
+        return self.pi.read(comp_pin)
+
+    def _keeps_at(self, comp_pin, step, settle):
+        """Write step (unless already there), settle, and compare.
+
+        True means input >= DAC (keep).
+        """
+        self.write_step(step)
+        self.settle(settle)
+        return self.read_comparator(comp_pin) == self.keep_level
+
+    # -- conversions ------------------------------------------------------
+
+    def convert(self, comp_pin, verbose=False):
+        """Full SAR conversion on comp_pin. Returns the step."""
+        self.conversions += 1
+        if self.daemon:
+            return self._convert_daemon(comp_pin)
+
+        step = 0
+        for bit_pos in range(self.bits - 1, -1, -1):
+            # The trial is the step value plus the next significant bit
+            trial = min(step | (1 << bit_pos), self.max_step)
+            self.write_step(trial)
+            self.settle(self.settle_for_bit(bit_pos))
+
+            comp = self.read_comparator(comp_pin)
+            keep = comp == self.keep_level
+            if verbose:
+                print(
+                    f"  bit {bit_pos}: trial={trial:2d}  comp={comp}  "
+                    f"-> {'KEEP' if keep else 'DISCARD'}"
+                )
+            if keep:
+                step = trial
+
+        # Park the DAC on the result
+        self.write_step(step)
+        return step
+
+    def _convert_daemon(self, comp_pin):
+        sar = self._daemon_sars.get(comp_pin)
+        if sar is None:
+            sar = DaemonSar(self.pi, comp_pin, self.bits, self.max_step,
+                            self.dac_max_code, self.dac_cmd, self.keep_level)
+            self._daemon_sars[comp_pin] = sar
+        step, slept = sar.measure(self.spi_handle, self.settle_profile())
+        self.spi_writes += self.bits + 1
+        self.comparator_reads += self.bits
+        self.sleep_s += slept
+        self._last_code = self.dac_code(step)
+        self._last_write_t = time.monotonic()
+        return step
+
+    def track(self, comp_pin, prev_step, window=TRACK_WINDOW):
+        """
+        Tracking conversion seeded from prev_step.
+
+        The code is the highest step whose comparator says keep.  Step
+        prev+1 is tried first; if the input is above it the search walks
+        up, otherwise prev itself is confirmed (or the search walks down).
+        An unchanged input costs two DAC writes.  Moving more than
+        `window` steps, or having no previous code, does a full SAR.
+        """
+        if prev_step is None:
+            return self.convert(comp_pin)
+
+        # Every move here is a single step, so the LSB settle is enough.
+        settle = self.settle_for_bit(0)
+        step = max(0, min(prev_step, self.max_step))
+        moved = 0
+
+        while step < self.max_step and self._keeps_at(comp_pin, step + 1, settle):
+            step += 1
+            moved += 1
+            if moved > window:
+                return self.convert(comp_pin)
+        if moved:
+            self.conversions += 1
+            return step
+
+        while step > 0 and not self._keeps_at(comp_pin, step, settle):
+            step -= 1
+            moved += 1
+            if moved > window:
+                return self.convert(comp_pin)
+        self.conversions += 1
+        return step
+
+    def averaged(self, comp_pin, n=11, confidence=AVG_CONFIDENCE,
+                 with_count=False, verbose=False):
+        """Median step of up to n conversions (sequential_median).
+
+        with_count=True returns (step, conversions_used) instead.
+        """
+        step, used = sequential_median(
+            lambda: self.convert(comp_pin, verbose), n, confidence)
+        return (step, used) if with_count else step
+
+    def fractional(self, comp_pin, n=11):
+        """n conversions reduced by sub_lsb_estimate: (mean, uncertainty)."""
+        return sub_lsb_estimate([self.convert(comp_pin) for _ in range(n)])
+
+    def read_comparators(self, comp_pins):
+        """Sample every pin in comp_pins with one read_bank_1.
+
+        Returns {pin: True if keep (input >= DAC)}.
+        """
+        self.comparator_reads += 1
+        levels = self.pi.read_bank_1()
+        return {pin: ((levels >> pin) & 1) == self.keep_level for pin in comp_pins}
+
+    def convert_multi(self, comp_pins, verbose=False):
+        """
+        Convert every comparator sharing this DAC in one sweep.
+
+        Each channel keeps the interval [lo, hi] its code can still be in.
+        Every step bisects the widest open interval, and the single bank
+        read that follows narrows every channel the trial falls inside,
+        so channels with nearby inputs resolve together.  The settle time
+        follows the size of the DAC jump.  Always runs the Python loop.
+
+        The saving depends on the spread.  On FakePi, three 5-bit
+        channels took 10 round trips with close inputs, against 30
+        converted separately.  Spread inputs took 24 against 31, because
+        each channel's interval then needs trials of its own.
+
+        Returns {pin: step}.
+        """
+        comp_pins = list(comp_pins)
+        lo = {pin: 0 for pin in comp_pins}
+        hi = {pin: self.max_step for pin in comp_pins}
+        prev = None
+        if self._last_code is not None:
+            prev = round(self._last_code * self.max_step / self.dac_max_code)
+
+        while True:
+            open_pins = [p for p in comp_pins if lo[p] < hi[p]]
+            if not open_pins:
+                break
+            widest = max(open_pins, key=lambda p: hi[p] - lo[p])
+            trial = (lo[widest] + hi[widest] + 1) // 2
+
+            jump = self.max_step if prev is None else abs(trial - prev)
+            bit_pos = min(max(jump.bit_length() - 1, 0), self.bits - 1)
+            self.write_step(trial)
+            self.settle(self.settle_for_bit(bit_pos))
+            prev = trial
+
+            keeps = self.read_comparators(open_pins)
+            for pin in open_pins:
+                if not lo[pin] < trial <= hi[pin]:
+                    continue
+                if keeps[pin]:
+                    lo[pin] = trial
+                else:
+                    hi[pin] = trial - 1
+            if verbose:
+                print(f"  trial={trial:2d}  "
+                      + "  ".join(f"{p}:[{lo[p]},{hi[p]}]" for p in comp_pins))
+
+        self.conversions += len(comp_pins)
+        return dict(lo)
+
+    def averaged_multi(self, comp_pins, n=11):
+        """Per-channel median of n convert_multi passes. Returns {pin: step}."""
+        samples = {pin: [] for pin in comp_pins}
+        for _ in range(n):
+            for pin, step in self.convert_multi(comp_pins).items():
+                samples[pin].append(step)
+        return {pin: sorted(s)[len(s) // 2] for pin, s in samples.items()}
+
+    # -- settle calibration -----------------------------------------------
+
+    def _profile_codes(self, comp_pin, profile, trials, slow_s):
+        """
+        Run `trials` conversions with the given profile.  The DAC is parked
+        at alternate ends of its range first so the MSB trial always makes
+        a worst-case jump.
+        """
+        saved = self.settle_profile()
+        self.set_settle_profile(profile)
+        codes = []
+        try:
+            for i in range(trials):
+                self.write_step(0 if i % 2 else self.max_step)
+                self.settle(slow_s)
+                codes.append(self.convert(comp_pin))
+        finally:
+            self.set_settle_profile(saved)
+        return codes
+
+    def calibrate_settle(self, comp_pin, candidates=SETTLE_CANDIDATES_S,
+                         trials=6, merge_with=None, slow_s=None):
+        """
+        Find the shortest settle time per bit that reproduces the slow path.
+
+        The slow path (slow_s, default SLOW_SETTLE_S, on every bit) is run
+        first; then, LSB first, each bit's delay is shortened through
+        `candidates` for as long as every conversion stays within the
+        codes the slow path produced.  Going LSB first means the later,
+        larger MSB cuts are only accepted if the bits after them still
+        settle in their already-short slots.
+
+        Run it once per input level of interest, passing the previous
+        result as merge_with, to keep the longest delay seen for each bit.
+        Calibrate in the daemon mode that will be used for measuring: the
+        Python path adds socket time on top of every delay.
+
+        The engine keeps the new profile.  Returns (profile, reference_codes).
+        """
+        if slow_s is None:
+            slow_s = SLOW_SETTLE_S
+        slow = [slow_s] * self.bits
+        reference = self._profile_codes(comp_pin, slow, trials, slow_s)
+        lo, hi = min(reference), max(reference)
+
+        profile = list(slow)
+        for i in reversed(range(self.bits)):
+            for t in sorted(candidates, reverse=True):
+                if t >= profile[i]:
+                    continue
+                trial_profile = profile[:i] + [t] + profile[i + 1:]
+                codes = self._profile_codes(comp_pin, trial_profile, trials, slow_s)
+                if not all(lo <= c <= hi for c in codes):
+                    break
+                profile[i] = t
+
+        if merge_with is not None:
+            profile = [max(a, b) for a, b in zip(profile, merge_with)]
+
+        self.set_settle_profile(profile)
+        return profile, reference
+
+    def close(self):
+        for sar in self._daemon_sars.values():
+            sar.close()
+        self._daemon_sars.clear()
+
+
+class TrackingADC:
+    """
+    Live-screen reader: one tracking conversion per read(), reported as
+    the median of the last TRACK_MEDIAN_N codes so LSB dither does not
+    flicker on the LCD.
+
+    The last TRACK_FRACTION_N codes are also kept for fractional(); that
+    history restarts whenever the code moves by more than one step, since
+    that is the input changing rather than dither.
+    """
+
+    def __init__(self, pi, spi_handle, comp_pin,
+                 window=TRACK_WINDOW, median_n=TRACK_MEDIAN_N,
+                 fraction_n=TRACK_FRACTION_N):
+        self.engine = get_engine(pi, spi_handle)
+        self.comp_pin = comp_pin
+        self.window = window
+        self._recent = deque(maxlen=median_n)
+        self._history = deque(maxlen=fraction_n)
+
+    def read(self):
+        prev = self._recent[-1] if self._recent else None
+        step = self.engine.track(self.comp_pin, prev, self.window)
+        if prev is not None and abs(step - prev) > 1:
+            self._history.clear()
+        self._recent.append(step)
+        self._history.append(step)
+        return sorted(self._recent)[len(self._recent) // 2]
+
+    def fractional(self):
+        """sub_lsb_estimate of the codes since the input last moved."""
+        return sub_lsb_estimate(list(self._history))
+
+    def reset(self):
+        self._recent.clear()
+        self._history.clear()
+
+
+_engines = {}
+
+
+def get_engine(pi, spi_handle):
+    """
+    The shared CE1 MCP4131 engine (5-bit, steps scaled to 0..127,
+    comparator 0 = keep, shared settle profile) for this connection.
+    """
+    key = (id(pi), spi_handle)
+    engine = _engines.get(key)
+    if engine is None or engine.pi is not pi:
+        engine = SarEngine(pi, spi_handle)
+        _engines[key] = engine
+    return engine
+
+
+def close_engines(pi):
+    """Delete stored scripts and forget the engines for this connection."""
+    for key in [k for k, e in _engines.items() if e.pi is pi]:
+        _engines.pop(key).close()
@@ -11,6 +11,7 @@ the step closest to the actual Vin.
 import time
 import pigpio
 from ohms_steps import MAX_STEPS, step_to_ohms
+from sar_engine import SarEngine
 
 MAX_VOLTAGE = 6
 MIN_VOLTAGE = -6
@@ -36,35 +37,25 @@ class SAR_ADC:
 
         self.pi.set_mode(self.compare_pin, 0)  # input
 
+        # 7-bit wiper written directly (no step scaling); comparator 1
+        # means Vdac > Vin unless inverted.
+        self.engine = SarEngine(
+            pi, spi_handle,
+            bits=7,
+            max_step=MAX_STEPS - 1,
+            dac_max_code=MAX_STEPS - 1,
+            dac_cmd=0x00 if selected_pot == 0 else 0x10,
+            keep_level=1 if invert_comparator else 0,
+            settle_s=settle_time,
+        )
+
     def _write_step(self, step):
-        step = max(0, min(MAX_STEPS - 1, step))
-        cmd = 0x00 if self.selected_pot == 0 else 0x10
-        self.pi.spi_write(self.spi_handle, [cmd, step])
+        self.engine.write_step(step)
         time.sleep(self.settle_time)
 
     def read_step(self):
         """Perform SAR binary search, return best step value."""
-        low = 0
-        high = MAX_STEPS - 1
-        
-        while low <= high:
-            mid = (low + high) // 2
-
-            self._write_step(mid)
-            time.sleep(self.settle_time)
-
-            comp = self.pi.read(self.compare_pin)
-
-            if self.invert:
-                comp = 1 - comp
-
-            # Assume Vdac > Vin, else Vdac <= Vin
-            if comp == 1:
-                high = mid - 1
-            else:
-                low = mid + 1
-
-        return high        
+        return self.engine.convert(self.compare_pin)
         
     def _read_comparator(self):
         val = self.pi.read(self.compare_pin)
@@ -0,0 +1,150 @@
+"""
+sar_script.py
+Daemon-side SAR conversion using a pigpio stored script.
+
+The Python SAR loop costs one socket round trip for every DAC write,
+every comparator read and every settle sleep (16+ per conversion).
+This module uploads the whole bit-trial search to pigpiod once as a
+stored script, so a conversion is a single run_script call plus a
+status poll once the daemon has finished.
+
+pigpio scripts cannot build SPI byte lists from variables, so the
+binary search is unrolled into a decision tree: every trial node does
+a literal SPIW of its own DAC code, waits, reads the comparator and
+jumps.  A 5-bit tree needs 31 jump tags (pigpio allows 50), so this is
+limited to 5 bits.
+
+Script parameters:
+  p0      = SPI handle
+  p1..p5  = settle time in microseconds, MSB first
+  p9      = finished step (written by the script)
+"""
+
+import time
+import pigpio
+
+SAR_BITS        = 5
+MAX_STEP        = 31
+DAC_MAX_CODE    = 127
+MAX_SCRIPT_TAGS = 50
+
+PARAM_HANDLE    = 0
+PARAM_SETTLE    = 1   # p1..p5, one per bit position, MSB first
+PARAM_RESULT    = 9
+
+_POLL_S         = 0.001
+_TIMEOUT_S      = 2.0
+
+
+def _dac_code(step, max_step=MAX_STEP, dac_max_code=DAC_MAX_CODE):
+    """Same step -> DAC register scaling as SarEngine.dac_code."""
+    step = max(0, min(step, max_step))
+    return round(step * dac_max_code / max_step)
+
+
+def script_fits(bits):
+    """True if a `bits`-deep decision tree fits pigpio's script limits."""
+    return (1 << bits) - 1 <= MAX_SCRIPT_TAGS and bits <= PARAM_RESULT - PARAM_SETTLE
+
+
+def build_sar_script(comp_pin, bits=SAR_BITS, max_step=MAX_STEP,
+                     dac_max_code=DAC_MAX_CODE, dac_cmd=0x00, keep_level=0):
+    """
+    Return the pigpio script text for one SAR conversion on comp_pin.
+
+    A comparator reading of keep_level keeps the trial bit, anything
+    else discards it, matching SarEngine.convert.
+    """
+    if not script_fits(bits):
+        raise ValueError(f"{bits}-bit SAR does not fit in a pigpio script")
+
+    jump_discard = "jnz" if keep_level == 0 else "jz"
+    lines = []
+    tags = [0]
+
+    def new_tag():
+        tags[0] += 1
+        return tags[0]
+
+    def spiw(step):
+        code = _dac_code(step, max_step, dac_max_code)
+        return f"spiw p{PARAM_HANDLE} {dac_cmd} {code}"
+
+    def emit(step, bit_pos):
+        if bit_pos < 0:
+            # Leaf: park the DAC on the result, as the Python loop does
+            lines.append(spiw(step))
+            lines.append(f"lda {step} sta p{PARAM_RESULT} halt")
+            return
+
+        trial = min(step | (1 << bit_pos), max_step)
+        settle_param = PARAM_SETTLE + (bits - 1 - bit_pos)
+        discard = new_tag()
+
+        lines.append(spiw(trial))
+        lines.append(f"mics p{settle_param}")
+        lines.append(f"r {comp_pin} {jump_discard} {discard}")
+        emit(trial, bit_pos - 1)
+        lines.append(f"tag {discard}")
+        emit(step, bit_pos - 1)
+
+    emit(0, bits - 1)
+    return " ".join(lines)
+
+
+class DaemonSar:
+    """One stored SAR script for a comparator pin on a pigpio connection."""
+
+    def __init__(self, pi, comp_pin, bits=SAR_BITS, max_step=MAX_STEP,
+                 dac_max_code=DAC_MAX_CODE, dac_cmd=0x00, keep_level=0):
+        self.pi = pi
+        self.comp_pin = comp_pin
+        self.bits = bits
+        self._text = build_sar_script(comp_pin, bits, max_step,
+                                      dac_max_code, dac_cmd, keep_level)
+        self.script_id = None
+
+    def _ensure_script(self):
+        if self.script_id is None:
+            sid = self.pi.store_script(self._text.encode())
+            if sid < 0:
+                raise pigpio.error(f"store_script failed ({sid})")
+            self.script_id = sid
+        return self.script_id
+
+    def measure(self, spi_handle, settle_s):
+        """
+        Run one conversion inside pigpiod.
+
+        settle_s is a per-bit list ordered MSB first.
+        Returns (step, seconds spent sleeping while the script ran).
+        """
+        sid = self._ensure_script()
+
+        settle_us = [max(0, int(round(s * 1_000_000))) for s in settle_s]
+        self.pi.run_script(sid, [spi_handle] + settle_us)
+
+        # The script cannot finish before its settle delays have elapsed,
+        # so sleep through those instead of polling the socket.
+        slept = sum(settle_us) / 1_000_000
+        time.sleep(slept)
+
+        deadline = time.monotonic() + _TIMEOUT_S
+        while True:
+            status, pars = self.pi.script_status(sid)
+            if status == pigpio.PI_SCRIPT_HALTED:
+                return pars[PARAM_RESULT], slept
+            if status == pigpio.PI_SCRIPT_FAILED or status < 0:
+                raise pigpio.error(f"SAR script failed ({status})")
+            if time.monotonic() > deadline:
+                raise pigpio.error("SAR script timed out")
+            time.sleep(_POLL_S)
+            slept += _POLL_S
+
+    def close(self):
+        if self.script_id is not None:
+            try:
+                self.pi.delete_script(self.script_id)
+            except pigpio.error:
+                pass
+            self.script_id = None
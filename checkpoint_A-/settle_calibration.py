@@ -0,0 +1,74 @@
+"""
+settle_calibration.py
+Calibrate the per-bit SAR settle profile on the Pi-Hat.
+
+Sweeps the internal DC reference (CE0, MCP4231 W1) across its
+0.625 V steps and runs SarEngine.calibrate_settle() on the
+internal-reference comparator (GPIO 18) at each level, keeping the
+longest delay seen per bit.  The merged profile is written to
+settle_profile.json, which sar_engine.py loads at import.
+
+Make sure:
+- pigpiod is running
+- SPI is enabled
+- Nothing is connected to the external voltmeter input
+"""
+
+import time
+import pigpio
+
+import ohmmeter
+import sar_engine
+from DC_ref_internal import COMPARATOR_PIN
+from dc_reference_single import DCReferenceSingleGenerator, MIN_VOLT, MAX_VOLT
+from voltmeter import step_to_voltage
+
+LEVEL_STEP_V = 0.625
+
+
+def main():
+    pi = pigpio.pi()
+    if not pi.connected:
+        raise SystemExit("pigpiod not running - run 'sudo pigpiod' first.")
+
+    pi.set_mode(COMPARATOR_PIN, pigpio.INPUT)
+    pi.set_pull_up_down(COMPARATOR_PIN, pigpio.PUD_UP)
+
+    spi_ce0 = pi.spi_open(0, 50_000, 0)
+    spi_ce1 = pi.spi_open(ohmmeter.ADC_SPI_CHANNEL, ohmmeter.ADC_SPI_SPEED,
+                          ohmmeter.ADC_SPI_FLAGS)
+    dc_ref = DCReferenceSingleGenerator(pi, spi_ce0)
+
+    engine = sar_engine.get_engine(pi, spi_ce1)
+    print(f"Daemon SAR: {engine.daemon}")
+    profile = None
+    try:
+        dc_ref.start()
+        n_levels = int(round((MAX_VOLT - MIN_VOLT) / LEVEL_STEP_V)) + 1
+        for i in range(n_levels):
+            volts = MIN_VOLT + i * LEVEL_STEP_V
+            dc_ref.set_voltage(volts)
+            time.sleep(0.1)
+
+            profile, ref = engine.calibrate_settle(COMPARATOR_PIN, merge_with=profile)
+            step = sorted(ref)[len(ref) // 2]
+            print(f"  set={volts:+.3f} V  step={step:2d} "
+                  f"({step_to_voltage(step):+.2f} V)  "
+                  f"profile_ms={[round(t * 1000, 2) for t in profile]}")
+
+        engine.set_settle_profile(profile)
+        sar_engine.save_settle_profile(profile)
+        total = sum(profile)
+        slow = sar_engine.SLOW_SETTLE_S * sar_engine.SAR_BITS
+        print(f"Saved {sar_engine.SETTLE_PROFILE_PATH}")
+        print(f"Settle per conversion: {total * 1000:.1f} ms "
+              f"(was {slow * 1000:.1f} ms, {slow / total:.1f}x faster)")
+    finally:
+        dc_ref.cleanup()
+        pi.spi_close(spi_ce0)
+        pi.spi_close(spi_ce1)
+        pi.stop()
+
+
+if __name__ == "__main__":
+    main()
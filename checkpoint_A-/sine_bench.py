@@ -0,0 +1,315 @@
+"""
+sine_bench.py
+Benchmark SineWaveGenerator frequency switching against fake_pi.FakePi.
+
+Scrolls the frequency through the whole 1-10 kHz range twice (the second
+pass can hit the wave cache) and reports, per configuration, the mean
+set_frequency() time, socket round trips per switch and how many times
+the output was stopped while a wave was running.
+
+  uncached : one-entry cache, stop + send (the old rebuild-every-time path)
+  cached   : wave cache, stop + send
+  seamless : wave cache, REPEAT_SYNC hand-over on a cycle boundary
+  small    : seamless on a daemon with 1000 pulses of wave memory,
+             where evictions fragment it and the cache has to be reset
+             (resets; each costs a gap)
+
+A second table compares wave builders per frequency: the original
+two-pulses-per-sample loop against build_sine_pulses(), giving pulse
+counts, build time, and a check that merging is lossless (the merged
+wave has the same high time in every sample slot as the unmerged one)
+and that the period matches the loop builder's.  The NumPy builder has
+a fixed cost of some 75 µs, so for small N it is slower than the loop;
+what it gains is about half the pulses.  The upload columns give the
+Python time to encode the merged wave for wave_add_generic (pigpio.pulse
+objects packed one by one) and as packed bytes (wave_add_packed for
+PACKED_MIN_PULSES or more).  The last tables show
+the sample plan (plan_samples) chosen for every frequency step, with
+single-period waves and with exact-frequency multi-period waves.
+
+--arb prints instead the compile time of arbitrary waveforms (normalise,
+hash, plan and build) for random sample arrays of growing size.
+
+--dual checks the dual output instead (build_dual_pulses): for several
+frequencies, N, ratios and phases the sine pin must have the plain
+wave's high time in every sample slot with sample 0 at time 0, and
+every rising edge of the square must be phase_deg (plus whole square
+periods) after sample 0, to the µs.  It asserts and prints the table.
+
+--modes prints the PWM mode report (pwm_mode_report) instead: for every
+oversample factor, with and without noise shaping, the chosen N, the
+carrier frequency, pulses and control blocks, build time and predicted
+THD.
+
+Usage:
+  python3 sine_bench.py [--latency-ms 0.3] [--passes 2] [--builds 200]
+  python3 sine_bench.py --arb
+  python3 sine_bench.py --modes [--builds 200]
+  python3 sine_bench.py --dual
+"""
+
+import argparse
+import math
+import struct
+import time
+from fractions import Fraction
+
+import numpy as np
+import pigpio
+
+import Sinewave
+from fake_pi import MAX_WAVE_CBS, MAX_WAVE_PULSES, FakePi
+
+CONFIGS = (
+    ("uncached", dict(max_waves=1, seamless=False)),
+    ("cached",   dict(max_waves=Sinewave.WAVE_CACHE_MAX, seamless=False)),
+    ("seamless", dict(max_waves=Sinewave.WAVE_CACHE_MAX, seamless=True)),
+    ("small",    dict(max_waves=Sinewave.WAVE_CACHE_MAX, seamless=True,
+                      max_wave_pulses=1000)),
+)
+
+
+def _freqs(passes):
+    sweep = list(range(Sinewave.MIN_FREQ, Sinewave.MAX_FREQ + 1, Sinewave.FREQ_STEP))
+    return sweep * passes
+
+
+def _run(args, max_waves, seamless, max_wave_pulses=MAX_WAVE_PULSES):
+    pi = FakePi(latency_s=args.latency_ms / 1000, max_wave_pulses=max_wave_pulses)
+    gen = Sinewave.SineWaveGenerator(pi, seamless=seamless)
+    gen._cache.max_waves = max_waves
+    gen.set_amplitude(5.0)
+    gen.start()
+
+    pi.reset_counters()
+    gaps = pi.tx_gaps
+    freqs = _freqs(args.passes)
+    t0 = time.perf_counter()
+    for f in freqs:
+        gen.set_frequency(f)
+    dt = (time.perf_counter() - t0) / len(freqs)
+    result = (dt, pi.round_trips / len(freqs), pi.tx_gaps - gaps,
+              gen._cache.hits, gen._cache.misses, gen._cache.resets)
+    gen.cleanup()
+    return result
+
+
+def _loop_build(frequency, n):
+    """The original per-sample builder: two pigpio.pulse per slot."""
+    lut = [math.sin(2 * math.pi * i / n) for i in range(n)]
+    period_us = 1_000_000.0 / frequency
+    slot_list = []
+    acc = 0.0
+    used = 0
+    for _ in range(n):
+        acc += period_us / n
+        slot = int(round(acc - used))
+        if slot < 1:
+            slot = 1
+        slot_list.append(slot)
+        used += slot
+    slot_list[-1] += int(round(period_us)) - sum(slot_list)
+    if slot_list[-1] < 1:
+        slot_list[-1] = 1
+
+    mask = 1 << Sinewave.PWM_GPIO
+    pulses = []
+    for sample, slot_us in zip(lut, slot_list):
+        duty = min(1.0, max(0.0, 0.5 + 0.5 * sample))
+        high_us = int(round(duty * slot_us))
+        low_us = slot_us - high_us
+        if high_us > 0:
+            pulses.append(pigpio.pulse(mask, 0, high_us))
+        if low_us > 0:
+            pulses.append(pigpio.pulse(0, mask, low_us))
+    return pulses
+
+
+def _high_per_slot(pulses, frequency, n, shift=0):
+    """High µs inside each sample slot, the timeline rotated by shift µs."""
+    mask = 1 << Sinewave.PWM_GPIO
+    t = np.roll(np.repeat(pulses["on"] == mask, pulses["delay"]), -shift)
+    ends = np.cumsum(Sinewave._slot_widths(frequency, n))
+    return np.add.reduceat(t, np.concatenate(([0], ends[:-1])))
+
+
+def _budget():
+    """One wave's share of the fake daemon's pulses and control blocks."""
+    return (MAX_WAVE_PULSES // Sinewave.WAVES_IN_BUDGET,
+            MAX_WAVE_CBS // Sinewave.WAVES_IN_BUDGET)
+
+
+def _plan_table(max_periods):
+    print(f"max_periods={max_periods}")
+    print(f"{'freq':>6} | {'N':>3} {'per':>3} {'actual':>10} {'err ppm':>8} {'slot':>4} "
+          f"{'t.err':>5} {'pulses':>6} {'thd':>6} | candidates N:thd")
+    for f in range(Sinewave.MIN_FREQ, Sinewave.MAX_FREQ + 1, Sinewave.FREQ_STEP):
+        p = Sinewave.plan_samples(f, *_budget(), max_periods=max_periods)
+        others = " ".join(f"{q.n}:{q.thd:.0%}" for q in
+                          Sinewave.sample_plans(f, *_budget(), max_periods=max_periods))
+        print(f"{f:6d} | {p.n:3d} {p.periods:3d} {p.frequency:10.3f} "
+              f"{p.freq_error / f * 1e6:+8.1f} {p.min_slot_us:4d} "
+              f"{p.timing_error_us:5.2f} {p.pulses:6d} {p.thd:6.1%} | {others}")
+
+
+def _generic_bytes(pulses):
+    """What wave_add_generic does with a PULSE_DTYPE array's pulses."""
+    ext = bytearray()
+    for p in [pigpio.pulse(on, off, delay) for on, off, delay in pulses.tolist()]:
+        ext.extend(struct.pack("III", p.gpio_on, p.gpio_off, p.delay))
+    return ext
+
+
+def _timed(fn, builds):
+    t0 = time.perf_counter()
+    for _ in range(builds):
+        out = fn()
+    return out, (time.perf_counter() - t0) / builds
+
+
+def _builder_table(args):
+    mask = 1 << Sinewave.PWM_GPIO
+    print(f"{'freq':>6} {'N':>3} | {'loop pulses':>11} {'us':>7} | "
+          f"{'numpy pulses':>12} {'us':>7} | {'same':>4} | "
+          f"{'upload us':>9} {'packed':>6}")
+    for f in range(Sinewave.MIN_FREQ, Sinewave.MAX_FREQ + 1, 1500):
+        n = Sinewave.plan_samples(f, *_budget()).n
+        old, t_old = _timed(lambda: _loop_build(f, n), args.builds)
+        new = Sinewave.build_sine_pulses(f, n, alternate=False)
+        alt, t_alt = _timed(lambda: Sinewave.build_sine_pulses(f, n), args.builds)
+
+        # Slot 0 opens with its high time; if the merged first pulse is
+        # longer, it also holds the last slot's closing high time.
+        shift = int(alt["delay"][0]) - int(new["delay"][0])
+        same = (sum(p.delay for p in old) == int(alt["delay"].sum())
+                and np.array_equal(_high_per_slot(new, f, n),
+                                   _high_per_slot(alt, f, n, shift)))
+        _, t_generic = _timed(lambda: _generic_bytes(alt), args.builds)
+        _, t_packed = _timed(alt.tobytes, args.builds)
+        print(f"{f:6d} {n:3d} | {len(old):11d} {t_old * 1e6:7.1f} | "
+              f"{len(new):5d}/{len(alt):<6d} {t_alt * 1e6:7.1f} | {str(same):>4} | "
+              f"{t_generic * 1e6:9.1f} {t_packed * 1e6:6.2f}")
+
+
+def _pin_levels(pulses, gpio):
+    """1 µs timeline of gpio's level; it starts low, as after stop()."""
+    mask = 1 << gpio
+    level, levels = False, np.empty(len(pulses), dtype=bool)
+    for i, p in enumerate(pulses):
+        level = bool(p["on"] & mask) or (level and not p["off"] & mask)
+        levels[i] = level
+    return np.repeat(levels, pulses["delay"])
+
+
+def _dual_table():
+    print(f"{'freq':>6} {'N':>3} {'ratio':>5} {'phase':>6} | {'per':>3} {'pulses':>6} | "
+          f"{'slots':>5} {'edge err us':>11}")
+    for f, n in ((10_000, 8), (5000, 16), (3000, 24), (1000, 48)):
+        for ratio in (Fraction(1), Fraction(1, 2), Fraction(3)):
+            for phase in (0.0, 90.0, 237.0):
+                periods = Sinewave.dual_periods(1, ratio)
+                table = Sinewave.sine_table(n)
+                ref = Sinewave.build_pwm_pulses(f, table, periods=periods, alternate=False)
+                dual = Sinewave.build_dual_pulses(f, table, ratio, phase, periods=periods)
+                span = int(dual["delay"].sum())
+
+                sine = _pin_levels(dual, Sinewave.PWM_GPIO)
+                ends = np.cumsum(Sinewave._slot_widths(f, n, periods))
+                starts = np.concatenate(([0], ends[:-1]))
+                slots = np.array_equal(np.add.reduceat(sine, starts),
+                                       np.add.reduceat(_pin_levels(ref, Sinewave.PWM_GPIO),
+                                                       starts))
+
+                square = _pin_levels(dual, Sinewave.DUAL_GPIO).astype(np.int8)
+                rising = np.flatnonzero(np.diff(square, prepend=square[-1]) == 1)
+                edges = 2 * int(periods * ratio)
+                expect = np.sort(np.rint(phase / 360.0 * span / periods
+                                         + np.arange(0, edges, 2) * span / edges)
+                                 .astype(np.int64) % span)
+                err = int(np.abs(rising - expect).max()) if len(rising) == len(expect) else -1
+                print(f"{f:6d} {n:3d} {str(ratio):>5} {phase:6.1f} | {periods:3d} "
+                      f"{len(dual):6d} | {str(slots):>5} {err:11d}")
+                assert slots and err == 0, (f, n, ratio, phase)
+
+
+def _arb_table():
+    rng = np.random.default_rng(1)
+    print(f"{'samples':>8} {'freq':>6} | {'hash ms':>7} {'plan ms':>7} "
+          f"{'build ms':>8} | {'N':>3} {'per':>3} {'pulses':>6} {'dist':>6}")
+    for size in (256, 4096, 65536, 1_048_576):
+        # Smooth random shape: cumulative noise, made periodic
+        walk = np.cumsum(rng.normal(size=size))
+        raw = walk - np.linspace(0, walk[-1], size)
+        for f in (Sinewave.MIN_FREQ, Sinewave.MAX_FREQ):
+            t0 = time.perf_counter()
+            samples = Sinewave.normalize_samples(raw)
+            Sinewave.waveform_key(samples)
+            t1 = time.perf_counter()
+            p = Sinewave.plan_samples(f, *_budget(), max_periods=Sinewave.MAX_PERIODS,
+                                      samples=samples)
+            t2 = time.perf_counter()
+            Sinewave.build_pwm_pulses(f, Sinewave.resample_table(samples, p.n),
+                                      periods=p.periods)
+            t3 = time.perf_counter()
+            print(f"{size:8d} {f:6d} | {(t1 - t0) * 1e3:7.2f} {(t2 - t1) * 1e3:7.2f} "
+                  f"{(t3 - t2) * 1e3:8.3f} | {p.n:3d} {p.periods:3d} {p.pulses:6d} "
+                  f"{p.thd:6.1%}")
+
+
+def _mode_table(args):
+    print(f"{'freq':>6} {'x':>2} {'shape':>5} | {'N':>3} {'cells':>5} {'carrier':>9} | "
+          f"{'pulses':>6} {'cbs':>5} {'build us':>8} | {'thd':>6}")
+    for f in (Sinewave.MIN_FREQ, 2000, 5000, 7500, Sinewave.MAX_FREQ):
+        for p in Sinewave.pwm_mode_report(f, *_budget(), max_periods=Sinewave.MAX_PERIODS):
+            _, t = _timed(lambda: Sinewave.build_sine_pulses(
+                f, p.n, periods=p.periods, oversample=p.oversample,
+                noise_shaping=p.shaped), args.builds)
+            cells = p.n * p.oversample
+            print(f"{f:6d} {p.oversample:2d} {'sd' if p.shaped else '-':>5} | "
+                  f"{p.n:3d} {cells:5d} {p.frequency * cells / 1000:6.0f} kHz | "
+                  f"{p.pulses:6d} {p.cbs:5d} {t * 1e6:8.1f} | {p.thd:6.2%}")
+        print()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency-ms", type=float, default=0.3)
+    ap.add_argument("--passes", type=int, default=2)
+    ap.add_argument("--builds", type=int, default=200)
+    ap.add_argument("--arb", action="store_true",
+                    help="arbitrary waveform compile times only")
+    ap.add_argument("--modes", action="store_true",
+                    help="oversampled / noise-shaped PWM report only")
+    ap.add_argument("--dual", action="store_true",
+                    help="dual output phase check only")
+    args = ap.parse_args()
+
+    if args.dual:
+        _dual_table()
+        return
+
+    if args.arb:
+        _arb_table()
+        return
+    if args.modes:
+        _mode_table(args)
+        return
+
+    print(f"latency={args.latency_ms} ms  switches={len(_freqs(args.passes))}")
+    print(f"{'config':>9} | {'ms/switch':>9} | {'rt/switch':>9} | {'gaps':>4} | "
+          f"{'hit/miss':>8} | {'resets':>6}")
+    for name, cfg in CONFIGS:
+        dt, rt, gaps, hits, misses, resets = _run(args, **cfg)
+        print(f"{name:>9} | {dt * 1000:9.2f} | {rt:9.1f} | {gaps:4d} | "
+              f"{hits:3d}/{misses:<4d} | {resets:6d}")
+
+    print()
+    _builder_table(args)
+
+    for max_periods in (1, Sinewave.MAX_PERIODS):
+        print()
+        _plan_table(max_periods)
+
+
+if __name__ == "__main__":
+    main()
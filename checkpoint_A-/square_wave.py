@@ -1,5 +1,17 @@
 import time
 
+import pigpio
+
+from wave_chains import (
+    BURST_CYCLES,
+    BURST_PERIOD_S,
+    Burst,
+    chain_delay,
+    chain_loop,
+    check_chain,
+    wave_periods,
+)
+
 PWM_GPIO = 13
 DUTY = 500_000   # 50% duty cycle
 
@@ -40,6 +52,19 @@ def _amp_to_step(amplitude):
     return int(_clamp(step, 0, MAX_WIPER))
 
 
+def _square_pulses(frequency, periods=1):
+    """pigpio pulses for `periods` 50% square periods on PWM_GPIO, high
+    first; the edges are rounded to whole µs so the span is exact.
+    Returns (pulses, span_us)."""
+    span_us = int(round(periods * 1_000_000 / frequency))
+    edges = [int(round(j * span_us / (2 * periods))) for j in range(2 * periods + 1)]
+    mask = 1 << PWM_GPIO
+    pulses = [pigpio.pulse(mask if j % 2 == 0 else 0, 0 if j % 2 == 0 else mask,
+                           edges[j + 1] - edges[j])
+              for j in range(2 * periods)]
+    return pulses, span_us
+
+
 class SquareWaveGenerator:
     def __init__(self, pi, spi_handle, settle_time=SETTLE_TIME, debug=True):
         self._pi = pi
@@ -52,6 +77,8 @@ class SquareWaveGenerator:
         self._running = False
 
         self._last_step = None
+        self._burst = None
+        self._burst_wave = None
 
     def _write_wiper(self, step):
         step = int(_clamp(step, 0, MAX_WIPER))
@@ -90,8 +117,72 @@ class SquareWaveGenerator:
         if self._debug:
             print("[SquareWave] started")
 
+    def start_burst(self, cycles=BURST_CYCLES, period_s=BURST_PERIOD_S):
+        """
+        Repeated bursts of `cycles` square periods every period_s, low in
+        between, until stop().
+
+        Hardware PWM can only be switched on and off from Python, one
+        socket round trip per edge, so a burst is a DMA wave on the same
+        pin instead: the square periods (as many per wave as makes the
+        frequency exact), looped `cycles` times, then chain delays, all
+        in one looped wave_chain.  Timing is µs-exact.  pigpiod runs
+        either hardware PWM or waves, starting one cancels the other, so
+        the hardware PWM is stopped first and the chain replaces any
+        running wave (the sine generator's included).  Returns the
+        Burst.  Raises ValueError if the burst is longer than the
+        period.
+        """
+        self.stop(clear_wipers=False)
+        f = self._frequency
+        cycles = max(1, int(cycles))
+
+        periods = wave_periods(f)
+        if cycles % periods:
+            periods = 1
+        pulses, span_us = _square_pulses(f, periods)
+        on_loops = cycles // periods
+        on_us = on_loops * span_us
+        period_us = int(round(period_s * 1_000_000))
+        if on_us > period_us:
+            raise ValueError(f"{cycles} cycles take {on_us} us, longer than the period")
+
+        # The last pulse is low, so the delays hold the output low
+        self._pi.set_mode(PWM_GPIO, pigpio.OUTPUT)
+        self._pi.wave_add_new()
+        self._pi.wave_add_generic(pulses)
+        wave_id = self._pi.wave_create()
+        if wave_id < 0:
+            raise ValueError(f"wave_create failed (error {wave_id})")
+        self._burst_wave = wave_id
+
+        chain = [255, 0] + chain_loop(wave_id, on_loops) + chain_delay(period_us - on_us)
+        chain += [255, 3]
+        check_chain(chain)
+
+        self._write_amplitude(self._amplitude)
+        err = self._pi.wave_chain(chain)
+        if err < 0:
+            self.stop(clear_wipers=False)
+            raise ValueError(f"wave_chain failed (error {err})")
+
+        self._burst = Burst(cycles, periods * 1_000_000 / span_us, on_us, period_us)
+        if self._debug:
+            print(f"[SquareWave] burst {self._burst} chain={len(chain)}")
+        return self._burst
+
+    def _stop_burst(self):
+        if self._burst_wave is None:
+            return
+        self._pi.wave_tx_stop()
+        self._pi.wave_delete(self._burst_wave)
+        self._pi.write(PWM_GPIO, 0)
+        self._burst_wave = None
+        self._burst = None
+
     def stop(self, clear_wipers=True):
         self._running = False
+        self._stop_burst()
         self._pi.hardware_PWM(PWM_GPIO, 0, 0)
         if clear_wipers:
             self._write_wiper(0)
@@ -113,6 +204,11 @@ class SquareWaveGenerator:
     def last_step(self):
         return self._last_step
 
+    @property
+    def burst(self):
+        """The running Burst, or None."""
+        return self._burst
+
     def test_amplitude_ramp(self, frequency=1000, wait_seconds=4):
         if self._debug:
             print(f"\n[TEST] Starting amplitude ramp at {frequency} Hz")
@@ -146,8 +242,6 @@ class SquareWaveGenerator:
 
 
 if __name__ == "__main__":
-    import pigpio
-
     print("Running square_wave.py standalone test (MCP4131)...")
 
     pi = pigpio.pi()
@@ -13,43 +13,40 @@ Hardware:
 import time
 import pigpio
 
-from ohmmeter import MCP4131_MAX_STEPS, _SETTLE_S
 from callbacks import clear_callbacks, PIN_A, PIN_B, ROTARY_BTN_PIN
 import rotary_encoder
+from acquisition import AcquisitionService
+from sar_engine import (
+    AVG_CONFIDENCE, MCP4131_MAX_STEPS, QUANT_UNCERTAINTY, TRACK_INTERVAL_S,
+    TrackingADC, get_engine,
+)
 
 COMPARATOR1_PIN = 23
 
 
 def _write_dac(pi, spi_handle, step):
     """Scale 5-bit step (0..31) to MCP4131 7-bit register DAC (0..127)."""
-    step = max(0, min(step, MCP4131_MAX_STEPS))
-    dac_code = round(step * 127 / MCP4131_MAX_STEPS)
-    pi.spi_write(spi_handle, [0x00, dac_code])
+    get_engine(pi, spi_handle).write_step(step)
 
 
 def _sar_measure(pi, spi_handle, comp_pin):
     """5-bit SAR: comp == 0 keeps bit, comp == 1 discards."""
-    step = 0
-    
-    for bit_pos in range(4, -1, -1):
-        """The trial is the step value plus the next significant bit."""
-        trial = min(step | (1 << bit_pos), MCP4131_MAX_STEPS)
-        _write_dac(pi, spi_handle, trial)
-        time.sleep(_SETTLE_S)
+    return get_engine(pi, spi_handle).convert(comp_pin)
+
 
-        """The comp_pin read determines keep (0) or delete (1).""" 
-        if pi.read(comp_pin) == 0:
-            step = trial
+def _averaged_measure(pi, spi_handle, comp_pin, n=11,
+                      confidence=AVG_CONFIDENCE, with_count=False):
+    """Return the median step from up to n SAR conversions.
 
-    """Write the final step value to convert to analog.""" 
-    _write_dac(pi, spi_handle, step)
-    return step
+    Exits early once the median is settled (sar_engine.sequential_median);
+    with_count=True returns (step, conversions_used).
+    """
+    return get_engine(pi, spi_handle).averaged(comp_pin, n, confidence, with_count)
 
 
-def _averaged_measure(pi, spi_handle, comp_pin, n=11):
-    """Return the median step from n SAR conversions."""
-    readings = sorted(_sar_measure(pi, spi_handle, comp_pin) for _ in range(n))
-    return readings[n // 2]
+def _fractional_measure(pi, spi_handle, comp_pin, n=11):
+    """Return (fractional step, uncertainty in steps) from n SAR conversions."""
+    return get_engine(pi, spi_handle).fractional(comp_pin, n)
 
 
 # Complete step -> actual voltage calibration (all 32 steps measured)
@@ -122,6 +119,19 @@ def step_to_tolerance(step):
     return (STEP_TO_VOLT[step + 1] - STEP_TO_VOLT[step - 1]) / 4
 
 
+def fractional_step_to_voltage(step):
+    """Voltage for a fractional step, interpolated through STEP_TO_VOLT."""
+    step = max(0.0, min(step, MCP4131_MAX_STEPS))
+    i = min(int(step), MCP4131_MAX_STEPS - 1)
+    frac = step - i
+    return STEP_TO_VOLT[i] + frac * (STEP_TO_VOLT[i + 1] - STEP_TO_VOLT[i])
+
+
+def fractional_step_to_tolerance(step, uncertainty):
+    """Tolerance scaled from the half-step tolerance by the step uncertainty."""
+    return step_to_tolerance(round(step)) * uncertainty / QUANT_UNCERTAINTY
+
+
 def _fmt_v(v):
     return f"{v:+.2f}V"
 
@@ -190,8 +200,15 @@ def run_source_menu(state, pi, lcd):
 
 
 def run_measurement(state, pi, lcd, adc_handle,
-                    source_label="External", interval=0.5):
-    """Live voltage reading with Back/Main on the same screen."""
+                    source_label="External", interval=0.5, tracking=True):
+    """Live voltage reading with Back/Main on the same screen.
+
+    With tracking=True each update is a tracking conversion (TrackingADC)
+    and the screen refreshes every TRACK_INTERVAL_S instead of `interval`.
+    Conversions run on an AcquisitionService thread.  The reading is the
+    fractional step from the spread of recent codes (sub_lsb_estimate),
+    so the tolerance shrinks when input noise dithers the comparator.
+    """
     state['encoder_delta'] = 0
     state['button_pressed'] = False
     state['button_last_tick'] = None
@@ -228,7 +245,23 @@ def run_measurement(state, pi, lcd, adc_handle,
     cb_btn = pi.callback(ROTARY_BTN_PIN, pigpio.FALLING_EDGE, _on_button)
     state['active_callbacks'] = [decoder, cb_btn]
 
-    last_update = 0.0
+    if tracking:
+        tracker = TrackingADC(pi, adc_handle, COMPARATOR1_PIN)
+        interval = min(interval, TRACK_INTERVAL_S)
+
+        def _measure():
+            tracker.read()
+            return tracker.fractional() + (1,)
+    else:
+        def _measure():
+            return _fractional_measure(pi, adc_handle, COMPARATOR1_PIN, n=11) + (11,)
+
+    # Conversions run on the acquisition thread; this loop only draws
+    # the newest reading, so the encoder never waits on the SAR.
+    acq = AcquisitionService(_measure, interval=interval, name="voltmeter")
+    acq.start()
+
+    last_seq = 0
     try:
         while True:
             delta = state.get('encoder_delta', 0)
@@ -241,12 +274,12 @@ def run_measurement(state, pi, lcd, adc_handle,
                 state['button_pressed'] = False
                 return "BACK" if nav_idx == 0 else "MAIN"
 
-            now = time.time()
-            if now - last_update >= interval:
-                last_update = now
-                step = _averaged_measure(pi, adc_handle, COMPARATOR1_PIN, n=11)
-                v = step_to_voltage(step)
-                tol = step_to_tolerance(step)
+            reading = acq.latest()
+            if reading is not None and reading.seq != last_seq:
+                last_seq = reading.seq
+                step, u, used = reading.value
+                v = fractional_step_to_voltage(step)
+                tol = fractional_step_to_tolerance(step, u)
 
                 if v <= V_MIN:
                     lcd.put_line(1, f"{_fmt_v(V_MIN)} (at min)")
@@ -254,9 +287,10 @@ def run_measurement(state, pi, lcd, adc_handle,
                     lcd.put_line(1, f"{_fmt_v(V_MAX)} (at max)")
                 else:
                     lcd.put_line(1, f"{_fmt_v(v)} +/-{tol:.2f}V")
-                print(f"[Voltmeter] step={step}  voltage={v:+.2f} V  comp_now={pi.read(COMPARATOR1_PIN)}")
+                print(f"[Voltmeter] step={step:.2f}+/-{u:.2f}  voltage={v:+.3f} V  conversions={used}")
 
             time.sleep(0.05)
     finally:
+        acq.stop()
         state['button_pressed'] = False
         clear_callbacks(state)
@@ -0,0 +1,94 @@
+"""
+wave_chains.py
+wave_chain helpers shared by Sinewave.py and square_wave.py.
+
+Builds pigpiod wave_chain data (waves looped with counters, µs delays)
+and checks it against pigpiod's limits before it is sent, plus the
+exact-frequency period count both generators use for their waves.
+Plain Python only, so square_wave.py can use it without the sine
+engine.
+
+Usage:
+  chain = [255, 0] + chain_loop(wave_id, 10) + chain_delay(90_000) + [255, 3]
+  check_chain(chain)
+  pi.wave_chain(chain)
+"""
+
+from collections import namedtuple
+from fractions import Fraction
+
+# Exact-frequency mode: a wave spans up to MAX_PERIODS periods so that a
+# fractional-µs period adds up to a whole number of µs.  Every 500 Hz
+# step from 1 to 10 kHz has such a span of at most 20 periods (2 ms).
+MAX_PERIODS = 20
+
+# pigpiod allows about WAVE_CHAIN_MAX chain entries and CHAIN_MAX_LOOPS
+# loop counters, each counting to at most CHAIN_LOOP_MAX.  A wave played
+# once needs no counter.  A chain delay is at most CHAIN_DELAY_MAX µs
+# and holds the pin's last level.
+WAVE_CHAIN_MAX   = 600
+CHAIN_MAX_LOOPS  = 20
+CHAIN_LOOP_MAX   = 65535
+CHAIN_DELAY_MAX  = 65535
+
+# Bursts (start_burst): `cycles` periods, then idle until the next burst
+# period, looped forever by one wave_chain.
+BURST_CYCLES     = 10
+BURST_PERIOD_S   = 0.1
+
+# A running burst as timed by the DMA engine
+Burst = namedtuple("Burst", ["cycles", "frequency", "on_us", "period_us"])
+
+
+def wave_periods(frequency, max_periods=MAX_PERIODS):
+    """ Fewest periods (up to max_periods) whose total length is closest
+        to a whole number of µs, i.e. the smallest frequency error. """
+    period = Fraction(1_000_000) / Fraction(frequency)
+
+    def error(k):
+        span = k * period
+        return abs(span - round(span)) / k
+
+    return min(range(1, max_periods + 1), key=lambda k: (error(k), k))
+
+
+def chain_loop(wave_id, loops):
+    """ Chain entries that play wave_id `loops` times, as loop blocks of
+        at most CHAIN_LOOP_MAX when it is more than once. """
+    if loops == 1:
+        return [wave_id]
+    chain = []
+    while loops > 0:
+        n = min(loops, CHAIN_LOOP_MAX)
+        chain += [wave_id] if n == 1 else [255, 0, wave_id, 255, 1, n & 0xFF, n >> 8]
+        loops -= n
+    return chain
+
+
+def chain_delay(us):
+    """ Chain entries for a delay of `us` µs (the pin keeps its level). """
+    chain = []
+    blocks, rest = divmod(int(us), CHAIN_DELAY_MAX)
+    if blocks > 1:
+        chain += [255, 0, 255, 2, 0xFF, 0xFF, 255, 1, blocks & 0xFF, blocks >> 8]
+    elif blocks == 1:
+        chain += [255, 2, 0xFF, 0xFF]
+    if rest:
+        chain += [255, 2, rest & 0xFF, rest >> 8]
+    return chain
+
+
+def check_chain(chain):
+    """ Raises ValueError if pigpiod would reject the chain's size. """
+    counters, i = 0, 0
+    while i < len(chain):
+        if chain[i] != 255:
+            i += 1
+            continue
+        cmd = chain[i + 1]
+        counters += cmd in (1, 3)
+        i += 4 if cmd in (1, 2) else 2
+    if counters > CHAIN_MAX_LOOPS:
+        raise ValueError(f"chain needs {counters} loop counters, max {CHAIN_MAX_LOOPS}")
+    if len(chain) > WAVE_CHAIN_MAX:
+        raise ValueError(f"chain is {len(chain)} entries, max {WAVE_CHAIN_MAX}")
@@ -0,0 +1,267 @@
+"""
+waveform_capture.py
+Equivalent-time waveform capture through the voltmeter comparator.
+
+A full SAR conversion takes tens of milliseconds, far too slow to sample
+a kHz signal.  Instead the CE1 DAC is used as a moving threshold: at
+each threshold step it is written once and the comparator (GPIO 23)
+edges are timestamped by pigpio for a gate spanning many cycles.  The
+fraction of time the input spends above each threshold is the
+waveform's amplitude distribution, from which Vpp, the DC offset and
+(for a signal with one peak per period, e.g. sine, triangle or square)
+the shape over one period are rebuilt.
+
+The comparator output is 0 while input >= DAC, so "above" time is the
+time the pin spends low.
+
+Usage:
+  cap = WaveformCapture(pi, spi_ce1, progress=lambda done, total: ...)
+  for level in cap.levels_iter():     # streaming, one LevelResult per step
+      ...
+  result = cap.result()               # or: result = cap.capture()
+  print(result.vpp, result.dc_offset, result.frequency)
+
+cap.cancel() (from another thread or the progress callback) stops the
+capture after the current gate; the result covers the levels done so far.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import pigpio
+
+from sar_engine import MCP4131_MAX_STEPS, get_engine
+from voltmeter import COMPARATOR1_PIN, fractional_step_to_voltage
+
+GATE_S          = 0.05      # 50 cycles at 1 kHz, 500 at 10 kHz
+SETTLE_S        = 0.01
+EDGE_HOLDOFF_US = 20        # same chatter rejection as freq_meter_sw
+CALLBACK_LAG_S  = 0.02      # pigpio delivers edge callbacks a little late
+SHAPE_POINTS    = 32
+
+# volts: threshold voltage, above: fraction of time input >= threshold,
+# frequency: from rising crossings in this gate (0.0 if fewer than two)
+LevelResult = namedtuple("LevelResult", ["step", "volts", "above", "frequency"])
+
+
+def threshold_volts(step):
+    """Voltage at which the comparator flips with the DAC at `step`.
+
+    Codes step-1 and step meet there, i.e. half a step below the centre
+    of code `step` in the STEP_TO_VOLT calibration.
+    """
+    return fractional_step_to_voltage(step - 0.5)
+
+
+class CaptureResult:
+    def __init__(self, levels, cancelled=False):
+        self.levels = sorted(levels, key=lambda r: r.volts)
+        self.cancelled = cancelled
+
+    @property
+    def frequency(self):
+        freqs = [r.frequency for r in self.levels if r.frequency > 0]
+        if not freqs:
+            return 0.0
+        freqs.sort()
+        return freqs[len(freqs) // 2]
+
+    def _crossing_levels(self):
+        return [r for r in self.levels if 0.0 < r.above < 1.0]
+
+    @property
+    def v_max(self):
+        """Midway between the highest threshold crossed and the next one up."""
+        above = [r for r in self.levels if r.above > 0.0]
+        if not above:
+            return None
+        top = above[-1]
+        higher = [r for r in self.levels if r.volts > top.volts]
+        return (top.volts + higher[0].volts) / 2 if higher else top.volts
+
+    @property
+    def v_min(self):
+        """Midway between the lowest threshold crossed and the next one down."""
+        below = [r for r in self.levels if r.above < 1.0]
+        if not below:
+            return None
+        bottom = below[0]
+        lower = [r for r in self.levels if r.volts < bottom.volts]
+        return (bottom.volts + lower[-1].volts) / 2 if lower else bottom.volts
+
+    @property
+    def vpp(self):
+        if self.v_max is None or self.v_min is None:
+            return 0.0
+        return max(0.0, self.v_max - self.v_min)
+
+    @property
+    def dc_offset(self):
+        """
+        Mean of the waveform: v_min plus the integral of the fraction of
+        time above each threshold (trapezoids over the threshold voltages).
+        None when the input stays above or below every threshold.
+        """
+        if self.v_min is None or self.v_max is None:
+            return None
+        pts = [(self.v_min, 1.0)]
+        pts += [(r.volts, r.above) for r in self.levels
+                if self.v_min < r.volts < self.v_max]
+        pts.append((self.v_max, 0.0))
+        mean = self.v_min
+        for (v0, a0), (v1, a1) in zip(pts, pts[1:]):
+            mean += (v1 - v0) * (a0 + a1) / 2
+        return mean
+
+    def shape(self, n=SHAPE_POINTS):
+        """
+        One period as n (phase, volts) points, phase in cycles from -0.5
+        to +0.5 with the peak at 0.
+
+        Assumes one rising and one falling crossing per threshold per
+        period, so the time above threshold V is an interval of width
+        above(V) centred on the peak.
+        """
+        if self.v_min is None or self.v_max is None:
+            return []
+        # (half-width in cycles, volts), half-width grows as V falls
+        pts = [(0.0, self.v_max)]
+        pts += [(r.above / 2, r.volts) for r in reversed(self._crossing_levels())]
+        pts.append((0.5, self.v_min))
+
+        out = []
+        for i in range(n):
+            phase = -0.5 + i / n
+            x = abs(phase)
+            for (x0, v0), (x1, v1) in zip(pts, pts[1:]):
+                if x0 <= x <= x1:
+                    v = v0 if x1 == x0 else v0 + (x - x0) * (v1 - v0) / (x1 - x0)
+                    break
+            else:
+                v = self.v_min
+            out.append((phase, v))
+        return out
+
+
+class WaveformCapture:
+    def __init__(self, pi, spi_handle, comp_pin=COMPARATOR1_PIN,
+                 steps=None, gate_s=GATE_S, progress=None):
+        """
+        steps    : DAC threshold steps to visit (default every step 1..31)
+        gate_s   : time spent timing edges at each threshold
+        progress : called as progress(done, total) after each threshold
+        """
+        self.pi = pi
+        self.engine = get_engine(pi, spi_handle)
+        self.comp_pin = comp_pin
+        self.steps = list(range(1, MCP4131_MAX_STEPS + 1)) if steps is None else list(steps)
+        self.gate_s = gate_s
+        self.progress = progress
+        self._cancel = threading.Event()
+        self._levels = []
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def _gate(self, step):
+        """Time comparator edges at one threshold for gate_s."""
+        self.engine.write_step(step)
+        self.engine.settle(SETTLE_S)
+
+        edges = []
+
+        def _on_edge(_gpio, level, tick):
+            edges.append((level, tick))
+
+        cb = self.pi.callback(self.comp_pin, pigpio.EITHER_EDGE, _on_edge)
+        try:
+            start_level = self.pi.read(self.comp_pin)
+            start = self.pi.get_current_tick()
+            time.sleep(self.gate_s)
+            end = self.pi.get_current_tick()
+            # Let edges up to `end` arrive through the notification pipe
+            time.sleep(CALLBACK_LAG_S)
+        finally:
+            cb.cancel()
+
+        # Integrate the low (input above threshold) time between start and end
+        total = pigpio.tickDiff(start, end)
+        if total <= 0:
+            return LevelResult(step, threshold_volts(step), float(start_level == 0), 0.0)
+
+        level, t_prev, low_us = start_level, 0, 0
+        rises = []
+        last_high = None
+        for new_level, tick in edges:
+            t = pigpio.tickDiff(start, tick)
+            if t < 0 or t > total:
+                continue
+            if level == 0:
+                low_us += t - t_prev
+            if new_level == 1:
+                last_high = t
+            elif last_high is not None and t - last_high >= EDGE_HOLDOFF_US:
+                rises.append(t)
+            level, t_prev = new_level, t
+        if level == 0:
+            low_us += total - t_prev
+
+        freq = 0.0
+        if len(rises) >= 2:
+            freq = (len(rises) - 1) * 1_000_000 / (rises[-1] - rises[0])
+        return LevelResult(step, threshold_volts(step), low_us / total, freq)
+
+    def levels_iter(self):
+        """Visit each threshold, yielding its LevelResult as it completes."""
+        self._levels = []
+        total = len(self.steps)
+        for i, step in enumerate(self.steps):
+            if self._cancel.is_set():
+                return
+            level = self._gate(step)
+            self._levels.append(level)
+            if self.progress is not None:
+                self.progress(i + 1, total)
+            yield level
+
+    def result(self):
+        return CaptureResult(self._levels, self._cancel.is_set())
+
+    def capture(self):
+        for _ in self.levels_iter():
+            pass
+        return self.result()
+
+
+if __name__ == "__main__":
+    pi = pigpio.pi()
+    if not pi.connected:
+        raise SystemExit("pigpiod not running - run 'sudo pigpiod' first.")
+
+    pi.set_mode(COMPARATOR1_PIN, pigpio.INPUT)
+    pi.set_pull_up_down(COMPARATOR1_PIN, pigpio.PUD_OFF)
+
+    spi = pi.spi_open(1, 50_000, 0)
+
+    def _progress(done, total):
+        print(f"\r  threshold {done}/{total}", end="", flush=True)
+
+    try:
+        res = WaveformCapture(pi, spi, progress=_progress).capture()
+        print()
+        print(f"Frequency : {res.frequency:.1f} Hz")
+        print(f"Vpp       : {res.vpp:.2f} V")
+        if res.dc_offset is None:
+            print("DC offset : out of threshold range")
+        else:
+            print(f"DC offset : {res.dc_offset:+.2f} V")
+        for phase, v in res.shape(16):
+            print(f"  {phase:+.3f}  {v:+.2f} V  " + "#" * int((v + 5) * 4))
+    finally:
+        pi.spi_close(spi)
+        pi.stop()